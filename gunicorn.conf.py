@@ -0,0 +1,10 @@
+# gunicorn main.wsgi -c gunicorn.conf.py
+# The application is loaded in the master, warmed by main.wsgi.preload,
+# then forked: workers start warm and share the preloaded memory.
+preload_app = True
+
+
+def when_ready(server):
+    from main.wsgi import preload
+
+    preload()
@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
 
+# Serves the server-sent events of GET /api/pokemon/events/ (see
+# pokemon.events), which keep their connection open: run it with an
+# ASGI server, e.g. `uvicorn main.asgi:application`.
 application = get_asgi_application()
@@ -0,0 +1,82 @@
+"""Django cache backends counting hits, misses and evictions.
+
+Counters are shared by every thread of a process using the same
+location, and are approximate: they are not protected by a lock."""
+from collections import Counter
+
+from django.core.cache.backends import filebased, locmem, redis
+
+
+_stats: dict[str, Counter] = {}
+_MISSING = object()
+
+
+class CacheStatsMixin:
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self._stats = _stats.setdefault(
+            f"{type(self).__name__}:{location}", Counter()
+        )
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, default=_MISSING, version=version)
+        if value is _MISSING:
+            self._stats["misses"] += 1
+            return default
+        self._stats["hits"] += 1
+        return value
+
+    def stats(self):
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "hits": self._stats["hits"],
+            "misses": self._stats["misses"],
+            "evictions": self._stats["evictions"],
+            "hit_rate": self._stats["hits"] / lookups if lookups else None,
+        }
+
+    def reset_stats(self):
+        self._stats.clear()
+
+
+class LocMemCache(CacheStatsMixin, locmem.LocMemCache):
+    def _cull(self):
+        size = len(self._cache)
+        super()._cull()
+        self._stats["evictions"] += size - len(self._cache)
+
+
+class FileBasedCache(CacheStatsMixin, filebased.FileBasedCache):
+    _culling = False
+
+    def _cull(self):
+        self._culling = True
+        try:
+            super()._cull()
+        finally:
+            self._culling = False
+
+    def _delete(self, fname):
+        deleted = super()._delete(fname)
+        if deleted and self._culling:
+            self._stats["evictions"] += 1
+        return deleted
+
+
+class RedisCache(CacheStatsMixin, redis.RedisCache):
+    """Works with any server speaking the Redis protocol (Redis, Valkey,
+    KeyDB...). Evictions are the ones reported by the server."""
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version=version)
+        self._stats["hits"] += len(found)
+        self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def stats(self):
+        info = self._cache.get_client().info(section="stats")
+        return {
+            **super().stats(),
+            "evictions": info.get("evicted_keys", 0),
+        }
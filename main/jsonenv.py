@@ -1,5 +1,6 @@
 import json
 import os
+from functools import cache
 
 
 def get_env_file():
@@ -10,6 +11,7 @@ def get_env_file():
     return file_
 
 
+@cache
 def get_credentials():
     env_file = get_env_file()
     env_file_dir = os.path.dirname(os.path.dirname((os.path.abspath(__file__))))
@@ -19,4 +21,18 @@ def get_credentials():
     return creds
 
 
-env: dict = get_credentials()
+class JsonEnv:
+    """Read-only mapping over the env file, read and parsed on first
+    access rather than when the module is imported."""
+
+    def get(self, key, default=None):
+        return get_credentials().get(key, default)
+
+    def __getitem__(self, key):
+        return get_credentials()[key]
+
+    def __contains__(self, key):
+        return key in get_credentials()
+
+
+env = JsonEnv()
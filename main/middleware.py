@@ -0,0 +1,160 @@
+import gzip
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+def _gzip(content):
+    return gzip.compress(content, compresslevel=6, mtime=0)
+
+
+def _zstd(content):
+    return zstandard.ZstdCompressor(level=10).compress(content)
+
+
+def _brotli(content):
+    return brotli.compress(content, quality=5)
+
+
+# In order of preference.
+COMPRESSORS = {
+    **({"zstd": _zstd} if zstandard is not None else {}),
+    **({"br": _brotli} if brotli is not None else {}),
+    "gzip": _gzip,
+}
+
+
+def accepted_encodings(header):
+    encodings = set()
+    for part in header.lower().split(","):
+        encoding, _, params = part.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(encoding.strip())
+    return encodings
+
+
+# Responses of the API, which carry no secret echoed next to what a
+# client sends: they are compressed with any of COMPRESSORS. Only those
+# marked with share_compressed_body have their compressed bodies shared
+# through the cache.
+API_CONTENT_TYPES = {
+    "application/json", "application/x-ndjson", "application/msgpack"
+}
+
+
+def choose_encoding(header, supported=COMPRESSORS):
+    """First of `supported` (COMPRESSORS: zstd, br, gzip) accepted by the
+    client."""
+    encodings = accepted_encodings(header)
+    for encoding in supported:
+        if encoding in encodings or "*" in encodings:
+            return encoding
+    return None
+
+
+def share_compressed_body(response):
+    """Mark `response` as a body served as is to many clients (the cached
+    Pokémon lists, shared by the users of a same set of types): its
+    compressed body is kept in the cache for the next ones. Per user
+    bodies (tokens, profiles, deltas) would only churn the cache, and
+    put their secrets in it."""
+    response.share_compressed_body = True
+    return response
+
+
+def compress_cached(content, encoding):
+    """Compress `content`, reusing a previous result for the same bytes.
+
+    Cached list bodies are served many times with the exact same content:
+    the cache is keyed by a digest of the body, which is much cheaper to
+    compute than compressing it again."""
+    digest = blake2b(content, digest_size=16).hexdigest()
+    key = f"compressed:{encoding}:{digest}"
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = COMPRESSORS[encoding](content)
+        cache.set(key, compressed, timeout=settings.COMPRESSION_CACHE_TIMEOUT)
+    return compressed
+
+
+class CompressionMiddleware:
+    """Like django.middleware.gzip.GZipMiddleware, with zstd and brotli
+    when available and a configurable minimal size, for the
+    API_CONTENT_TYPES. Compressed bodies are shared through the cache for
+    the responses marked with share_compressed_body.
+
+    Other responses (admin pages, with CSRF tokens) are gzipped as
+    GZipMiddleware does, with up to max_random_bytes random bytes in the
+    gzip header against BREACH attacks. Streams are gzipped, the only
+    encoding compress_sequence knows."""
+    max_random_bytes = 100
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.has_header("Content-Encoding"):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        content_type = response.get("Content-Type", "").partition(";")[0]
+        api = content_type.strip().lower() in API_CONTENT_TYPES
+        supported = COMPRESSORS if api and not response.streaming else ["gzip"]
+        encoding = choose_encoding(
+            request.META.get("HTTP_ACCEPT_ENCODING", ""), supported=supported
+        )
+        if encoding is None:
+            return response
+        max_random_bytes = None if api else self.max_random_bytes
+
+        if response.streaming:
+            if response.is_async:
+                return response
+            response.streaming_content = compress_sequence(
+                response.streaming_content,
+                max_random_bytes=max_random_bytes
+            )
+            del response.headers["Content-Length"]
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            if api and getattr(response, "share_compressed_body", False):
+                compressed = compress_cached(
+                    content=response.content, encoding=encoding
+                )
+            elif api:
+                compressed = COMPRESSORS[encoding](response.content)
+            else:
+                compressed = compress_string(
+                    response.content, max_random_bytes=max_random_bytes
+                )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
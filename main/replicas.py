@@ -0,0 +1,92 @@
+"""Reads of the Pokémon endpoints on the READ_REPLICA database.
+
+ReplicaReadsMiddleware marks the requests of views with
+`replica_reads = True`, and ReplicaRouter sends their reads to the
+replica: the reads of the pokemon app only, authentication and tokens
+are read on the primary, so that a token created at login is known at
+once.
+
+A replica lags behind the primary. After a user's types change,
+`pin_to_primary` records it in the cache for READ_YOUR_WRITES_WINDOW
+seconds, during which that user's reads stay on the primary: a user
+never reads a list older than their own writes. The cache must be
+shared by the processes (file or redis backend) for the pin to be seen
+by all of them.
+
+Data cached per catalog version is read on the primary (`using`): read
+from a lagging replica, it would stay stale for the whole version."""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+PRIMARY_APPS = {
+    "auth", "authtoken", "contenttypes", "registration", "sessions"
+}
+
+_reads = ContextVar("replica_reads", default=None)
+
+
+def pin_key(user_id):
+    return f"db:primary-pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    if settings.READ_REPLICA is not None:
+        cache.set(
+            pin_key(user_id=user_id), True,
+            timeout=settings.READ_YOUR_WRITES_WINDOW
+        )
+
+
+class ReplicaReads:
+    """Database of the reads of a request, decided once its user is
+    authenticated."""
+
+    def __init__(self, request):
+        self.request = request
+        self.alias = None
+
+    def db_for_read(self):
+        if self.alias is None:
+            # Set by the authentication of Django or REST framework.
+            user = getattr(self.request, "user", None)
+            if user is None or not user.is_authenticated:
+                return None
+            pinned = cache.get(pin_key(user_id=user.pk))
+            self.alias = "default" if pinned else settings.READ_REPLICA
+        return self.alias
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None or model._meta.app_label in PRIMARY_APPS:
+            return None
+        return reads.db_for_read()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaReadsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _reads.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _reads.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        if settings.READ_REPLICA is not None and getattr(
+            view_class, "replica_reads", False
+        ):
+            _reads.set(ReplicaReads(request=request))
@@ -53,12 +53,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'main.replicas.ReplicaReadsMiddleware',
+    'pokemon.cache.CatalogVersionMiddleware',
 ]
 
 ROOT_URLCONF = 'main.urls'
@@ -92,6 +95,104 @@ DATABASES = {
     }
 }
 
+# Read replica of the Pokémon endpoints (main.replicas), configured in
+# .env.json: "database_replica": {"ENGINE": ..., "NAME": ...}. A user's
+# reads stay on the primary READ_YOUR_WRITES_WINDOW seconds after they
+# changed their types.
+if env.get("database_replica"):
+    DATABASES['replica'] = env["database_replica"]
+
+READ_REPLICA = 'replica' if 'replica' in DATABASES else None
+
+READ_YOUR_WRITES_WINDOW = env.get("read_your_writes_window", 10)
+
+DATABASE_ROUTERS = ['main.replicas.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# .env.json: "cache": {"backend": "locmem" | "file" | "redis",
+#                      "location": ..., "timeout": ..., "max_entries": ...}
+# locmem is per process: use file or redis when several processes
+# (workers, sync commands) must share the cache. The catalog version the
+# entries are keyed by is in the database (pokemon.cache.catalog_version).
+
+CACHE_ENV = env.get("cache", {})
+
+CACHE_BACKEND = CACHE_ENV.get("backend", "locmem")
+
+CACHES = {
+    'default': {
+        'BACKEND': {
+            'locmem': 'main.cache.LocMemCache',
+            'file': 'main.cache.FileBasedCache',
+            'redis': 'main.cache.RedisCache',
+        }[CACHE_BACKEND],
+        'LOCATION': CACHE_ENV.get("location", {
+            'locmem': 'selfee',
+            'file': str(BASE_DIR / 'cache'),
+            'redis': 'redis://127.0.0.1:6379/0',
+        }[CACHE_BACKEND]),
+        'TIMEOUT': CACHE_ENV.get("timeout", 300),
+        'OPTIONS': {
+            'MAX_ENTRIES': CACHE_ENV.get("max_entries", 10_000),
+        } if CACHE_BACKEND != 'redis' else {},
+    }
+}
+
+POKEMON_CATALOG_CACHE_TIMEOUT = env.get("pokemon_catalog_cache_timeout", 86400)
+
+POKEMON_LIST_CACHE_TIMEOUT = env.get("pokemon_list_cache_timeout", 300)
+
+POKEMON_LIST_STALE_TIMEOUT = env.get("pokemon_list_stale_timeout", 60)
+
+# Pub/sub backend of the change notifications (pokemon.events), and
+# seconds between two keep-alive comments of an event stream.
+EVENTS_BROKER = env.get("events_broker", "pokemon.events.InProcessBroker")
+
+EVENTS_HEARTBEAT = env.get("events_heartbeat", 15)
+
+# Entries of the change log of GET /api/pokemon/?since= (pokemon.changes).
+POKEMON_CHANGE_LOG_SIZE = env.get("pokemon_change_log_size", 10_000)
+
+# Published catalog generations kept by pokemon.generations.
+CATALOG_GENERATIONS_KEPT = env.get("catalog_generations_kept", 2)
+
+# On-disk cache of the PokeAPI responses read by the sync commands
+# (pokemon.pokeapi), disabled when the path is null.
+POKEAPI_CACHE_PATH = env.get(
+    "pokeapi_cache_path", BASE_DIR / 'cache' / 'pokeapi.sqlite3'
+)
+POKEAPI_CACHE_PATH = Path(POKEAPI_CACHE_PATH) if POKEAPI_CACHE_PATH else None
+
+POKEAPI_CACHE_TTL = env.get("pokeapi_cache_ttl", 12 * 3600)
+
+POKEAPI_CACHE_MAX_SIZE = env.get("pokeapi_cache_max_size", 256 * 1024 * 1024)
+
+# Write-behind of the users' types (pokemon.writebehind): changes are
+# answered from memory and written every ..._DELAY seconds, by batches.
+# Durability "memory" loses the changes not written yet if the process
+# dies, "journal" appends them to ..._JOURNAL first.
+USER_TYPE_WRITE_BEHIND = env.get("user_type_write_behind", False)
+
+USER_TYPE_WRITE_BEHIND_DELAY = env.get("user_type_write_behind_delay", 0.5)
+
+USER_TYPE_WRITE_BEHIND_BATCH_SIZE = env.get(
+    "user_type_write_behind_batch_size", 100
+)
+
+USER_TYPE_WRITE_BEHIND_DURABILITY = env.get(
+    "user_type_write_behind_durability", "journal"
+)
+
+USER_TYPE_WRITE_BEHIND_JOURNAL = Path(env.get(
+    "user_type_write_behind_journal",
+    BASE_DIR / 'journal' / 'user_types.sqlite3'
+))
+
+# Lock and checkpoint of the sync_all pipeline.
+SYNC_STATE_DIR = Path(env.get("sync_state_dir", BASE_DIR / 'sync'))
+
 
 # Registration
 
@@ -140,9 +241,41 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Compression
+# Responses smaller than COMPRESSION_MIN_SIZE bytes are sent as is,
+# compressed bodies are kept COMPRESSION_CACHE_TIMEOUT seconds in cache.
+
+COMPRESSION_MIN_SIZE = env.get("compression_min_size", 1024)
+
+COMPRESSION_CACHE_TIMEOUT = env.get("compression_cache_timeout", 300)
+
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'pokemon.throttling.UserThrottle',
+    ],
+    # Token buckets (pokemon.throttling): "600/min" allows bursts of 600
+    # requests, refilled at 10 per second.
+    'DEFAULT_THROTTLE_RATES': {
+        'read': '600/min',
+        'read_global': '30000/min',
+        'write': '60/min',
+        'write_global': '3000/min',
+        'login': '10/min',
+        'login_global': '600/min',
+        **env.get("throttle_rates", {}),
+    },
 }
+
+# Store of the throttles' token buckets: pokemon.throttling.InMemoryBucketStore
+# (per process) or pokemon.throttling.RedisBucketStore (shared), and the
+# arguments of its constructor ({"url": "redis://..."} for Redis).
+THROTTLE_STORE = env.get(
+    "throttle_store", "pokemon.throttling.InMemoryBucketStore"
+)
+
+THROTTLE_STORE_OPTIONS = env.get("throttle_store_options", {})
@@ -0,0 +1,39 @@
+"""
+API only settings: DJANGO_SETTINGS_MODULE=main.settings_api
+
+The API only authenticates with tokens: admin, sessions, messages and
+static files are neither loaded at startup nor run on each request.
+"""
+from main.settings import *  # noqa: F401, F403
+from main.settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+
+UNUSED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+]
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in UNUSED_APPS]
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE if middleware not in [
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ]
+]
+
+ROOT_URLCONF = 'main.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+}
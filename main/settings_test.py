@@ -0,0 +1,24 @@
+"""
+Test settings: the default of ./manage.py test
+
+The settings of main.settings, with a read replica (main.replicas) for
+ReplicaRoutingTests. The primary and the replica are two SQLite files,
+created and migrated by the test runner. READ_REPLICA stays unset, the
+tests of the replica turn it on.
+"""
+from main.settings import *  # noqa: F401, F403
+from main.settings import BASE_DIR, DATABASES
+
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    'replica': {
+        **DATABASES['default'],
+        'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+    },
+}
+
+READ_REPLICA = None
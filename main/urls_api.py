@@ -0,0 +1,10 @@
+"""
+URL configuration of the API only settings (main.settings_api).
+"""
+from django.urls import include, path
+
+
+urlpatterns = [
+    path("api/", include("registration.api_urls")),
+    path("api/", include("pokemon.api_urls")),
+]
@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 """
 
+import gc
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,28 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
 
 application = get_wsgi_application()
+
+
+def preload():
+    """Warm the process before workers are forked from it (see
+    gunicorn.conf.py): the URL resolvers, with the modules of the views
+    they import, and the Pokémon catalog are built once, then frozen out
+    of the garbage collector so that workers share their memory pages
+    copy-on-write instead of each building, then touching, its own copy.
+
+    Serializer fields are not prebuilt: they are cached per serializer
+    instance, and every request makes its own instances."""
+    from django.db import connections
+    from django.urls import get_resolver
+
+    from pokemon.cache import catalog_version
+    from pokemon.catalog import get_catalog
+
+    get_resolver()._populate()
+    get_catalog(version=catalog_version())
+
+    # Connections must not be shared by the forked workers.
+    connections.close_all()
+
+    gc.collect()
+    gc.freeze()
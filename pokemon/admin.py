@@ -0,0 +1,119 @@
+"""Admin of the Pokémon tables, sized for their full contents.
+
+Changelists run a fixed number of queries whatever the page: related
+objects are joined (list_select_related), the total count is not
+computed next to the filtered one (show_full_result_count), foreign keys
+are picked with autocompletion instead of <select>s listing every row,
+and both searches and default orderings use indexes."""
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+
+from pokemon.cache import type_ids_by_name
+from pokemon.models import Pokemon, PokemonType, TypeGroup, UserType
+from pokemon.typemasks import type_ids
+
+
+def pokemon_search(queryset, search_term, field=None):
+    """`queryset` filtered on the Pokémon number `search_term`, or on the
+    names starting with it, both through indexes (see
+    PokemonQuerySet.name_startswith). `field` is the foreign key to the
+    Pokémon, None for a queryset of Pokémon."""
+    prefix = "" if field is None else f"{field}__"
+    if search_term.isdecimal():
+        return queryset.filter(**{f"{prefix}number": int(search_term)})
+    pokemons = Pokemon.objects.name_startswith(prefix=search_term)
+    if field is None:
+        return queryset.filter(pk__in=pokemons.values("pk"))
+    return queryset.filter(**{f"{field}__in": pokemons})
+
+
+class PokemonTypeInline(admin.TabularInline):
+    model = PokemonType
+    autocomplete_fields = ["type_group"]
+    extra = 0
+
+
+@admin.register(Pokemon)
+class PokemonAdmin(admin.ModelAdmin):
+    list_display = ["number", "name", "types"]
+    list_display_links = ["number", "name"]
+    ordering = ["number"]
+    search_fields = ["name"]
+    search_help_text = "Number, or beginning of the name."
+    readonly_fields = ["type_mask"]
+    inlines = [PokemonTypeInline]
+    show_full_result_count = False
+    list_per_page = 100
+
+    @admin.display(description="types")
+    def types(self, pokemon):
+        """From type_mask: no query per row."""
+        names = {
+            type_id: name for name, type_id in type_ids_by_name().items()
+        }
+        return ", ".join(
+            names.get(type_id, str(type_id))
+            for type_id in type_ids(mask=pokemon.type_mask)
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return pokemon_search(
+            queryset=queryset, search_term=search_term
+        ), False
+
+
+@admin.register(TypeGroup)
+class TypeGroupAdmin(admin.ModelAdmin):
+    list_display = ["name"]
+    ordering = ["name"]
+    search_fields = ["name"]
+
+
+@admin.register(PokemonType)
+class PokemonTypeAdmin(admin.ModelAdmin):
+    list_display = ["pokemon", "type_group"]
+    list_select_related = ["pokemon", "type_group"]
+    list_filter = ["type_group"]
+    autocomplete_fields = ["pokemon", "type_group"]
+    # Covered by the index of the unique constraint.
+    ordering = ["pokemon", "type_group"]
+    search_fields = ["pokemon__name"]
+    search_help_text = "Pokémon number, or beginning of its name."
+    show_full_result_count = False
+    list_per_page = 100
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return pokemon_search(
+            queryset=queryset, search_term=search_term, field="pokemon"
+        ), False
+
+
+@admin.register(UserType)
+class UserTypeAdmin(admin.ModelAdmin):
+    list_display = ["user", "type_group"]
+    list_select_related = ["user", "type_group"]
+    list_filter = ["type_group"]
+    autocomplete_fields = ["user", "type_group"]
+    # Covered by the index of the unique constraint.
+    ordering = ["user", "type_group"]
+    search_fields = ["user__username"]
+    search_help_text = "Beginning of the username."
+    show_full_result_count = False
+    list_per_page = 100
+
+    def get_search_results(self, request, queryset, search_term):
+        """Username prefix, written as a range on the unique username so
+        that it uses its index."""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(user__in=get_user_model().objects.filter(
+            username__gte=search_term,
+            username__lt=search_term + "\U0010ffff"
+        )), False
@@ -0,0 +1,121 @@
+"""Statistics of the users' types over the Pokémon they see, behind
+GET /api/pokemon/analytics/.
+
+They are computed with numpy (optional dependency) from a Pokémon × type
+incidence matrix, built with a single query on Pokemon (joined to their
+types) the first time a catalog version needs it, and kept by the
+process like the catalog: a request only slices the columns of the
+user's types."""
+from threading import Lock
+
+from pokemon.models import Pokemon
+
+
+def load_numpy():
+    """numpy (optional dependency), or None when it is not installed.
+    Imported on the first analytics request rather than with the views:
+    startups and the other requests do not pay for it."""
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    return numpy
+
+
+class Incidence:
+    """`matrix[row, column]` is 1 when the Pokémon `numbers[row]` has the
+    type `type_ids[column]`. `rows` are (number, type_group_id) pairs,
+    with a type_group_id of None for a Pokémon without types: it still
+    counts in the catalog."""
+    __slots__ = ("version", "numbers", "type_ids", "columns", "matrix")
+
+    def __init__(self, version, rows):
+        numpy = load_numpy()
+        numbers, type_ids = set(), set()
+        rows = list(rows)
+        for number, type_id in rows:
+            numbers.add(number)
+            if type_id is not None:
+                type_ids.add(type_id)
+        rows = [(number, type_id) for number, type_id in rows
+                if type_id is not None]
+        self.version = version
+        self.numbers = sorted(numbers)
+        self.type_ids = sorted(type_ids)
+        self.columns = {
+            type_id: column for column, type_id in enumerate(self.type_ids)
+        }
+        row_of = {number: row for row, number in enumerate(self.numbers)}
+        self.matrix = numpy.zeros(
+            (len(self.numbers), len(self.type_ids)), dtype=numpy.int32
+        )
+        if rows:
+            pairs = numpy.array(
+                [(row_of[number], self.columns[type_id])
+                 for number, type_id in rows]
+            )
+            self.matrix[pairs[:, 0], pairs[:, 1]] = 1
+
+    def statistics(self, user_type_names):
+        """Counts of the Pokémon visible with the types of
+        `user_type_names` ({type_group_id: name}), sorted by name."""
+        numpy = load_numpy()
+        type_ids = sorted(
+            (
+                type_id for type_id in user_type_names
+                if type_id in self.columns
+            ),
+            key=user_type_names.get
+        )
+        types = self.matrix[:, [self.columns[type_id] for type_id in type_ids]]
+        types_per_pokemon = types.sum(axis=1)
+        visible = types_per_pokemon > 0
+        visible_count = int(visible.sum())
+        names = [user_type_names[type_id] for type_id in type_ids]
+        return {
+            "types": names,
+            "counts": dict(zip(names, types.sum(axis=0).tolist())),
+            # Pokémon having both types of each pair, the diagonal being
+            # the counts.
+            "overlap": (types.T @ types).tolist(),
+            "coverage": {
+                "visible": visible_count,
+                "total": len(self.numbers),
+                "ratio": (
+                    visible_count / len(self.numbers) if self.numbers else 0.0
+                ),
+                # Pokémon seen through this type only.
+                "exclusive": dict(zip(
+                    names,
+                    types[types_per_pokemon == 1].sum(axis=0).tolist()
+                )),
+                # Pokémon having 1, 2... of the types.
+                "by_type_count": numpy.bincount(
+                    types_per_pokemon[visible], minlength=len(names) + 1
+                )[1:].tolist(),
+            },
+        }
+
+
+_incidence = None
+_incidence_lock = Lock()
+
+
+def get_incidence(version):
+    """The process wide incidence matrix of the catalog `version`."""
+    global _incidence
+
+    incidence = _incidence
+    if incidence is not None and incidence.version == version:
+        return incidence
+
+    with _incidence_lock:
+        if _incidence is None or _incidence.version != version:
+            # On the primary: see main.replicas.
+            _incidence = Incidence(
+                version=version,
+                rows=Pokemon.objects.using("default").values_list(
+                    "number", "pokemontype__type_group_id"
+                )
+            )
+        return _incidence
@@ -1,10 +1,14 @@
 from django.urls import path
 
 from pokemon.api_views import (
+    CacheStatsAPIView,
+    PokemonOfUserTypeBulkRetrieveAPIView,
     PokemonOfUserTypeListAPIView,
     PokemonOfUserTypeRetrieveAPIView,
+    PokemonTypeAnalyticsAPIView,
     UserTypeCreateAPIView,
-    UserTypeDestroyAPIView
+    UserTypeDestroyAPIView,
+    pokemon_events
 )
 
 
@@ -24,9 +28,29 @@ urlpatterns = [
         route="pokemon/",
         view=PokemonOfUserTypeListAPIView.as_view(),
         name="of-user-type-list"),
+    path(
+        route="pokemon/bulk/",
+        view=PokemonOfUserTypeBulkRetrieveAPIView.as_view(),
+        name="of-user-type-bulk-retrieve"
+    ),
+    path(
+        route="pokemon/analytics/",
+        view=PokemonTypeAnalyticsAPIView.as_view(),
+        name="type-analytics"
+    ),
+    path(
+        route="pokemon/events/",
+        view=pokemon_events,
+        name="events"
+    ),
     path(
         route="pokemon/<str:identifier>/",
         view=PokemonOfUserTypeRetrieveAPIView.as_view(),
         name="of-user-type-retrieve"
+    ),
+    path(
+        route="cache/stats/",
+        view=CacheStatsAPIView.as_view(),
+        name="cache-stats"
     )
 ]
@@ -1,17 +1,48 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
+from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import permission_classes
+from rest_framework.exceptions import (
+    AuthenticationFailed, NotAcceptable, NotAuthenticated)
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import (
-    CreateAPIView, DestroyAPIView, ListAPIView, RetrieveAPIView)
-from rest_framework.permissions import IsAuthenticated
+    CreateAPIView, DestroyAPIView, GenericAPIView,
+    ListAPIView, RetrieveAPIView
+)
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import (
     HTTP_200_OK, HTTP_201_CREATED,
-    HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST
+    HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST, HTTP_501_NOT_IMPLEMENTED
 )
+from rest_framework.views import APIView
 
-from pokemon.models import Pokemon, PokemonType, TypeGroup
+from main.middleware import share_compressed_body
+from pokemon.analytics import get_incidence, load_numpy
+from pokemon.cache import (
+    catalog_version, pokemon_list, pokemon_list_stats,
+    pokemon_numbers_by_name, type_ids_by_name, user_type_context
+)
+from pokemon.catalog import get_catalog
+from pokemon.changes import current_version, pokemon_delta
+from pokemon.events import (
+    CATALOG_CHANNEL, broker, event_stream, notify_user_types, user_channel)
+from pokemon.filters import PokemonFilterBackend
+from pokemon.models import Pokemon, PokemonType, TypeGroup, UserType
+from pokemon.renderers import POKEMON_RENDERER_CLASSES, to_columnar
 from pokemon.serializers import (
-    PokemonWithTypesSerialier, UserTypeOutputSerializer)
+    PokemonBulkRetrieveInputSerializer,
+    PokemonWithTypesSerialier,
+    UserTypeOutputSerializer
+)
+from pokemon.streaming import STREAM_FORMATS, streaming_response
+from pokemon.writebehind import (
+    has_pending_user_types, user_type_write_behind)
 
 
 @permission_classes(permission_classes=[IsAuthenticated])
@@ -45,23 +76,44 @@ class UserTypeCreateAPIView(CreateAPIView):
 
         401 Unauthorized:
             Missing or invalid authentication token.
+
+        429 Too Many Requests: {
+            "detail": "Request was throttled. Expected available in 2 seconds."
+        } Too many requests of the user, or of all users, recently.
     """
+    throttle_scope = "write"
+
     def create(self, request, *args, **kwargs):
         type_name = kwargs.get("type_name", "").lower()
 
-        try:
-            type_group = TypeGroup.objects.get(name=type_name)
-        except TypeGroup.DoesNotExist:
+        type_group_id = type_ids_by_name().get(type_name)
+        if type_group_id is None:
             return Response(
                 data={"error": f"Type {type_name!r} invalid"},
                 status=HTTP_400_BAD_REQUEST
             )
 
-        user_type, created = type_group.usertype_set.get_or_create(
-            user=request.user
-        )
+        type_group = TypeGroup(id=type_group_id, name=type_name)
+        if settings.USER_TYPE_WRITE_BEHIND:
+            created = type_group_id not in user_type_context(
+                user=request.user
+            )["user_type_names"]
+            if created:
+                user_type_write_behind().set(
+                    user_id=request.user.id,
+                    type_group_id=type_group_id,
+                    name=type_name
+                )
+            user_type = UserType(user=request.user, type_group=type_group)
+        else:
+            user_type, created = UserType.objects.get_or_create(
+                user=request.user, type_group=type_group
+            )
 
         if created:
+            notify_user_types(
+                user=request.user, type_group_id=type_group_id, added=True
+            )
             status = HTTP_201_CREATED
         else:
             status = HTTP_304_NOT_MODIFIED
@@ -91,27 +143,81 @@ class UserTypeDestroyAPIView(DestroyAPIView):
 
         401 Unauthorized:
             Missing or invalid authentication token.
+
+        429 Too Many Requests: {
+            "detail": "Request was throttled. Expected available in 2 seconds."
+        } Too many requests of the user, or of all users, recently.
     """
+    throttle_scope = "write"
+
     def get_object(self):
         return get_object_or_404(
             klass=self.request.user.usertype_set,
             type_group__name=self.kwargs["type_name"].lower())
 
     def delete(self, request, *args, **kwargs):
-        type_group  = self.get_object()
-        type_name = type_group.type_group.name
-        self.perform_destroy(instance=type_group)
+        if settings.USER_TYPE_WRITE_BEHIND:
+            type_name = self.kwargs["type_name"].lower()
+            type_group_id = type_ids_by_name().get(type_name)
+            if type_group_id not in user_type_context(
+                user=request.user
+            )["user_type_names"]:
+                raise Http404
+            user_type_write_behind().set(
+                user_id=request.user.id, type_group_id=type_group_id,
+                name=None
+            )
+        else:
+            type_group  = self.get_object()
+            type_name = type_group.type_group.name
+            type_group_id = type_group.type_group_id
+            self.perform_destroy(instance=type_group)
+        notify_user_types(
+            user=request.user, type_group_id=type_group_id, added=False
+        )
         return Response(data={"removed": type_name}, status=HTTP_200_OK)
 
 
+class UserTypeNamesContextMixin:
+    """Give PokemonWithTypesSerialier the user's types, so that it can
+    filter each Pokémon's types from its type_mask."""
+    @cached_property
+    def user_type_context(self):
+        return user_type_context(user=self.request.user)
+
+    def get_serializer_context(self):
+        return {
+            **super().get_serializer_context(),
+            **self.user_type_context
+        }
+
+
 @permission_classes(permission_classes=[IsAuthenticated])
-class PokemonOfUserTypeListAPIView(ListAPIView):
+class PokemonOfUserTypeListAPIView(UserTypeNamesContextMixin, ListAPIView):
     """
     Authorization: Token <your_token_here>
 
     Endpoint: GET /api/pokemon/
 
-    Query Parameters: None
+    Query Parameters:
+        name (string, optional): Name prefix (case-insensitive).
+        number_min, number_max (int, optional): Number range, inclusive.
+        types (string, optional): Comma separated type names, only the
+        Pokémon of these types (among the user's types) are listed.
+        ordering (string, optional): number, -number, name or -name.
+        stream (bool, optional): When "true", the list is serialized and
+        sent chunk by chunk instead of being rendered in one block, in
+        the json or ndjson format, not with layout=columnar.
+        layout (string, optional): "columnar" returns parallel
+        "numbers"/"names"/"types" arrays, types being indexes
+        into "type_names".
+        since (int, optional): Version of a previous response (its
+        X-Pokemon-Version header), only the changes since that version
+        are returned. "since=0" gets the full list and its version.
+
+    Formats (Accept header or ?format=):
+        application/json, application/x-ndjson (ndjson),
+        application/msgpack (msgpack, when msgpack is installed).
 
     Request Body: None
 
@@ -121,18 +227,146 @@ class PokemonOfUserTypeListAPIView(ListAPIView):
             { "number": 7, "name": "squirtle",   "types": ["water"] }
         ] A list of Pokémon belonging to the user's types, with its types.
 
+        200 OK (since): {
+            "version": 1042,
+            "added": [
+                { "number": 25, "name": "pikachu", "types": ["electric"] }
+            ],
+            "removed": [4],
+            "changed": [
+                { "number": 7, "name": "squirtle", "types": ["water", "ice"] }
+            ]
+        } The Pokémon which appeared in, disappeared from or changed in
+        the list. When the version is too old for the change log, the
+        full list is returned instead. Both have an X-Pokemon-Version
+        header.
+
+        400 Bad Request: {
+            "number_min": "A positive integer is required."
+        } Invalid filter, or stream with layout=columnar.
+
         401 Unauthorized:
             Missing or invalid authentication token.
+
+        406 Not Acceptable: {
+            "detail": "The msgpack format cannot be streamed."
+        } Stream in a format other than json and ndjson.
+
+        429 Too Many Requests: {
+            "detail": "Request was throttled. Expected available in 2 seconds."
+        } Too many requests of the user, or of all users, recently.
     """
+    replica_reads = True
+    throttle_scope = "read"
     serializer_class = PokemonWithTypesSerialier
+    renderer_classes = POKEMON_RENDERER_CLASSES
+    filter_backends = [PokemonFilterBackend, OrderingFilter]
+    ordering_fields = ["number", "name"]
 
     def get_queryset(self):
-        # django_filters could be used if complex filtering is usual in the app."
-        return Pokemon.objects.for_user(user=self.request.user)
+        type_group_ids = set(self.user_type_context["user_type_names"])
+        if self.request.query_params.get("types"):
+            types = type_ids_by_name()
+            type_group_ids &= {
+                types.get(name.strip().lower())
+                for name in self.request.query_params["types"].split(",")
+            }
+        # Sorted like the cached list, unless ?ordering= is given.
+        return Pokemon.objects.for_type_groups(
+            type_group_ids=type_group_ids
+        ).order_by("number")
+
+    def is_filtered(self):
+        """Filtered lists are narrowed by the database instead of being
+        cut from the cached full list, and are not cached."""
+        params = self.request.query_params
+        return any(
+            params.get(param) for param in [
+                *PokemonFilterBackend.filter_params,
+                OrderingFilter.ordering_param,
+                "types"
+            ]
+        )
+
+    def list(self, request, *args, **kwargs):
+        if "since" in request.query_params:
+            return self.list_since(since=request.query_params["since"])
+        if request.query_params.get("stream", "").lower() in ("1", "true"):
+            return self.list_stream()
+        filtered = self.is_filtered()
+        if filtered:
+            data = self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True
+            ).data
+        else:
+            data = pokemon_list(context=self.get_serializer_context())
+        if request.query_params.get("layout") == "columnar":
+            data = to_columnar(rows=data)
+        response = Response(data=data, status=HTTP_200_OK)
+        if filtered:
+            return response
+        # The same body for every user of the same types.
+        return share_compressed_body(response=response)
+
+    def list_stream(self):
+        format = self.request.accepted_renderer.format
+        if format not in STREAM_FORMATS:
+            raise NotAcceptable(f"The {format} format cannot be streamed.")
+        if self.request.query_params.get("layout") == "columnar":
+            return Response(
+                data={"error": "The columnar layout cannot be streamed"},
+                status=HTTP_400_BAD_REQUEST
+            )
+        return streaming_response(
+            queryset=self.filter_queryset(self.get_queryset()),
+            serializer_class=self.get_serializer_class(),
+            context=self.get_serializer_context(),
+            format=format
+        )
+
+    def list_since(self, since):
+        """Changes since the change log version `since`, or the full
+        list when the log does not go back that far."""
+        # The log version is read before the catalog version and the
+        # user's types: the Pokémon changes of the log are committed
+        # with a new catalog version (see pokemon.cache), so the catalog
+        # and the types are at least as recent as `version`. A change
+        # made meanwhile is sent again next time rather than missed.
+        version = current_version()
+        catalog = get_catalog(version=catalog_version())
+        delta = None
+        # Changes of the user's types waiting for the write-behind are
+        # not in the log yet.
+        if since.isdecimal() and not has_pending_user_types(
+            user_id=self.request.user.id
+        ):
+            delta = pokemon_delta(
+                user=self.request.user,
+                since=int(since),
+                catalog=catalog,
+                user_type_mask=self.user_type_context["user_type_mask"]
+            )
+        if delta is None:
+            data = pokemon_list(context=self.get_serializer_context())
+        else:
+            added, removed, changed = delta
+            data = {
+                "version": version,
+                "added": self.get_serializer(added, many=True).data,
+                "removed": removed,
+                "changed": self.get_serializer(changed, many=True).data
+            }
+        return Response(
+            data=data,
+            status=HTTP_200_OK,
+            headers={"X-Pokemon-Version": str(version)}
+        )
 
 
 @permission_classes(permission_classes=[IsAuthenticated])
-class PokemonOfUserTypeRetrieveAPIView(RetrieveAPIView):
+class PokemonOfUserTypeRetrieveAPIView(
+    UserTypeNamesContextMixin, RetrieveAPIView
+):
     """
     Authorization: Token <your_token_here>
 
@@ -157,14 +391,283 @@ class PokemonOfUserTypeRetrieveAPIView(RetrieveAPIView):
 
         401 Unauthorized:
             Missing or invalid authentication token.
+
+        429 Too Many Requests: {
+            "detail": "Request was throttled. Expected available in 2 seconds."
+        } Too many requests of the user, or of all users, recently.
     """
+    replica_reads = True
+    throttle_scope = "read"
     serializer_class = PokemonWithTypesSerialier
+    renderer_classes = POKEMON_RENDERER_CLASSES
 
     def get_object(self):
+        """Read from the in-memory catalog when the process already has
+        the current one, from the database otherwise."""
+        identifier = self.kwargs.get("identifier", "")
+        catalog = get_catalog(version=catalog_version(), load=False)
+        if catalog is not None:
+            record = catalog.get(identifier=identifier)
+            if record is None or not (
+                record.type_mask & self.user_type_context["user_type_mask"]
+            ):
+                raise Http404
+            return record
+
         return get_object_or_404(
             Pokemon.objects.for_user(
                 user=self.request.user
             ).by_identifier(
-                identifier=self.kwargs.get("identifier", "")
+                identifier=identifier,
+                numbers_by_name=pokemon_numbers_by_name(fill=False)
+            )
+        )
+
+
+@permission_classes(permission_classes=[IsAuthenticated])
+class PokemonOfUserTypeBulkRetrieveAPIView(
+    UserTypeNamesContextMixin, GenericAPIView
+):
+    """
+    Authorization: Token <your_token_here>
+
+    Endpoint: POST /api/pokemon/bulk/
+
+    Request Body: {
+        "identifiers": ["charmander", 7, "1", "missingno"]
+    } Up to 1000 Pokémon numbers or names (case-insensitive).
+
+    Responses:
+        200 OK: {
+            "found": [
+                { "number": 4, "name": "charmander", "types": ["fire"] },
+                { "number": 7, "name": "squirtle",   "types": ["water"] }
+            ],
+            "not_found": ["1", "missingno"]
+        } The Pokémon belonging to the user's types, in one query, and
+        the identifiers matching none of them.
+
+        400 Bad Request: {
+            "identifiers": ["This field is required."]
+        } Missing, empty or too long identifiers list.
+
+        401 Unauthorized:
+            Missing or invalid authentication token.
+
+        429 Too Many Requests: {
+            "detail": "Request was throttled. Expected available in 2 seconds."
+        } Too many requests of the user, or of all users, recently.
+    """
+    throttle_scope = "read"
+    serializer_class = PokemonWithTypesSerialier
+    renderer_classes = POKEMON_RENDERER_CLASSES
+
+    def get_queryset(self):
+        return Pokemon.objects.for_type_groups(
+            type_group_ids=self.user_type_context["user_type_names"]
+        )
+
+    def post(self, request, *args, **kwargs):
+        input_serializer = PokemonBulkRetrieveInputSerializer(
+            data=request.data
+        )
+        input_serializer.is_valid(raise_exception=True)
+        identifiers = input_serializer.validated_data["identifiers"]
+
+        pokemons = list(self.get_queryset().by_identifiers(
+            identifiers=identifiers
+        ))
+        numbers = {pokemon.number for pokemon in pokemons}
+        names = {pokemon.name.lower() for pokemon in pokemons}
+        not_found = [
+            identifier for identifier in identifiers
+            if (int(identifier) not in numbers if identifier.isdecimal()
+                else identifier.lower() not in names)
+        ]
+        return Response(
+            data={
+                "found": self.get_serializer(pokemons, many=True).data,
+                "not_found": not_found
+            },
+            status=HTTP_200_OK
+        )
+
+
+async def pokemon_events(request):
+    """
+    Authorization: Token <your_token_here>
+
+    Endpoint: GET /api/pokemon/events/ (ASGI only: a stream holds its
+    connection open, a WSGI worker would be blocked by each one)
+
+    Request Body: None
+
+    Responses:
+        200 OK: text/event-stream of server-sent events:
+            event: ready
+            data: {"version": "3f2a..."}
+
+            event: types
+            data: {"version": "3f2a...", "types": ["fire", "water"],
+                   "added": [7, 8, 9], "removed": []}
+            The user's types changed (POST .../add/, DELETE .../remove/).
+
+            event: catalog
+            data: {"version": "9b1c...", "added": [25], "removed": [4]}
+            A new catalog was published, with the Pokémon of the user's
+            types which appeared or disappeared. Not sent when the
+            user's list did not change.
+
+            event: reset
+            data: {}
+            Messages were lost, GET /api/pokemon/ again.
+
+            ": keep-alive" comments are sent every EVENTS_HEARTBEAT
+            seconds without event.
+
+        401 Unauthorized:
+            Missing or invalid authentication token.
+
+        501 Not Implemented: {
+            "error": "Event streams are served by the ASGI application"
+        } Requested from the WSGI application.
+    """
+    # Under WSGI, the endless stream would be collected in memory by the
+    # worker, which would never answer.
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            data={"error": "Event streams are served by the ASGI application"},
+            status=HTTP_501_NOT_IMPLEMENTED
+        )
+    try:
+        authenticated = await sync_to_async(
+            TokenAuthentication().authenticate
+        )(request)
+        if authenticated is None:
+            raise NotAuthenticated
+    except (AuthenticationFailed, NotAuthenticated) as error:
+        return JsonResponse(
+            data={"detail": str(error.detail)}, status=error.status_code,
+            headers={"WWW-Authenticate": "Token"}
+        )
+    user, _ = authenticated
+
+    # Subscribed first, so that nothing is missed while the state the
+    # deltas apply to is read.
+    subscription = broker().subscribe(
+        channels=[user_channel(user_id=user.id), CATALOG_CHANNEL]
+    )
+    try:
+        context = await sync_to_async(user_type_context)(user=user)
+        catalog = await sync_to_async(get_catalog)(
+            version=await sync_to_async(catalog_version)()
+        )
+    except BaseException:
+        subscription.close()
+        raise
+    return StreamingHttpResponse(
+        streaming_content=event_stream(
+            subscription=subscription,
+            catalog=catalog,
+            type_mask=context["user_type_mask"]
+        ),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@permission_classes(permission_classes=[IsAuthenticated])
+class PokemonTypeAnalyticsAPIView(APIView):
+    """
+    Authorization: Token <your_token_here>
+
+    Endpoint: GET /api/pokemon/analytics/
+
+    Request Body: None
+
+    Responses:
+        200 OK: {
+            "types": ["fire", "flying"],
+            "counts": { "fire": 64, "flying": 98 },
+            "overlap": [[64, 6], [6, 98]],
+            "coverage": {
+                "visible": 156,
+                "total": 1025,
+                "ratio": 0.152,
+                "exclusive": { "fire": 58, "flying": 92 },
+                "by_type_count": [150, 6]
+            }
+        } Over the Pokémon visible with the user's types (sorted by
+        name): how many have each type, each pair of types ("overlap",
+        the diagonal being the counts), and how many are visible among
+        the Pokémon having a type, through a single type ("exclusive"),
+        or through 1, 2... of the user's types ("by_type_count").
+
+        401 Unauthorized:
+            Missing or invalid authentication token.
+
+        429 Too Many Requests: {
+            "detail": "Request was throttled. Expected available in 2 seconds."
+        } Too many requests of the user, or of all users, recently.
+
+        501 Not Implemented: {
+            "error": "Type analytics need numpy"
+        } numpy is not installed.
+    """
+    throttle_scope = "read"
+
+    def get(self, request):
+        if load_numpy() is None:
+            return Response(
+                data={"error": "Type analytics need numpy"},
+                status=HTTP_501_NOT_IMPLEMENTED
             )
+        incidence = get_incidence(version=catalog_version())
+        return Response(
+            data=incidence.statistics(
+                user_type_names=user_type_context(
+                    user=request.user
+                )["user_type_names"]
+            ),
+            status=HTTP_200_OK
+        )
+
+
+@permission_classes(permission_classes=[IsAdminUser])
+class CacheStatsAPIView(APIView):
+    """
+    Authorization: Token <your_token_here> (staff user)
+
+    Endpoint: GET /api/cache/stats/
+
+    Request Body: None
+
+    Responses:
+        200 OK: {
+            "backend": "LocMemCache",
+            "hits": 1200,
+            "misses": 40,
+            "evictions": 0,
+            "hit_rate": 0.967,
+            "pokemon_list": {
+                "live_type_sets": 12,
+                "hits": 950, "stale": 10, "misses": 40,
+                "hit_rate": 0.96
+            }
+        } Counters of the default cache and of the Pokémon lists shared
+        by set of types, for the process answering the request.
+
+        401 Unauthorized / 403 Forbidden:
+            Missing token or non staff user.
+    """
+    def get(self, request):
+        backend = caches["default"]
+        stats = backend.stats() if hasattr(backend, "stats") else {}
+        return Response(
+            data={
+                "backend": type(backend).__name__,
+                **stats,
+                "pokemon_list": pokemon_list_stats()
+            },
+            status=HTTP_200_OK
         )
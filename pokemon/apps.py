@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PokemonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pokemon'
+
+    def ready(self):
+        from pokemon import signals  # noqa: F401
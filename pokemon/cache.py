@@ -0,0 +1,305 @@
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from math import log
+from random import random
+from threading import Event, Lock
+from time import monotonic, time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from pokemon.catalog import get_catalog
+from pokemon.models import CatalogVersion, Pokemon, TypeGroup
+from pokemon.typemasks import type_mask
+
+
+# Probabilistic early expiration ("XFetch"): an entry is recomputed
+# before its expiry with a probability growing as it gets close to it,
+# and faster for entries that were long to compute. 1.0 is the usual
+# value, higher values recompute earlier.
+XFETCH_BETA = 1.0
+
+REFRESH_LOCK_TIMEOUT = 30
+
+# {"token": catalog version} of the current request, see
+# CatalogVersionMiddleware.
+_scope = ContextVar("catalog_version_scope", default=None)
+
+
+class SingleFlight:
+    """Run a function once for concurrent calls sharing the same key:
+    the first caller computes, the others wait for its result."""
+
+    class Call:
+        def __init__(self):
+            self.done = Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self.Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+single_flight = SingleFlight()
+
+
+def get_or_compute(key, compute, timeout, stale_timeout,
+                   coalesce=True, stats=None):
+    """Cache `compute()` under `key` for `timeout` seconds, with:
+
+    - stale-while-revalidate: an expired entry is kept `stale_timeout`
+      more seconds, during which a single caller (cache.add lock)
+      recomputes it while the others are served the stale value;
+    - probabilistic early expiration (see XFETCH_BETA);
+    - request coalescing: concurrent misses of the process on a same
+      `key` run `compute` only once.
+
+    `stats`, a Counter, counts "hits", "stale" and "misses"."""
+    stats = stats if stats is not None else Counter()
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires_at, duration = entry
+        early = -duration * XFETCH_BETA * log(1.0 - random())
+        if time() + early < expires_at:
+            stats["hits"] += 1
+            return value
+        stats["stale"] += 1
+        if not cache.add(f"{key}:refresh", 1, timeout=REFRESH_LOCK_TIMEOUT):
+            return value
+        try:
+            value, duration = _timed(compute)
+            _store(key, value, duration, timeout, stale_timeout)
+        finally:
+            cache.delete(f"{key}:refresh")
+        return value
+
+    stats["misses"] += 1
+    if coalesce:
+        value, duration = single_flight.do(
+            key=key, function=lambda: _timed(compute)
+        )
+    else:
+        value, duration = _timed(compute)
+    _store(key, value, duration, timeout, stale_timeout)
+    return value
+
+
+def _timed(compute):
+    start = monotonic()
+    value = compute()
+    return value, monotonic() - start
+
+
+def _store(key, value, duration, timeout, stale_timeout):
+    cache.set(
+        key, (value, time() + timeout, duration),
+        timeout=timeout + stale_timeout
+    )
+
+
+def catalog_version():
+    """Token changed on every catalog write (see pokemon.signals).
+    Cache entries derived from the catalog embed it in their key, so
+    they never have to be invalidated one by one.
+
+    It is read from the database, with a primary key lookup, rather than
+    from the cache: every process sees the writes of the others (sync
+    commands, admin, other workers) whatever the cache backend. It is
+    read once per request (see CatalogVersionMiddleware)."""
+    scope = _scope.get()
+    if scope is not None and "token" in scope:
+        return scope["token"]
+    # On the primary: see main.replicas.
+    token = CatalogVersion.objects.using("default").filter(
+        pk=1
+    ).values_list("token", flat=True).first()
+    if token is None:
+        token = CatalogVersion.objects.get_or_create(
+            pk=1, defaults={"token": uuid4().hex}
+        )[0].token
+    if scope is not None:
+        scope["token"] = token
+    return token
+
+
+def bump_catalog_version():
+    """Change the token, in the transaction of the catalog write when
+    there is one: readers see the new token with the new catalog."""
+    scope = _scope.get()
+    if scope is not None:
+        scope.pop("token", None)
+    if not CatalogVersion.objects.filter(pk=1).update(token=uuid4().hex):
+        CatalogVersion.objects.get_or_create(
+            pk=1, defaults={"token": uuid4().hex}
+        )
+
+
+@contextmanager
+def catalog_version_scope(version=None):
+    """Read the catalog version at most once in the block. With
+    `version`, the block sees that version instead of reading it (a
+    catalog write simulated for this block only, see bench_list_burst)."""
+    token = _scope.set({} if version is None else {"token": version})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+class CatalogVersionMiddleware:
+    """Scope of a request for catalog_version: a request reads the
+    version once, and sees the same catalog throughout. The body of a
+    streaming response is sent once out of the scope: long lived
+    streams read the version again each time."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with catalog_version_scope():
+            return self.get_response(request)
+
+
+def type_ids_by_name():
+    return cache.get_or_set(
+        f"pokemon:type-ids:{catalog_version()}",
+        default=lambda: dict(
+            TypeGroup.objects.using("default").values_list("name", "id")
+        ),
+        timeout=settings.POKEMON_CATALOG_CACHE_TIMEOUT
+    )
+
+
+def pokemon_numbers_by_name(fill=True):
+    """{lowercase name: number}. With fill=False, None is returned
+    instead of loading the whole table when it is not cached."""
+    key = f"pokemon:numbers-by-name:{catalog_version()}"
+    if not fill:
+        return cache.get(key)
+    return cache.get_or_set(
+        key,
+        default=lambda: {
+            name.lower(): number
+            for name, number in Pokemon.objects.using(
+                "default"
+            ).values_list("name", "number")
+        },
+        timeout=settings.POKEMON_CATALOG_CACHE_TIMEOUT
+    )
+
+
+def user_type_context(user):
+    """Serializer context of PokemonWithTypesSerialier for `user`, with
+    the changes of the user's types not written yet (see
+    pokemon.writebehind)."""
+    from pokemon.writebehind import with_pending_user_types
+
+    user_type_names = with_pending_user_types(
+        user_id=user.id,
+        user_type_names=dict(user.usertype_set.values_list(
+            "type_group_id", "type_group__name"
+        ))
+    )
+    return {
+        "user_type_names": user_type_names,
+        "user_type_mask": type_mask(type_ids=user_type_names)
+    }
+
+
+# Per process metrics of the Pokémon list cache.
+pokemon_list_counter = Counter()
+
+# Type sets whose list was asked for since the last catalog change, with
+# the expiry of their cached list: least recently asked first, and at
+# most LIVE_TYPE_SETS_MAX of them.
+LIVE_TYPE_SETS_MAX = 1024
+_live_type_sets = OrderedDict()
+_live_type_sets_version = None
+_live_type_sets_lock = Lock()
+
+
+def _prune_live_type_sets(now):
+    while _live_type_sets and next(iter(_live_type_sets.values())) <= now:
+        _live_type_sets.popitem(last=False)
+    while len(_live_type_sets) > LIVE_TYPE_SETS_MAX:
+        _live_type_sets.popitem(last=False)
+
+
+def _type_set_asked(version, type_set):
+    global _live_type_sets_version
+
+    now = time()
+    with _live_type_sets_lock:
+        # The lists of the previous versions are not served anymore.
+        if version != _live_type_sets_version:
+            _live_type_sets.clear()
+            _live_type_sets_version = version
+        _live_type_sets[type_set] = now + settings.POKEMON_LIST_CACHE_TIMEOUT
+        _live_type_sets.move_to_end(type_set)
+        _prune_live_type_sets(now=now)
+
+
+def pokemon_list(context, coalesce=True):
+    """Serialized Pokémon visible with the types of `context` (see
+    user_type_context), cached per catalog version and per set of types:
+    users subscribed to the same types share the same entry. Misses are
+    computed from the in-memory catalog (see pokemon.catalog)."""
+    # Imported here so that importing pokemon.signals at startup does
+    # not load Django REST framework.
+    from pokemon.serializers import PokemonWithTypesSerialier
+
+    version = catalog_version()
+    type_set = context["user_type_mask"]
+    _type_set_asked(version=version, type_set=type_set)
+    return get_or_compute(
+        key=f"pokemon:list:{version}:{type_set}",
+        compute=lambda: list(PokemonWithTypesSerialier(
+            get_catalog(version=version).visible(type_mask=type_set),
+            many=True,
+            context=context
+        ).data),
+        timeout=settings.POKEMON_LIST_CACHE_TIMEOUT,
+        stale_timeout=settings.POKEMON_LIST_STALE_TIMEOUT,
+        coalesce=coalesce,
+        stats=pokemon_list_counter
+    )
+
+
+def pokemon_list_stats():
+    with _live_type_sets_lock:
+        _prune_live_type_sets(now=time())
+        live_type_sets = len(_live_type_sets)
+    lookups = sum(pokemon_list_counter.values())
+    served = pokemon_list_counter["hits"] + pokemon_list_counter["stale"]
+    return {
+        "live_type_sets": live_type_sets,
+        **pokemon_list_counter,
+        "hit_rate": served / lookups if lookups else None,
+    }
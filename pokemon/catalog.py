@@ -0,0 +1,71 @@
+from threading import Lock
+
+from pokemon.models import Pokemon
+
+
+class PokemonRecord:
+    """Read-only Pokémon, without the per instance overhead of a model
+    (__dict__, _state...). Has the attributes PokemonWithTypesSerialier
+    reads when the user's types are in its context."""
+    __slots__ = ("number", "name", "type_mask")
+
+    def __init__(self, number, name, type_mask):
+        self.number = number
+        self.name = name
+        self.type_mask = type_mask
+
+
+class Catalog:
+    """Every Pokémon of a catalog version, sorted by number, with
+    indexes by number and by lowercase name."""
+    __slots__ = ("version", "records", "by_number", "by_name")
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.records = tuple(
+            PokemonRecord(number=number, name=name, type_mask=type_mask)
+            for number, name, type_mask in rows
+        )
+        self.by_number = {record.number: record for record in self.records}
+        self.by_name = {record.name.lower(): record for record in self.records}
+
+    def get(self, identifier):
+        if identifier.isdecimal():
+            return self.by_number.get(int(identifier))
+        return self.by_name.get(identifier.lower())
+
+    def visible(self, type_mask):
+        """Records having at least one of the types of `type_mask`."""
+        return [
+            record for record in self.records if record.type_mask & type_mask
+        ]
+
+
+_catalog = None
+_catalog_lock = Lock()
+
+
+def get_catalog(version, load=True):
+    """The process wide catalog of `version` (see
+    pokemon.cache.catalog_version), loaded with a single query the first
+    time it is needed. The version is read from the database: catalogs
+    written by other processes replace this one too. With load=False,
+    None is returned instead of loading it."""
+    global _catalog
+
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    if not load:
+        return None
+
+    with _catalog_lock:
+        if _catalog is None or _catalog.version != version:
+            # On the primary: see main.replicas.
+            _catalog = Catalog(
+                version=version,
+                rows=Pokemon.objects.using("default").order_by(
+                    "number"
+                ).values_list("number", "name", "type_mask")
+            )
+        return _catalog
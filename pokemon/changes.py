@@ -0,0 +1,94 @@
+"""Change log behind GET /api/pokemon/?since=<version>.
+
+Every change of a Pokémon's type_mask (or name), every deleted Pokémon
+and every change of a user's types is logged as a CatalogChange, whose
+id is the version given to clients. Only the last
+POKEMON_CHANGE_LOG_SIZE entries are kept: a client whose version is
+older gets the full list again."""
+from django.conf import settings
+from django.db.models import Max, Min, Q
+
+from pokemon.models import CatalogChange
+
+
+def log_pokemon_changes(changes):
+    """Log (number, old type_mask, new type_mask) changes."""
+    if not changes:
+        return
+    CatalogChange.objects.bulk_create(
+        [
+            CatalogChange(number=number, old_mask=old_mask, new_mask=new_mask)
+            for number, old_mask, new_mask in changes
+        ],
+        batch_size=500
+    )
+    trim()
+
+
+def log_user_types(user_id, old_mask, new_mask):
+    CatalogChange.objects.create(
+        user_id=user_id, old_mask=old_mask, new_mask=new_mask
+    )
+    trim()
+
+
+def trim():
+    last = current_version()
+    CatalogChange.objects.filter(
+        id__lte=last - settings.POKEMON_CHANGE_LOG_SIZE
+    ).delete()
+
+
+def current_version():
+    return CatalogChange.objects.aggregate(last=Max("id"))["last"] or 0
+
+
+def pokemon_delta(user, since, catalog, user_type_mask):
+    """Pokémon of `catalog` visible with `user_type_mask` which were
+    added, removed or changed for `user` since the version `since`, as
+    (added records, removed numbers, changed records). None when `since`
+    is not a version the log can answer for: 0, which predates the log,
+    or a version older than its oldest entry."""
+    bounds = CatalogChange.objects.aggregate(first=Min("id"), last=Max("id"))
+    if since == 0 or bounds["last"] is None:
+        return None
+    if not bounds["first"] - 1 <= since <= bounds["last"]:
+        return None
+
+    old_masks = {}
+    old_user_type_mask = user_type_mask
+    user_types_changed = False
+    for number, user_id, old_mask in CatalogChange.objects.filter(
+        Q(user=None) | Q(user=user), id__gt=since
+    ).order_by("id").values_list("number", "user_id", "old_mask"):
+        if user_id is None:
+            old_masks.setdefault(number, old_mask)
+        elif not user_types_changed:
+            old_user_type_mask = old_mask
+            user_types_changed = True
+
+    if user_types_changed:
+        records = catalog.records
+    else:
+        records = [
+            catalog.by_number[number]
+            for number in sorted(old_masks) if number in catalog.by_number
+        ]
+
+    added, removed, changed = [], [], []
+    # Pokémon deleted from the catalog since `since`.
+    for number, old_mask in old_masks.items():
+        if number not in catalog.by_number and old_mask & old_user_type_mask:
+            removed.append(number)
+    for record in records:
+        was = old_masks.get(record.number, record.type_mask) & (
+            old_user_type_mask
+        )
+        now = record.type_mask & user_type_mask
+        if now and not was:
+            added.append(record)
+        elif was and not now:
+            removed.append(record.number)
+        elif now and (was != now or record.number in old_masks):
+            changed.append(record)
+    return added, sorted(removed), changed
@@ -0,0 +1,226 @@
+"""Change notifications pushed to GET /api/pokemon/events/.
+
+Writers publish small deltas on a channel per user (the user's types
+changed) and on the catalog channel (a sync published a new catalog),
+through the broker of the EVENTS_BROKER setting. Subscribers are the
+event streams, which run on the event loop of the ASGI application."""
+import asyncio
+import json
+from collections import defaultdict
+from functools import cache
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from pokemon.cache import catalog_version, user_type_context
+from pokemon.catalog import get_catalog
+
+
+CATALOG_CHANNEL = "catalog"
+# Messages waiting for a slow subscriber. Past that, they are dropped
+# and the subscriber is told to reload the whole list.
+QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+class Subscription:
+    """Messages of some channels for a coroutine. Messages can be put
+    from any thread, and are read on the event loop of the subscriber."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # Loop closed: the subscriber is gone.
+            pass
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Next message, None after `timeout` seconds without one, or
+        {"event": "reset"} if messages were dropped."""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return {"event": "reset"}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(subscription=self)
+
+
+class Broker:
+    """Pub/sub backend of the EVENTS_BROKER setting."""
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def has_subscribers(self, channel):
+        """Lets publishers skip computing messages nobody reads. Backends
+        shared by several processes cannot know, and return True."""
+        return True
+
+
+class InProcessBroker(Broker):
+    """Delivers the messages to the subscribers of the process only:
+    use it with a single ASGI process, or with a cross process backend
+    in front of it."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, channels):
+        subscription = Subscription(broker=self, channels=channels)
+        with self._lock:
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].discard(subscription)
+                if not self._subscriptions[channel]:
+                    del self._subscriptions[channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def has_subscribers(self, channel):
+        return channel in self._subscriptions
+
+
+@cache
+def broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def visibility_delta(old_catalog, new_catalog, old_mask, new_mask):
+    """Numbers of the Pokémon becoming visible and hidden for a user,
+    when the catalog and the user's type mask change."""
+    old_visible = {
+        record.number for record in old_catalog.visible(type_mask=old_mask)
+    }
+    new_visible = {
+        record.number for record in new_catalog.visible(type_mask=new_mask)
+    }
+    return sorted(new_visible - old_visible), sorted(old_visible - new_visible)
+
+
+def notify_user_types(user, type_group_id, added):
+    """Tell the streams of `user` that the TypeGroup `type_group_id` was
+    added to (or removed from) the user's types."""
+    channel = user_channel(user_id=user.id)
+    if not broker().has_subscribers(channel=channel):
+        return
+    context = user_type_context(user=user)
+    new_mask = context["user_type_mask"]
+    bit = 1 << type_group_id
+    old_mask = new_mask & ~bit if added else new_mask | bit
+    catalog = get_catalog(version=catalog_version())
+    added_numbers, removed_numbers = visibility_delta(
+        old_catalog=catalog, new_catalog=catalog,
+        old_mask=old_mask, new_mask=new_mask
+    )
+    broker().publish(channel=channel, message={
+        "event": "types",
+        "version": catalog.version,
+        "type_mask": new_mask,
+        "types": sorted(context["user_type_names"].values()),
+        "added": added_numbers,
+        "removed": removed_numbers,
+    })
+
+
+def notify_catalog():
+    """Wake the streams up after a catalog was published: each one then
+    sends its user the Pokémon which became visible or hidden. Streams
+    also notice the new catalog version on their own, which covers the
+    catalogs published by other processes (the sync commands)."""
+    if not broker().has_subscribers(channel=CATALOG_CHANNEL):
+        return
+    broker().publish(channel=CATALOG_CHANNEL, message={
+        "event": "catalog",
+        "version": catalog_version(),
+    })
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+async def event_stream(subscription, catalog, type_mask):
+    """Server-sent events for a user who sees the Pokémon of `type_mask`
+    in `catalog`, until the client disconnects."""
+    try:
+        yield server_sent_event(event="ready", data={
+            "version": catalog.version
+        })
+        while True:
+            message = await subscription.get(
+                timeout=settings.EVENTS_HEARTBEAT
+            )
+            if message is None:
+                version = await sync_to_async(catalog_version)()
+                if version == catalog.version:
+                    yield b": keep-alive\n\n"
+                    continue
+                message = {"event": "catalog", "version": version}
+
+            if message["event"] == "catalog":
+                if message["version"] == catalog.version:
+                    continue
+                new_catalog = await sync_to_async(get_catalog)(
+                    version=await sync_to_async(catalog_version)()
+                )
+                added, removed = visibility_delta(
+                    old_catalog=catalog, new_catalog=new_catalog,
+                    old_mask=type_mask, new_mask=type_mask
+                )
+                catalog = new_catalog
+                if added or removed:
+                    yield server_sent_event(event="catalog", data={
+                        "version": catalog.version,
+                        "added": added,
+                        "removed": removed
+                    })
+            elif message["event"] == "types":
+                type_mask = message["type_mask"]
+                yield server_sent_event(event="types", data={
+                    key: message[key]
+                    for key in ["version", "types", "added", "removed"]
+                })
+            else:
+                yield server_sent_event(event=message["event"], data={})
+    finally:
+        subscription.close()
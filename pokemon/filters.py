@@ -0,0 +1,31 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class PokemonFilterBackend(BaseFilterBackend):
+    """?name=<prefix> (case-insensitive), ?number_min=&number_max=.
+
+    Both are resolved by the database through indexes: the prefix is
+    a range over the pokemon_name_lower_idx expression index (on SQLite,
+    see PokemonQuerySet.name_startswith), numbers use pokemon_number_idx."""
+    filter_params = ["name", "number_min", "number_max"]
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get("name"):
+            queryset = queryset.name_startswith(prefix=params["name"])
+
+        for param, lookup in [
+            ("number_min", "number__gte"), ("number_max", "number__lte")
+        ]:
+            value = params.get(param)
+            if not value:
+                continue
+            if not value.isdecimal():
+                raise ValidationError(
+                    {param: "A positive integer is required."}
+                )
+            queryset = queryset.filter(**{lookup: int(value)})
+
+        return queryset
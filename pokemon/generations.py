@@ -0,0 +1,134 @@
+"""Catalog generations.
+
+The sync commands write what they fetch from PokeAPI into the
+StagedPokemon rows of an unpublished CatalogGeneration, which readers
+never look at. `publish` then applies the generation to Pokemon and
+PokemonType in a single transaction, which also bumps the catalog
+version: readers, and the caches keyed by the version, see the
+previous catalog or the new one, never a partially synchronized one."""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from pokemon.cache import bump_catalog_version
+from pokemon.changes import log_pokemon_changes
+from pokemon.events import notify_catalog
+from pokemon.models import (
+    CatalogGeneration, Pokemon, PokemonType, StagedPokemon)
+from pokemon.signals import muted
+from pokemon.typemasks import type_ids
+
+
+def staging_generation():
+    """The generation being staged, which is the one of an interrupted
+    sync if there is one."""
+    generation = CatalogGeneration.objects.filter(
+        published_at__isnull=True
+    ).order_by("-id").first()
+    return generation or CatalogGeneration.objects.create()
+
+
+def discard_staging():
+    CatalogGeneration.objects.filter(published_at__isnull=True).delete()
+
+
+def stage_published(generation):
+    """Stage the published Pokémon not staged in `generation` yet, with
+    their current types."""
+    StagedPokemon.objects.bulk_create(
+        [
+            StagedPokemon(generation=generation, number=number, name=name)
+            for number, name in Pokemon.objects.exclude(
+                number__in=generation.stagedpokemon_set.values("number")
+            ).values_list("number", "name")
+        ],
+        batch_size=500
+    )
+
+
+def publish(generation):
+    """Apply `generation` to Pokemon and PokemonType, then garbage
+    collect the old generations. Pokémon which are not staged are left
+    as they are. Returns the number of Pokémon created and updated, and
+    of PokemonType created and deleted."""
+    staged = list(generation.stagedpokemon_set.values_list(
+        "number", "name", "type_mask"
+    ))
+    with transaction.atomic(), muted():
+        pokemons = Pokemon.objects.in_bulk(
+            [number for number, _, _ in staged], field_name="number"
+        )
+        created, updated, changes = [], [], []
+        for number, name, mask in staged:
+            pokemon = pokemons.get(number)
+            if pokemon is None:
+                created.append(
+                    Pokemon(number=number, name=name, type_mask=mask or 0)
+                )
+                changes.append((number, 0, mask or 0))
+                continue
+            if mask is None:
+                mask = pokemon.type_mask
+            if (pokemon.name, pokemon.type_mask) != (name, mask):
+                changes.append((number, pokemon.type_mask, mask))
+                pokemon.name, pokemon.type_mask = name, mask
+                updated.append(pokemon)
+        Pokemon.objects.bulk_create(created, batch_size=500)
+        Pokemon.objects.bulk_update(
+            updated, fields=["name", "type_mask"], batch_size=500
+        )
+        log_pokemon_changes(changes=changes)
+
+        masks = {
+            number: mask for number, _, mask in staged if mask is not None
+        }
+        ids = dict(Pokemon.objects.filter(number__in=masks).values_list(
+            "number", "id"
+        ))
+        desired = {
+            (ids[number], type_id)
+            for number, mask in masks.items()
+            for type_id in type_ids(mask=mask)
+        }
+        current = {
+            (pokemon_id, type_group_id): link_id
+            for link_id, pokemon_id, type_group_id in
+            PokemonType.objects.filter(pokemon_id__in=ids.values())
+            .values_list("id", "pokemon_id", "type_group_id")
+        }
+        stale = [
+            link_id for link, link_id in current.items()
+            if link not in desired
+        ]
+        PokemonType.objects.filter(id__in=stale).delete()
+        missing = [
+            PokemonType(pokemon_id=pokemon_id, type_group_id=type_group_id)
+            for pokemon_id, type_group_id in desired - current.keys()
+        ]
+        PokemonType.objects.bulk_create(missing, batch_size=500)
+
+        generation.published_at = timezone.now()
+        generation.save(update_fields=["published_at"])
+        bump_catalog_version()
+        transaction.on_commit(notify_catalog)
+
+    collect_generations()
+    return {
+        "created": len(created),
+        "updated": len(updated),
+        "types_created": len(missing),
+        "types_deleted": len(stale),
+    }
+
+
+def collect_generations(keep=None):
+    """Delete the published generations but the `keep` last ones
+    (CATALOG_GENERATIONS_KEPT by default)."""
+    if keep is None:
+        keep = settings.CATALOG_GENERATIONS_KEPT
+    published = CatalogGeneration.objects.filter(published_at__isnull=False)
+    kept = list(published.order_by("-published_at", "-id").values_list(
+        "id", flat=True
+    )[:keep])
+    _, deleted = published.exclude(id__in=kept).delete()
+    return deleted.get("pokemon.CatalogGeneration", 0)
@@ -0,0 +1,38 @@
+import tracemalloc
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from pokemon.cache import catalog_version
+from pokemon.catalog import Catalog
+from pokemon.models import Pokemon
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare memory and load time of the Pokémon as model instances "
+        "and as in-memory catalog records"
+    )
+
+    def handle(self, *args, **options):
+        version = catalog_version()
+        loaders = {
+            "models": lambda: list(Pokemon.objects.order_by("number")),
+            "catalog": lambda: Catalog(
+                version=version,
+                rows=Pokemon.objects.order_by("number").values_list(
+                    "number", "name", "type_mask"
+                )
+            ),
+        }
+        for name, load in loaders.items():
+            tracemalloc.start()
+            start = perf_counter()
+            loaded = load()
+            elapsed = perf_counter() - start
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f"{name:<8} {size / 1024:>10.1f} KiB {elapsed * 1000:>8.1f} ms"
+            )
+            del loaded
@@ -0,0 +1,92 @@
+from statistics import median, quantiles
+from threading import Barrier, Thread
+from time import perf_counter
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from pokemon.cache import (
+    catalog_version_scope, pokemon_list, user_type_context)
+# Imported by the first list otherwise, which the burst would time.
+from pokemon.serializers import PokemonWithTypesSerialier  # noqa: F401
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test: send a burst of concurrent Pokémon list requests right "
+        "after a catalog change, cold catalog and cold cache, and report "
+        "their latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=50)
+        parser.add_argument(
+            "--no-coalescing", action="store_true",
+            help="Let every concurrent miss compute its own list."
+        )
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(usertype__isnull=False).distinct()
+        )
+        if not users:
+            raise CommandError("No user with types to run the burst with.")
+        contexts = [user_type_context(user=user) for user in users]
+
+        # The catalog change is simulated in this process only: the
+        # requests see a new version, so the catalog is loaded again and
+        # every list is a miss, but neither the catalog version of the
+        # database nor the configured cache are touched.
+        version = f"bench-{uuid4().hex}"
+        barrier = Barrier(parties=options["threads"])
+        latencies = []
+
+        def request(context):
+            barrier.wait()
+            start = perf_counter()
+            try:
+                with catalog_version_scope(version=version):
+                    pokemon_list(
+                        context=context,
+                        coalesce=not options["no_coalescing"]
+                    )
+            finally:
+                latencies.append(perf_counter() - start)
+                connection.close()
+
+        threads = [
+            Thread(target=request, args=[contexts[i % len(contexts)]])
+            for i in range(options["threads"])
+        ]
+        with override_settings(CACHES={"default": {
+            "BACKEND": "main.cache.LocMemCache",
+            "LOCATION": "bench-list-burst",
+        }}):
+            start = perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = perf_counter() - start
+
+        self.stdout.write(
+            f"{options['threads']} requests, {len(users)} users, "
+            f"{len({c['user_type_mask'] for c in contexts})} type sets, "
+            f"{elapsed * 1000:.1f} ms"
+        )
+        latencies.sort()
+        p95 = (
+            quantiles(latencies, n=20)[-1] if len(latencies) > 1
+            else latencies[0]
+        )
+        self.stdout.write(
+            f"latency: min {latencies[0] * 1000:.1f} ms, "
+            f"median {median(latencies) * 1000:.1f} ms, "
+            f"p95 {p95 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms"
+        )
@@ -0,0 +1,55 @@
+from timeit import repeat
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from pokemon.renderers import (
+    MessagePackRenderer, NDJSONRenderer, msgpack, to_columnar)
+
+
+class Command(BaseCommand):
+    help = "Compare size and encode time of the Pokémon list renderers"
+    TYPE_NAMES = [
+        "normal", "fire", "water", "grass", "electric", "ice",
+        "fighting", "poison", "ground", "flying", "psychic", "bug",
+        "rock", "ghost", "dragon", "dark", "steel", "fairy"
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = [
+            {
+                "number": number,
+                "name": f"pokemon-{number}",
+                "types": [
+                    self.TYPE_NAMES[number % len(self.TYPE_NAMES)],
+                    self.TYPE_NAMES[(number * 7) % len(self.TYPE_NAMES)]
+                ][:1 + number % 2]
+            }
+            for number in range(1, options["rows"] + 1)
+        ]
+        layouts = {"rows": rows, "columnar": to_columnar(rows=rows)}
+
+        renderers = [JSONRenderer(), NDJSONRenderer()]
+        if msgpack is not None:
+            renderers.append(MessagePackRenderer())
+        else:
+            self.stderr.write("msgpack is not installed, skipping it.")
+
+        self.stdout.write(
+            f"{'renderer':<10} {'layout':<10} {'bytes':>12} {'encode ms':>10}"
+        )
+        for renderer in renderers:
+            for layout, data in layouts.items():
+                size = len(renderer.render(data))
+                best = min(repeat(
+                    lambda: renderer.render(data),
+                    number=1, repeat=options["repeat"]
+                ))
+                self.stdout.write(
+                    f"{renderer.format:<10} {layout:<10} "
+                    f"{size:>12} {best * 1000:>10.2f}"
+                )
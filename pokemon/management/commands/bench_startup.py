@@ -0,0 +1,127 @@
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# A throwaway database with the test fixtures (token "testtoken"), and
+# a cache of the process: the first request goes through the
+# authentication, the Pokémon list and the catalog, and neither the
+# configured database nor the configured cache are touched.
+THROWAWAY_SETTINGS = """
+import os
+os.environ["DJANGO_SETTINGS_MODULE"] = {settings!r}
+from django.conf import settings
+settings.DATABASES = {{"default": {{
+    "ENGINE": "django.db.backends.sqlite3", "NAME": {database!r}
+}}}}
+settings.READ_REPLICA = None
+settings.CACHES = {{"default": {{"BACKEND": "main.cache.LocMemCache"}}}}
+"""
+
+SETUP_SCRIPT = THROWAWAY_SETTINGS + """
+import django
+django.setup()
+from django.core.management import call_command
+call_command("migrate", verbosity=0)
+call_command(
+    "loaddata", "users", "tokens", "typegroups", "usertypes", "pokemons",
+    "pokemontypes", verbosity=0
+)
+"""
+
+FIRST_REQUEST_SCRIPT = """
+from time import perf_counter
+start = perf_counter()
+""" + THROWAWAY_SETTINGS + """
+import django
+django.setup()
+from django.test import Client
+from django.test.utils import setup_test_environment
+setup_test_environment()
+ready = perf_counter()
+response = Client().get(
+    "/api/pokemon/", HTTP_AUTHORIZATION="Token testtoken"
+)
+assert response.status_code == 200, response.status_code
+print(ready - start, perf_counter() - ready)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the startup time of `manage.py check` (python -X importtime) "
+        "and the latency of the first authenticated list request of a cold "
+        "process, for each settings profile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profiles", nargs="+",
+            default=["main.settings", "main.settings_api"]
+        )
+        parser.add_argument("--top", type=int, default=10)
+
+    def handle(self, *args, **options):
+        manage_py = Path(settings.BASE_DIR) / "manage.py"
+        for profile in options["profiles"]:
+            self.stdout.write(self.style.MIGRATE_HEADING(profile))
+
+            start = perf_counter()
+            check = subprocess.run(
+                [
+                    sys.executable, "-X", "importtime", str(manage_py),
+                    "check", "--settings", profile
+                ],
+                capture_output=True, text=True, cwd=settings.BASE_DIR
+            )
+            elapsed = perf_counter() - start
+            imports = self.parse_importtime(stderr=check.stderr)
+            self.stdout.write(
+                f"manage.py check: {elapsed * 1000:.0f} ms wall, "
+                f"{len(imports)} modules imported"
+            )
+            for cumulative, module in sorted(imports, reverse=True)[
+                :options["top"]
+            ]:
+                self.stdout.write(f"  {cumulative / 1000:>8.1f} ms  {module}")
+
+            with TemporaryDirectory() as directory:
+                database = str(Path(directory) / "db.sqlite3")
+                for script in [SETUP_SCRIPT, FIRST_REQUEST_SCRIPT]:
+                    process = subprocess.run(
+                        [
+                            sys.executable, "-c",
+                            script.format(settings=profile, database=database)
+                        ],
+                        capture_output=True, text=True, cwd=settings.BASE_DIR
+                    )
+                    if process.returncode:
+                        break
+            if process.returncode:
+                self.stderr.write(process.stderr)
+                continue
+            setup, request = map(float, process.stdout.split()[-2:])
+            self.stdout.write(
+                f"django.setup(): {setup * 1000:.0f} ms, "
+                f"first request: {request * 1000:.0f} ms"
+            )
+
+    @staticmethod
+    def parse_importtime(stderr):
+        """[(cumulative µs, module)] of the top level imports."""
+        imports = []
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "[us]" in line:
+                continue
+            _, cumulative, module = line.removeprefix(
+                "import time:"
+            ).split("|")
+            if module.startswith("  "):
+                continue
+            imports.append((int(cumulative), module.strip()))
+        return imports
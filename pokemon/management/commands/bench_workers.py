@@ -0,0 +1,124 @@
+import json
+import os
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+
+from main.wsgi import preload
+
+
+def memory_usage():
+    """{Rss, Pss, Shared, Private} of the current process, in kB. Pss
+    splits the shared pages between the processes sharing them, so it is
+    the per worker cost once copy-on-write is taken into account."""
+    usage = {}
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            field, _, value = line.partition(":")
+            if field in ("Rss", "Pss"):
+                usage[field] = int(value.split()[0])
+            elif field.startswith(("Shared_", "Private_")):
+                kind = field.partition("_")[0]
+                usage[kind] = usage.get(kind, 0) + int(value.split()[0])
+    return usage
+
+
+class Command(BaseCommand):
+    help = (
+        "Fork workers like a preforking WSGI server does, with and without "
+        "main.wsgi.preload, and report their memory and the latency of "
+        "their first request"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--username",
+            help="User authenticated for the first request, so that it "
+                 "goes through the Pokémon list and the catalog"
+        )
+        parser.add_argument(
+            "--no-preload", action="store_true",
+            help="Only measure workers forked from a cold process"
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists("/proc/self/smaps_rollup"):
+            raise CommandError("/proc/self/smaps_rollup is needed (Linux).")
+        user = None
+        if options["username"]:
+            user = get_user_model().objects.get(
+                username=options["username"]
+            )
+
+        self.report("cold", self.fork_workers(
+            workers=options["workers"], user=user
+        ))
+        if not options["no_preload"]:
+            preload()
+            self.report("preloaded", self.fork_workers(
+                workers=options["workers"], user=user
+            ))
+
+    def fork_workers(self, workers, user):
+        from django.db import connections
+
+        connections.close_all()
+        pipes = []
+        for _ in range(workers):
+            read, write = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read)
+                code = 0
+                try:
+                    result = self.first_request(user=user)
+                    os.write(write, json.dumps(result).encode())
+                except BaseException:
+                    code = 1
+                finally:
+                    os._exit(code)
+            os.close(write)
+            pipes.append((pid, read))
+
+        results = []
+        for pid, read in pipes:
+            with os.fdopen(read, "rb") as pipe:
+                output = pipe.read()
+            os.waitpid(pid, 0)
+            if output:
+                results.append(json.loads(output))
+        return results
+
+    @staticmethod
+    def first_request(user):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user=user)
+        start = perf_counter()
+        response = client.get("/api/pokemon/", HTTP_HOST="localhost")
+        latency = perf_counter() - start
+        return {
+            "status": response.status_code,
+            "latency": latency,
+            **memory_usage(),
+        }
+
+    def report(self, label, results):
+        if not results:
+            raise CommandError(f"No {label} worker reported its measures.")
+        count = len(results)
+
+        def mean(field):
+            return sum(result[field] for result in results) / count
+
+        self.stdout.write(
+            f"{label:<10} {count} workers, "
+            f"status {sorted({result['status'] for result in results})}, "
+            f"first request {mean('latency') * 1000:.1f} ms, "
+            f"RSS {mean('Rss') / 1024:.1f} MiB, "
+            f"PSS {mean('Pss') / 1024:.1f} MiB, "
+            f"private {mean('Private') / 1024:.1f} MiB"
+        )
@@ -0,0 +1,48 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pokemon.typemasks import refresh_type_masks, type_ids, type_mask
+
+
+class Command(BaseCommand):
+    help = "Check that Pokemon.type_mask matches the PokemonType relations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix", action="store_true",
+            help="Rewrite the inconsistent masks from PokemonType."
+        )
+
+    def handle(self, *args, **options):
+        Pokemon = apps.get_model(app_label="pokemon", model_name="Pokemon")
+        PokemonType = apps.get_model(app_label="pokemon", model_name="PokemonType")
+
+        expected = {}
+        for pokemon_id, type_group_id in PokemonType.objects.values_list(
+            "pokemon_id", "type_group_id"
+        ):
+            expected.setdefault(pokemon_id, []).append(type_group_id)
+
+        mismatches = 0
+        for pokemon_id, name, mask in Pokemon.objects.values_list(
+            "id", "name", "type_mask"
+        ):
+            expected_mask = type_mask(type_ids=expected.get(pokemon_id, []))
+            if mask != expected_mask:
+                mismatches += 1
+                self.stdout.write(
+                    f"• {pokemon_id}/{name} : mask has {type_ids(mask=mask)},"
+                    f" relations have {type_ids(mask=expected_mask)}"
+                )
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All type masks are consistent."))
+            return
+
+        if not options["fix"]:
+            raise CommandError(f"{mismatches} inconsistent type masks.")
+
+        with transaction.atomic():
+            fixed = refresh_type_masks()
+        self.stdout.write(self.style.SUCCESS(f"{fixed} type masks fixed."))
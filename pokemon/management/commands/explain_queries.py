@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from pokemon.models import Pokemon, TypeGroup
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plans of the API read paths on the configured "
+        "database, to catch plan regressions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username",
+            help="User whose queries are explained (default: first user)."
+        )
+        parser.add_argument("--identifier", default="pikachu")
+
+    def handle(self, *args, **options):
+        if options["username"]:
+            user = User.objects.get(username=options["username"])
+        else:
+            user = User.objects.order_by("pk").first() or User(pk=1)
+        type_group_ids = list(
+            TypeGroup.objects.values_list("pk", flat=True)[:2]
+        ) or [1]
+
+        queries = {
+            "for_user": Pokemon.objects.for_user(user=user),
+            "for_type_groups": Pokemon.objects.for_type_groups(
+                type_group_ids=type_group_ids
+            ),
+            "by_identifier (name)": Pokemon.objects.for_user(
+                user=user
+            ).by_identifier(identifier=options["identifier"]),
+            "by_identifier (number)": Pokemon.objects.for_user(
+                user=user
+            ).by_identifier(identifier="25"),
+            "by_identifiers": Pokemon.objects.for_type_groups(
+                type_group_ids=type_group_ids
+            ).by_identifiers(identifiers=[options["identifier"], "25"]),
+            "name_startswith": Pokemon.objects.name_startswith(
+                prefix=options["identifier"][:3]
+            ),
+            "UserMe type groups": user.usertype_set.select_related(
+                "type_group"
+            ),
+        }
+
+        self.stdout.write(
+            f"Backend: {connection.vendor}, user: {user.pk}, "
+            f"type groups: {type_group_ids}"
+        )
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}"))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain())
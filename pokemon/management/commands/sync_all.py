@@ -0,0 +1,101 @@
+from io import StringIO
+from time import monotonic
+
+from django.conf import settings
+from django.core.management import call_command, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+
+from pokemon.generations import discard_staging
+from pokemon.sync import (
+    Checkpoint, Progress, ResumableSyncMixin, SyncLocked, sync_lock)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run sync_types and sync_pokemons as one pipeline, under a lock, "
+        "resuming from the last checkpoint of an interrupted run"
+    )
+    STEPS = ["sync_types", "sync_pokemons"]
+    # Publishes the catalog generation staged by the steps before it.
+    PUBLISHING_STEP = "sync_pokemons"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Ignore the checkpoint and the staged catalog of an "
+                 "interrupted run"
+        )
+        parser.add_argument(
+            "--offline", action="store_true",
+            help="Only read the PokeAPI responses cached by previous syncs"
+        )
+        parser.add_argument(
+            "--progress-interval", type=float, default=5.0,
+            help="Seconds between two progress lines"
+        )
+
+    def handle(self, *args, **options):
+        state_dir = settings.SYNC_STATE_DIR
+        try:
+            with sync_lock(path=state_dir / "sync.lock"):
+                self.run_pipeline(
+                    checkpoint=Checkpoint(path=state_dir / "checkpoint.json"),
+                    **options
+                )
+        except SyncLocked as error:
+            raise CommandError(str(error))
+
+    def run_pipeline(self, checkpoint, **options):
+        if options["restart"]:
+            checkpoint.clear()
+            discard_staging()
+        checkpoint.load()
+        if checkpoint.step not in [None, *self.STEPS]:
+            # Left by a version of the pipeline with other steps.
+            checkpoint.clear()
+        if checkpoint.step is not None:
+            self.stdout.write(
+                f"Resuming at {checkpoint.step}, offset {checkpoint.offset}"
+            )
+        first = self.STEPS.index(checkpoint.step) if checkpoint.step else 0
+
+        for step in self.STEPS[first:]:
+            offset = checkpoint.offset if step == checkpoint.step else 0
+            checkpoint.save(step=step, offset=offset)
+            self.run_step(
+                step=step, offset=offset, checkpoint=checkpoint, **options
+            )
+        checkpoint.clear()
+        self.stdout.write(self.style.SUCCESS("Sync pipeline complete."))
+
+    def run_step(self, step, offset, checkpoint, **options):
+        command = load_command_class(app_name="pokemon", name=step)
+        progress = Progress(
+            write=self.stdout.write, step=step, start_offset=offset,
+            interval=options["progress_interval"]
+        )
+        position = {"offset": offset, "total": offset}
+        step_options = {"offline": options["offline"]}
+        if isinstance(command, ResumableSyncMixin):
+            def save_checkpoint(offset, total):
+                checkpoint.save(step=step, offset=offset)
+                position.update(offset=offset, total=total)
+                progress.update(offset=offset, total=total)
+
+            command.checkpoint = save_checkpoint
+            step_options["offset"] = offset
+            step_options["publish"] = step == self.PUBLISHING_STEP
+
+        # Rows are only listed from verbosity 2, progress lines replace them.
+        verbose = options["verbosity"] >= 2
+        started = monotonic()
+        call_command(
+            command,
+            stdout=self.stdout if verbose else StringIO(),
+            stderr=self.stderr,
+            verbosity=options["verbosity"],
+            **step_options
+        )
+        if position["total"] > offset:
+            progress.update(force=True, **position)
+        self.stdout.write(f"{step} done in {monotonic() - started:.1f}s")
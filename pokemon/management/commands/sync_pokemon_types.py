@@ -1,53 +1,74 @@
-import requests
-
 from django.apps import apps
 from django.core.management.base import BaseCommand
 
-
-Pokemon = apps.get_model(app_label="pokemon", model_name="Pokemon")
-TypeGroup = apps.get_model(app_label="pokemon", model_name="TypeGroup")
+from pokemon.pokeapi import PokeAPICommandMixin
+from pokemon.sync import ResumableSyncMixin
+from pokemon.typemasks import type_mask
 
 
-class Command(BaseCommand):
-    help = "Synchronize Pokémon ↔ TypeGroup relations"
+class Command(PokeAPICommandMixin, ResumableSyncMixin, BaseCommand):
+    help = (
+        "Synchronize Pokémon ↔ TypeGroup relations only (sync_pokemons "
+        "synchronizes them along with the Pokémon)"
+    )
     POKEAPI_DETAIL_URL = "https://pokeapi.co/api/v2/pokemon/{name}/"
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--no-publish", dest="publish", action="store_false",
+            help="Leave the relations staged (see pokemon.generations)"
+        )
+
     def handle(self, *args, **options):
-        created = 0
-        deleted = 0
+        from pokemon.generations import (
+            publish, stage_published, staging_generation)
+
+        TypeGroup = apps.get_model(app_label="pokemon", model_name="TypeGroup")
+
+        # Pokémon staged by sync_pokemons --no-publish, and the others.
+        generation = staging_generation()
+        stage_published(generation=generation)
+        type_ids_by_name = dict(TypeGroup.objects.values_list("name", "id"))
+
         self.stdout.write("Starting sync_pokemon_types")
 
-        for poke in Pokemon.objects.all():
-            resp = requests.get(
+        offset = options["offset"]
+        staged = generation.stagedpokemon_set.order_by("number")
+        total = staged.count()
+        for poke in staged[offset:]:
+            resp = self.pokeapi.get(
                 self.POKEAPI_DETAIL_URL.format(name=poke.name)
             )
             if resp.status_code != 200:
                 self.stderr.write(f"Error fetching details for {poke.name}")
+                offset += 1
                 continue
 
             data = resp.json()
             desired_names = {t["type"]["name"] for t in data.get("types", [])}
 
-            groups = TypeGroup.objects.filter(name__in=desired_names)
-            desired_ids = {g.id for g in groups}
-
-            poke_types = poke.pokemontype_set
-            current_ids = set(poke_types.values_list("type_group_id", flat=True))
-
-            to_delete = current_ids - desired_ids
-            if to_delete:
-                deleted_count, _ = poke_types.filter(type_group_id__in=to_delete).delete()
-                deleted += deleted_count
-
-            to_create = desired_ids - current_ids
-            for tg_id in to_create:
-                poke_types.create(type_group_id=tg_id)
-                created += 1
+            poke.type_mask = type_mask(type_ids=[
+                type_ids_by_name[name]
+                for name in desired_names if name in type_ids_by_name
+            ])
+            poke.save(update_fields=["type_mask"])
 
             self.stdout.write(
-                f"• {poke.id}/{poke.name} : +{len(to_create)}, -{len(to_delete)}"
+                f"• {poke.number}/{poke.name} : {', '.join(sorted(desired_names))}"
             )
+            offset += 1
+            self.checkpoint(offset=offset, total=total)
+
+        self.stdout.write(self.pokeapi.describe())
+        if not options["publish"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"Relations staged in generation {generation.id}."
+            ))
+            return
 
+        published = publish(generation=generation)
         self.stdout.write(self.style.SUCCESS(
-            f"Relations sync complete: {created} created, {deleted} deleted."
+            f"Relations sync complete: {published['types_created']} created, "
+            f"{published['types_deleted']} deleted."
         ))
@@ -1,67 +1,230 @@
-import requests
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from multiprocessing import get_context
 
+import django
 from django.apps import apps
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 
+from pokemon.pokeapi import PokeAPICommandMixin, pokeapi_client
+from pokemon.sync import ResumableSyncMixin, pipeline
+from pokemon.typemasks import type_mask
 
-Pokemon = apps.get_model(app_label="pokemon", model_name="Pokemon")
 
-
-class Command(BaseCommand):
-    help = "Synchronize Pokémon entries from PokeAPI into Pokemon model"
-    POKEAPI_LIST_URL   = "https://pokeapi.co/api/v2/pokemon?limit=100&offset={offset}"
+class Command(PokeAPICommandMixin, ResumableSyncMixin, BaseCommand):
+    help = (
+        "Synchronize Pokémon entries and their types from PokeAPI into "
+        "Pokemon and PokemonType"
+    )
+    POKEAPI_LIST_URL   = "https://pokeapi.co/api/v2/pokemon?limit={limit}&offset={offset}"
     POKEAPI_DETAIL_URL = "https://pokeapi.co/api/v2/pokemon/{name}/"
+    PAGE_SIZE = 100
+    BATCH_SIZE = 100
+    CONCURRENCY = 8
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--no-publish", dest="publish", action="store_false",
+            help="Leave the Pokémon staged (see pokemon.generations)"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=self.CONCURRENCY,
+            help="Detail pages fetched at the same time (per worker)"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Processes staging the Pokémon, each one a range of them"
+        )
 
     def handle(self, *args, **options):
-        offset = 0
-        created = updated = 0
+        from pokemon.generations import publish, staging_generation
 
+        generation = staging_generation()
         self.stdout.write("Starting sync_pokemon")
 
-        while True:
-            list_resp = requests.get(
-                self.POKEAPI_LIST_URL.format(offset=offset)
+        if options["workers"] > 1:
+            staged = self.stage_with_workers(
+                generation=generation, start=options["offset"], **options
+            )
+        else:
+            staged = self.stage(
+                generation=generation,
+                start=options["offset"],
+                concurrency=options["concurrency"]
             )
-            if list_resp.status_code != 200:
-                self.stderr.write("Error fetching Pokemon list")
-                return
-
-            data    = list_resp.json()
-            results = data.get("results", [])
-
-            if not results:
-                break
-
-            for entry in results:
-                name = entry["name"]
-                detail = requests.get(
-                    self.POKEAPI_DETAIL_URL.format(name=name)
-                )
 
-                if detail.status_code != 200:
-                    self.stderr.write(f"Error fetching {name} information")
-                    continue
+        self.stdout.write(self.pokeapi.describe())
+        if not options["publish"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"Pokemon sync: {staged} staged in generation {generation.id}."
+            ))
+            return
 
-                info   = detail.json()
-                number = info["id"]
+        published = publish(generation=generation)
+        self.stdout.write(self.style.SUCCESS(
+            f"Pokemon sync: {published['created']} created, "
+            f"{published['updated']} updated, "
+            f"types {published['types_created']} created, "
+            f"{published['types_deleted']} deleted."
+        ))
 
-                _, is_new = Pokemon.objects.update_or_create(
+    def stage(self, generation, start, concurrency, stop=None):
+        """Stage the Pokémon listed from `start` to `stop` with their
+        types: list pages are read on a thread, detail pages fetched and
+        parsed on `concurrency` threads, and rows are written by batches
+        on this thread. Returns the number of Pokémon staged."""
+        StagedPokemon = apps.get_model(
+            app_label="pokemon", model_name="StagedPokemon"
+        )
+        TypeGroup = apps.get_model(app_label="pokemon", model_name="TypeGroup")
+
+        self.type_ids_by_name = dict(
+            TypeGroup.objects.values_list("name", "id")
+        )
+        staged = 0
+
+        # Entries of each list page, and how many are staged: the
+        # checkpoint moves past a page once it is entirely staged.
+        page_lengths, page_staged = {}, {}
+        checkpoint = start
+        batch = []
+
+        def flush():
+            nonlocal checkpoint
+            StagedPokemon.objects.bulk_create(
+                [row for _, row in batch if row is not None],
+                update_conflicts=True,
+                unique_fields=["generation", "number"],
+                update_fields=["name", "type_mask"]
+            )
+            for page, _ in batch:
+                page_staged[page] = page_staged.get(page, 0) + 1
+            batch.clear()
+            while checkpoint in page_lengths and (
+                page_staged.get(checkpoint) == page_lengths[checkpoint]
+            ):
+                page_staged.pop(checkpoint)
+                checkpoint += page_lengths.pop(checkpoint)
+            self.checkpoint(offset=checkpoint, total=self.total)
+
+        self.total = checkpoint
+        for (page, length, name), pokemon in pipeline(
+            produce=lambda: self.list_pokemons(offset=start, stop=stop),
+            process=self.fetch_pokemon,
+            concurrency=concurrency
+        ):
+            page_lengths[page] = length
+            row = None
+            if pokemon is not None:
+                number, type_ids = pokemon
+                row = StagedPokemon(
+                    generation=generation,
                     number=number,
-                    defaults={"name": name, "number": number}
+                    name=name,
+                    type_mask=type_mask(type_ids=type_ids)
                 )
+                staged += 1
+                self.stdout.write(f"• {number}/{name}")
+            batch.append((page, row))
+            if len(batch) >= self.BATCH_SIZE:
+                flush()
+        flush()
+        return staged
+
+    def stage_with_workers(self, generation, start, **options):
+        """Stage the Pokémon with --workers processes, each one listing
+        and staging its own range of list offsets with its own database
+        connection. Their writes are serialized by SQLite and concurrent
+        on PostgreSQL. The checkpoint only moves once every range is
+        staged: a resumed run stages them all again, mostly from the
+        PokeAPI cache."""
+        total = self.pokeapi.get(
+            self.POKEAPI_LIST_URL.format(limit=1, offset=0)
+        ).json()["count"]
+        size = -(-max(total - start, 0) // options["workers"])
+        ranges = [
+            (offset, min(offset + size, total))
+            for offset in range(start, total, size or 1)
+        ]
+
+        staged = 0
+        with ProcessPoolExecutor(
+            max_workers=options["workers"],
+            mp_context=get_context("spawn"),
+            initializer=django.setup
+        ) as executor:
+            for counts in executor.map(
+                stage_range,
+                [generation.id] * len(ranges),
+                *zip(*ranges),
+                [options["concurrency"]] * len(ranges),
+                [options["offline"]] * len(ranges)
+            ):
+                staged += counts.pop("staged")
+                self.pokeapi.stats.update(counts)
+        self.checkpoint(offset=total, total=total)
+        return staged
+
+    def list_pokemons(self, offset, stop=None):
+        """(page offset, page length, name) of the Pokémon listed from
+        `offset` to `stop`."""
+        while stop is None or offset < stop:
+            limit = self.PAGE_SIZE
+            if stop is not None:
+                limit = min(limit, stop - offset)
+            list_resp = self.pokeapi.get(
+                self.POKEAPI_LIST_URL.format(limit=limit, offset=offset)
+            )
+            if list_resp.status_code != 200:
+                raise CommandError("Error fetching Pokemon list")
 
-                if is_new:
-                    created += 1
-                else:
-                    updated += 1
+            data    = list_resp.json()
+            results = data.get("results", [])
+            self.total = data.get("count", offset + len(results))
 
-                self.stdout.write(f"• {number}/{name}")
+            for entry in results:
+                yield offset, len(results), entry["name"]
 
-            if data.get("next"):
-                offset += len(results)
-            else:
+            offset += len(results)
+            if not results or not data.get("next"):
                 break
 
-        self.stdout.write(self.style.SUCCESS(
-            f"Pokemon sync: {created} created, {updated} updated."
-        ))
+    def fetch_pokemon(self, entry):
+        """(number, type ids) of the Pokémon of a list entry, or None."""
+        _, _, name = entry
+        detail = self.pokeapi.get(self.POKEAPI_DETAIL_URL.format(name=name))
+        if detail.status_code != 200:
+            self.stderr.write(f"Error fetching {name} information")
+            return None
+
+        info = detail.json()
+        return info["id"], [
+            self.type_ids_by_name[slot["type"]["name"]]
+            for slot in info.get("types", [])
+            if slot["type"]["name"] in self.type_ids_by_name
+        ]
+
+
+def stage_range(generation_id, start, stop, concurrency, offline):
+    """Stage the Pokémon listed from `start` to `stop`, in a worker
+    process of sync_pokemons --workers. Returns the counts to merge."""
+    CatalogGeneration = apps.get_model(
+        app_label="pokemon", model_name="CatalogGeneration"
+    )
+
+    command = Command(stdout=StringIO())
+    command.pokeapi = pokeapi_client(offline=offline)
+    try:
+        staged = command.stage(
+            generation=CatalogGeneration.objects.get(id=generation_id),
+            start=start,
+            stop=stop,
+            concurrency=concurrency
+        )
+    finally:
+        if command.pokeapi.cache is not None:
+            command.pokeapi.cache.close()
+        connections.close_all()
+    return {"staged": staged, **command.pokeapi.stats}
@@ -1,25 +1,21 @@
-import requests
-
 from django.apps import apps
-from django.core.management.base import BaseCommand
-
+from django.core.management.base import BaseCommand, CommandError
 
-TypeGroup = apps.get_model(app_label="pokemon", model_name="TypeGroup")
+from pokemon.pokeapi import PokeAPICommandMixin
 
 
-class Command(BaseCommand):
+class Command(PokeAPICommandMixin, BaseCommand):
     help = "Synchronize all Pokémon types from PokeAPI into TypeGroup"
     POKEAPI_LIST_URL = "https://pokeapi.co/api/v2/type"
 
     def handle(self, *args, **options):
-        resp = requests.get(self.POKEAPI_LIST_URL)
+        TypeGroup = apps.get_model(app_label="pokemon", model_name="TypeGroup")
+
+        resp = self.pokeapi.get(self.POKEAPI_LIST_URL)
         if resp.status_code != 200:
-            self.stderr.write(
-                self.style.ERROR(
-                    f"Error fetching PokeAPI types list: {resp.content}"
-                )
+            raise CommandError(
+                f"Error fetching PokeAPI types list: {resp.content}"
             )
-            return
 
         data = resp.json().get("results", [])
         total, created = 0, 0
@@ -38,6 +34,7 @@ class Command(BaseCommand):
             if is_new:
                 created += 1
 
+        self.stdout.write(self.pokeapi.describe())
         self.stdout.write(self.style.SUCCESS(
             f"Sync finished: {total} types visited, {created} created."
         ))
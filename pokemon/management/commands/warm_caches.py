@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from pokemon.cache import (
+    catalog_version, pokemon_list, pokemon_numbers_by_name,
+    type_ids_by_name, user_type_context
+)
+from pokemon.catalog import get_catalog
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Preload the type catalog, the name → number resolver and the "
+        "Pokémon lists of the most recently active users"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=100,
+            help="Number of users whose Pokémon list is preloaded."
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{len(type_ids_by_name())} types loaded")
+        self.stdout.write(f"{len(pokemon_numbers_by_name())} names loaded")
+        catalog = get_catalog(version=catalog_version())
+        self.stdout.write(f"{len(catalog.records)} Pokémon in catalog")
+
+        users = (
+            User.objects
+            .filter(usertype__isnull=False)
+            .distinct()
+            .order_by("-last_login", "-date_joined")[:options["users"]]
+        )
+        type_sets = set()
+        for user in users:
+            context = user_type_context(user=user)
+            if context["user_type_mask"] not in type_sets:
+                type_sets.add(context["user_type_mask"])
+                pokemon_list(context=context)
+        self.stdout.write(f"{len(type_sets)} Pokémon lists loaded")
+
+        backend = caches["default"]
+        if hasattr(backend, "stats"):
+            self.stdout.write(f"Cache stats: {backend.stats()}")
+        self.stdout.write(self.style.SUCCESS("Caches warmed."))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:14
+
+from django.db import migrations, models
+
+
+def fill_type_masks(apps, schema_editor):
+    Pokemon = apps.get_model("pokemon", "Pokemon")
+    PokemonType = apps.get_model("pokemon", "PokemonType")
+
+    masks = {}
+    for pokemon_id, type_group_id in PokemonType.objects.values_list(
+        "pokemon_id", "type_group_id"
+    ):
+        # Ids beyond the 62 bits of the mask are given lower ones, and the
+        # masks computed again, by 0009_dense_type_group_ids.
+        if type_group_id > 62:
+            continue
+        masks[pokemon_id] = masks.get(pokemon_id, 0) | 1 << type_group_id
+
+    pokemons = list(Pokemon.objects.filter(pk__in=masks))
+    for pokemon in pokemons:
+        pokemon.type_mask = masks[pokemon.pk]
+    Pokemon.objects.bulk_update(pokemons, fields=["type_mask"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemon',
+            name='type_mask',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(
+            code=fill_type_masks,
+            reverse_code=migrations.RunPython.noop
+        ),
+    ]
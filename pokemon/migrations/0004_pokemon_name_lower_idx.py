@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:23
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0003_pokemon_type_mask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pokemon',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='pokemon_name_lower_idx'),
+        ),
+    ]
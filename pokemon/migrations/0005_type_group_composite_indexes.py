@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0004_pokemon_name_lower_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pokemontype',
+            index=models.Index(fields=['type_group', 'pokemon'], name='pokemontype_type_pokemon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usertype',
+            index=models.Index(fields=['type_group', 'user'], name='usertype_type_group_user_idx'),
+        ),
+    ]
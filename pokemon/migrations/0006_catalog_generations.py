@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0005_type_group_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StagedPokemon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('type_mask', models.BigIntegerField(blank=True, null=True)),
+                ('generation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pokemon.cataloggeneration')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('generation', 'number'), name='unique_generation_number')],
+            },
+        ),
+    ]
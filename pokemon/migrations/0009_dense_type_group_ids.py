@@ -0,0 +1,68 @@
+from uuid import uuid4
+
+from django.db import migrations
+
+# pokemon.typemasks.MAX_TYPE_ID, as of this migration.
+MAX_TYPE_ID = 62
+
+
+def renumber_type_groups(apps, schema_editor):
+    """Give the TypeGroups whose id does not fit in Pokemon.type_mask the
+    lowest free ids, then compute the masks again."""
+    TypeGroup = apps.get_model("pokemon", "TypeGroup")
+    PokemonType = apps.get_model("pokemon", "PokemonType")
+    UserType = apps.get_model("pokemon", "UserType")
+    Pokemon = apps.get_model("pokemon", "Pokemon")
+    CatalogChange = apps.get_model("pokemon", "CatalogChange")
+    CatalogVersion = apps.get_model("pokemon", "CatalogVersion")
+
+    ids = list(TypeGroup.objects.order_by("id").values_list("id", flat=True))
+    too_large = [type_id for type_id in ids if type_id > MAX_TYPE_ID]
+    if not too_large:
+        return
+    free = [
+        type_id for type_id in range(1, MAX_TYPE_ID + 1) if type_id not in ids
+    ]
+    if len(free) < len(too_large):
+        raise ValueError(
+            f"{len(ids)} TypeGroups do not fit in a type mask of"
+            f" {MAX_TYPE_ID} bits"
+        )
+    # The foreign keys are checked at the end of the transaction.
+    for old_id, new_id in zip(too_large, free):
+        TypeGroup.objects.filter(id=old_id).update(id=new_id)
+        PokemonType.objects.filter(type_group_id=old_id).update(
+            type_group_id=new_id
+        )
+        UserType.objects.filter(type_group_id=old_id).update(
+            type_group_id=new_id
+        )
+
+    masks = {}
+    for pokemon_id, type_group_id in PokemonType.objects.values_list(
+        "pokemon_id", "type_group_id"
+    ):
+        masks[pokemon_id] = masks.get(pokemon_id, 0) | 1 << type_group_id
+    pokemons = list(Pokemon.objects.only("id", "type_mask"))
+    for pokemon in pokemons:
+        pokemon.type_mask = masks.get(pokemon.pk, 0)
+    Pokemon.objects.bulk_update(pokemons, fields=["type_mask"], batch_size=500)
+
+    # The logged masks and the cached catalogs have the old bits: clients
+    # get the full list again, and processes load the catalog again.
+    CatalogChange.objects.all().delete()
+    CatalogVersion.objects.update(token=uuid4().hex)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0008_catalog_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            code=renumber_type_groups,
+            reverse_code=migrations.RunPython.noop
+        ),
+    ]
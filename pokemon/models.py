@@ -3,11 +3,14 @@ from django.db.models import Index
 from django.db.models.base import Model
 from django.db.models.constraints import UniqueConstraint
 from django.db.models.deletion import CASCADE
-from django.db.models.fields import CharField, PositiveIntegerField
+from django.db.models.fields import (
+    BigIntegerField, CharField, DateTimeField, PositiveIntegerField)
 from django.db.models.fields.related import ForeignKey
+from django.db.models.functions import Lower
 
 from pokemon.managers import PokemonManager
 from pokemon.querysets import PokemonQuerySet
+from pokemon.typemasks import MAX_TYPE_ID, free_type_id
 
 
 class NamedModel(Model):
@@ -16,19 +19,38 @@ class NamedModel(Model):
     class Meta:
         abstract = True
 
+    def __str__(self):
+        return self.name
+
 
 class TypeGroup(NamedModel):
-    pass
+    def save(self, *args, **kwargs):
+        """A new TypeGroup takes the lowest free id, its bit in
+        Pokemon.type_mask (see pokemon.typemasks)."""
+        if self._state.adding:
+            if self.pk is None:
+                self.pk = free_type_id(using=kwargs.get("using") or "default")
+            elif not 0 <= self.pk <= MAX_TYPE_ID:
+                raise ValueError(
+                    f"TypeGroup id {self.pk} does not fit in a type mask"
+                )
+            # Never an UPDATE of the TypeGroup of that id.
+            kwargs["force_insert"] = True
+        super().save(*args, **kwargs)
 
 
 class Pokemon(NamedModel):
     number = PositiveIntegerField(unique=True)
+    # Bit n is set when the Pokémon has the TypeGroup of id n,
+    # kept in sync by pokemon.signals and sync_pokemon_types.
+    type_mask = BigIntegerField(default=0)
 
     objects = PokemonManager.from_queryset(queryset_class=PokemonQuerySet)()
 
     class Meta:
         indexes: list[Index] = [
-            Index(fields=["number"], name="pokemon_number_idx")
+            Index(fields=["number"], name="pokemon_number_idx"),
+            Index(Lower("name"), name="pokemon_name_lower_idx")
         ]
 
 
@@ -49,6 +71,14 @@ class UserType(Model):
                 name="unique_user_type_group"
             )
         ]
+        # for_user joins type_group -> usertype.user: the unique
+        # constraint index starts with user, this one covers the join.
+        indexes: list[Index] = [
+            Index(
+                fields=["type_group", "user"],
+                name="usertype_type_group_user_idx"
+            )
+        ]
 
 
 class PokemonType(Model):
@@ -68,3 +98,59 @@ class PokemonType(Model):
                 name="unique_pokemon_type"
             )
         ]
+        # for_user and for_type_groups go from type_group to pokemon.
+        indexes: list[Index] = [
+            Index(
+                fields=["type_group", "pokemon"],
+                name="pokemontype_type_pokemon_idx"
+            )
+        ]
+
+
+class CatalogGeneration(Model):
+    """Catalog written by a sync (see pokemon.generations): staged while
+    the sync runs, then published at once into Pokemon and PokemonType."""
+    created_at = DateTimeField(auto_now_add=True)
+    published_at = DateTimeField(null=True, blank=True)
+
+
+class StagedPokemon(Model):
+    generation = ForeignKey(
+        "pokemon.CatalogGeneration",
+        on_delete=CASCADE
+    )
+    number = PositiveIntegerField()
+    name = CharField(max_length=255)
+    # None until the types of the Pokémon are staged: publishing then
+    # keeps its current types.
+    type_mask = BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints: list[UniqueConstraint] = [
+            UniqueConstraint(
+                fields=["generation", "number"],
+                name="unique_generation_number"
+            )
+        ]
+
+
+class CatalogChange(Model):
+    """Entry of the change log of GET /api/pokemon/?since= (see
+    pokemon.changes), its id being the version clients send back. Either
+    the type_mask (or the name) of the Pokémon `number` changed, or the
+    type mask of the types of `user`."""
+    number = PositiveIntegerField(null=True, blank=True)
+    user = ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=CASCADE
+    )
+    old_mask = BigIntegerField()
+    new_mask = BigIntegerField()
+
+
+class CatalogVersion(Model):
+    """Single row whose token changes with every catalog write, in the
+    transaction of the write (see pokemon.cache.catalog_version)."""
+    token = CharField(max_length=32)
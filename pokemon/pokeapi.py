@@ -0,0 +1,209 @@
+"""PokeAPI access of the sync commands, through a durable response cache.
+
+Successful responses are stored in a SQLite file (POKEAPI_CACHE_PATH)
+keyed by a digest of their URL, reused for POKEAPI_CACHE_TTL seconds,
+and evicted least recently used first once they take more than
+POKEAPI_CACHE_MAX_SIZE bytes. sync_pokemons and sync_pokemon_types read
+the same detail pages: the second command reads them from the cache.
+Offline, only the cache is read, whatever the age of its entries."""
+import json
+import sqlite3
+from collections import Counter
+from hashlib import sha256
+from threading import Lock
+from time import time
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+
+TIMEOUT = 30
+
+# A full cache is evicted down to this share of its maximal size: it is
+# scanned once every few stored responses rather than on each one.
+EVICT_TO = 0.9
+
+
+class PokeAPIResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ResponseCache:
+    """Response bodies by URL, shared by the threads and processes of
+    the sync."""
+
+    def __init__(self, path, ttl, max_size):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = Lock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, timeout=TIMEOUT, check_same_thread=False,
+                isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # REPLACE fires the delete trigger below.
+            self._connection.execute("PRAGMA recursive_triggers=ON")
+            # The total size of the responses is kept in response_size
+            # by triggers, for every process using the file: a response
+            # is stored without summing the sizes of the others.
+            self._connection.executescript(
+                "BEGIN IMMEDIATE;"
+                "CREATE TABLE IF NOT EXISTS response ("
+                " key TEXT PRIMARY KEY, url TEXT NOT NULL,"
+                " body BLOB NOT NULL, size INTEGER NOT NULL,"
+                " fetched_at REAL NOT NULL, used_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS response_used_at"
+                " ON response (used_at);"
+                "CREATE TABLE IF NOT EXISTS response_size ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1),"
+                " total INTEGER NOT NULL);"
+                "INSERT OR IGNORE INTO response_size"
+                " SELECT 1, COALESCE(SUM(size), 0) FROM response;"
+                "CREATE TRIGGER IF NOT EXISTS response_inserted"
+                " AFTER INSERT ON response BEGIN"
+                " UPDATE response_size SET total = total + NEW.size; END;"
+                "CREATE TRIGGER IF NOT EXISTS response_deleted"
+                " AFTER DELETE ON response BEGIN"
+                " UPDATE response_size SET total = total - OLD.size; END;"
+                "COMMIT;"
+            )
+        return self._connection
+
+    @staticmethod
+    def key(url):
+        return sha256(url.encode()).hexdigest()
+
+    def get(self, url, max_age=None):
+        """Body cached for `url`, if fetched less than `max_age` seconds
+        ago (POKEAPI_CACHE_TTL by default, any age when 0)."""
+        max_age = self.ttl if max_age is None else max_age
+        now = time()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT body, fetched_at FROM response WHERE key = ?",
+                (self.key(url),)
+            ).fetchone()
+            if row is None or max_age and row[1] < now - max_age:
+                return None
+            self.connection.execute(
+                "UPDATE response SET used_at = ? WHERE key = ?",
+                (now, self.key(url))
+            )
+        return row[0]
+
+    def set(self, url, body):
+        now = time()
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO response"
+                " (key, url, body, size, fetched_at, used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(url), url, body, len(body), now, now)
+            )
+            if self.size() > self.max_size:
+                self.evict(to_size=int(self.max_size * EVICT_TO))
+
+    def size(self):
+        """Total size of the responses, in bytes."""
+        (total,), = self.connection.execute(
+            "SELECT total FROM response_size"
+        )
+        return total
+
+    def evict(self, to_size):
+        """Delete the least recently used responses past `to_size` bytes.
+        """
+        self.connection.execute(
+            "DELETE FROM response WHERE key IN ("
+            " SELECT key FROM ("
+            "  SELECT key, SUM(size) OVER (ORDER BY used_at DESC, key)"
+            "  AS total FROM response"
+            " ) WHERE total > ?"
+            ")",
+            (to_size,)
+        )
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class PokeAPIClient:
+    """GET PokeAPI URLs, from the cache when possible. `stats` counts
+    "cached" and "fetched" responses."""
+
+    def __init__(self, cache=None, offline=False):
+        if offline and cache is None:
+            raise CommandError("Offline sync needs POKEAPI_CACHE_PATH.")
+        self.cache = cache
+        self.offline = offline
+        self.stats = Counter()
+
+    def get(self, url):
+        if self.cache is not None:
+            body = self.cache.get(url, max_age=0 if self.offline else None)
+            if body is not None:
+                self.stats["cached"] += 1
+                return PokeAPIResponse(status_code=200, content=body)
+        if self.offline:
+            raise CommandError(f"{url} is not in the PokeAPI cache.")
+
+        import requests
+
+        response = requests.get(url, timeout=TIMEOUT)
+        self.stats["fetched"] += 1
+        if response.status_code == 200 and self.cache is not None:
+            self.cache.set(url, response.content)
+        return PokeAPIResponse(
+            status_code=response.status_code, content=response.content
+        )
+
+    def describe(self):
+        return (
+            f"PokeAPI: {self.stats['fetched']} fetched, "
+            f"{self.stats['cached']} from cache."
+        )
+
+
+def pokeapi_client(offline=False):
+    """Client using the cache of the POKEAPI_CACHE_* settings, if any."""
+    cache = None
+    if settings.POKEAPI_CACHE_PATH:
+        cache = ResponseCache(
+            path=settings.POKEAPI_CACHE_PATH,
+            ttl=settings.POKEAPI_CACHE_TTL,
+            max_size=settings.POKEAPI_CACHE_MAX_SIZE
+        )
+    return PokeAPIClient(cache=cache, offline=offline)
+
+
+class PokeAPICommandMixin:
+    """Management command reading PokeAPI through `self.pokeapi`."""
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--offline", action="store_true",
+            help="Only read the PokeAPI responses cached by previous syncs"
+        )
+
+    def execute(self, *args, **options):
+        self.pokeapi = pokeapi_client(offline=options.get("offline", False))
+        try:
+            return super().execute(*args, **options)
+        finally:
+            if self.pokeapi.cache is not None:
+                self.pokeapi.cache.close()
@@ -1,39 +1,84 @@
-from django.db.models import Prefetch, Q
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.db.models.query import QuerySet
 
 
+# Largest Pokemon.number (a PositiveIntegerField) on every backend:
+# larger numbers match no Pokémon, and overflow the database integers.
+MAX_NUMBER = 2 ** 31 - 1
+
+
+def split_identifiers(identifiers):
+    """({numbers}, {lowercase names}) of Pokémon identifiers, numbers
+    above MAX_NUMBER left out."""
+    numbers, names = set(), set()
+    for identifier in identifiers:
+        if identifier.isdecimal():
+            if int(identifier) <= MAX_NUMBER:
+                numbers.add(int(identifier))
+        else:
+            names.add(identifier.lower())
+    return numbers, names
+
+
 class PokemonQuerySet(QuerySet):
-    def by_identifier(self, identifier):
-        if identifier.isdigit():
+    def by_identifier(self, identifier, numbers_by_name=None):
+        """`numbers_by_name` ({lowercase name: number}, see
+        pokemon.cache.pokemon_numbers_by_name) turns a lookup by name
+        into an indexed lookup by number."""
+        if identifier.isdecimal():
             lookup = Q(number=int(identifier))
+        elif numbers_by_name is not None:
+            number = numbers_by_name.get(identifier.lower())
+            if number is None:
+                return self.none()
+            lookup = Q(number=number)
         else:
-            lookup = Q(name__iexact=identifier)
+            return self.alias(name_lower=Lower("name")).filter(
+                name_lower=identifier.lower()
+            )
         return self.filter(lookup)
 
+    def by_identifiers(self, identifiers):
+        """Many numbers and names (case-insensitive) in one query:
+        number IN (...) OR LOWER(name) IN (...), both indexed."""
+        numbers, names = split_identifiers(identifiers=identifiers)
+        return self.alias(name_lower=Lower("name")).filter(
+            Q(number__in=numbers) | Q(name_lower__in=names)
+        )
+
+    def name_startswith(self, prefix):
+        """Case-insensitive prefix, written as a range on LOWER(name) so
+        that it uses the pokemon_name_lower_idx index on SQLite, whose
+        LIKE 'prefix%' does not.
+
+        The range relies on the binary order of SQLite's text: every name
+        starting with `prefix` sorts between `prefix` and prefix +
+        U+10FFFF. On PostgreSQL with a non "C" collation that does not
+        hold, the range may miss names and skip the index: the index and
+        the comparison would need a "C" collation (or text_pattern_ops
+        for LIKE) there."""
+        prefix = prefix.lower()
+        return self.alias(name_lower=Lower("name")).filter(
+            name_lower__gte=prefix, name_lower__lt=prefix + "\U0010ffff"
+        )
+
     def for_user(self, user):
         """As a fist optimiation solution, we use JOIN + DISTINCT.
         If real performance issues arise, other optimiations should be
         considered, such as using IN (Subquery), annotate + exists or
-        annotate + (array/json) aggregate (SGBD specific solutions)."""
-        return self._for_user(user=user)._prefetch_user_types(user=user)
+        annotate + (array/json) aggregate (SGBD specific solutions).
 
-    def _for_user(self, user):
+        Types are not fetched: they are read from Pokemon.type_mask,
+        filtered by the user's types (see PokemonWithTypesSerialier)."""
         return self.filter(
             pokemontype__type_group__usertype__user=user
         ).distinct()
 
-    def _prefetch_user_types(self, user):
-        from pokemon.models import PokemonType
-
-        user_types = (
-            PokemonType.objects
-            .select_related("type_group")
-            .filter(type_group__usertype__user=user)
-        )
-        return self.prefetch_related(
-            Prefetch(
-                lookup="pokemontype_set",
-                queryset=user_types,
-                to_attr="user_filtered_types"
-            )
-        )
+    def for_type_groups(self, type_group_ids):
+        """Same rows as for_user for a user having these types, without
+        joining UserType: the result can be shared by every user
+        subscribed to the same set of types."""
+        return self.filter(
+            pokemontype__type_group_id__in=type_group_ids
+        ).distinct()
@@ -0,0 +1,75 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+
+class NDJSONRenderer(BaseRenderer):
+    """One JSON document per line, so that consumers can parse
+    the list row by row instead of loading it as a whole."""
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        return b"".join(
+            json.dumps(
+                row, ensure_ascii=False, separators=(",", ":")
+            ).encode() + b"\n"
+            for row in rows
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, use_bin_type=True)
+
+
+def to_columnar(rows):
+    """Turn a list of {"number", "name", "types"} rows into parallel
+    arrays, with type names interned as small integer ids:
+
+        {
+            "type_names": ["fire", "water"],
+            "numbers": [4, 7],
+            "names": ["charmander", "squirtle"],
+            "types": [[0], [1]]
+        }
+    """
+    type_ids = {}
+    numbers, names, types = [], [], []
+    for row in rows:
+        numbers.append(row["number"])
+        names.append(row["name"])
+        types.append([
+            type_ids.setdefault(type_name, len(type_ids))
+            for type_name in row["types"]
+        ])
+    return {
+        "type_names": list(type_ids),
+        "numbers": numbers,
+        "names": names,
+        "types": types
+    }
+
+
+POKEMON_RENDERER_CLASSES = [
+    *api_settings.DEFAULT_RENDERER_CLASSES,
+    NDJSONRenderer,
+    *([MessagePackRenderer] if msgpack is not None else [])
+]
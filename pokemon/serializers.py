@@ -1,8 +1,11 @@
 from django.contrib.auth import get_user_model
 from rest_framework.serializers import (
-    ModelSerializer, SerializerMethodField)
+    CharField, ListField, ModelSerializer,
+    Serializer, SerializerMethodField
+)
 
 from pokemon.models import Pokemon, TypeGroup, UserType
+from pokemon.typemasks import type_ids
 
 
 User = get_user_model()
@@ -28,6 +31,9 @@ class UserTypeOutputSerializer(ModelSerializer):
 
 
 class PokemonWithTypesSerialier(ModelSerializer):
+    """When "user_type_names" ({type_group_id: name}) and "user_type_mask"
+    are in the context, types are restricted to the user's ones and
+    computed from Pokemon.type_mask without any query."""
     types = SerializerMethodField()
 
     class Meta:
@@ -35,10 +41,22 @@ class PokemonWithTypesSerialier(ModelSerializer):
         fields = ["number", "name", "types"]
 
     def get_types(self, obj):
+        user_type_names = self.context.get("user_type_names")
+        if user_type_names is None:
+            return [
+                pokemon_type.type_group.name
+                for pokemon_type in obj.pokemontype_set.all()
+            ]
+
         return [
-            pokemon_type.type_group.name
-            for pokemon_type in getattr(
-                obj, "user_filtered_types",
-                obj.pokemontype_set.all()
+            user_type_names[type_id]
+            for type_id in type_ids(
+                mask=obj.type_mask & self.context["user_type_mask"]
             )
         ]
+
+
+class PokemonBulkRetrieveInputSerializer(Serializer):
+    identifiers = ListField(
+        child=CharField(), allow_empty=False, max_length=1000
+    )
@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+from threading import local
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from main.replicas import pin_to_primary
+from pokemon.cache import bump_catalog_version
+from pokemon.changes import log_pokemon_changes, log_user_types
+from pokemon.models import Pokemon, PokemonType, TypeGroup, UserType
+from pokemon.typemasks import refresh_type_masks, type_mask
+
+
+_state = local()
+
+
+@contextmanager
+def muted():
+    """Skip the receivers below in this thread, for writers maintaining
+    type_mask and the catalog version themselves (see
+    pokemon.generations.publish)."""
+    _state.muted = True
+    try:
+        yield
+    finally:
+        _state.muted = False
+
+
+def is_muted():
+    return getattr(_state, "muted", False)
+
+
+@receiver(signal=post_save, sender=PokemonType)
+@receiver(signal=post_delete, sender=PokemonType)
+def refresh_pokemon_type_mask(sender, instance, **kwargs):
+    if is_muted():
+        return
+    refresh_type_masks(pokemon_ids=[instance.pokemon_id])
+
+
+@receiver(signal=pre_save, sender=Pokemon)
+def remember_pokemon(sender, instance, raw=False, **kwargs):
+    if is_muted() or raw or instance.pk is None:
+        return
+    instance._saved_row = Pokemon.objects.filter(pk=instance.pk).values_list(
+        "number", "name", "type_mask"
+    ).first()
+
+
+@receiver(signal=post_save, sender=Pokemon)
+def pokemon_saved(sender, instance, raw=False, **kwargs):
+    """Log a Pokémon saved with another number, name or type_mask for
+    GET /api/pokemon/?since= (see pokemon.changes), in the transaction of
+    the new catalog version."""
+    if is_muted():
+        return
+    row = instance.__dict__.pop("_saved_row", None)
+    if raw:
+        bump_catalog_version()
+        return
+    if row == (instance.number, instance.name, instance.type_mask):
+        return
+    changes = [(instance.number, 0, instance.type_mask)]
+    if row is not None:
+        number, _, old_mask = row
+        if number == instance.number:
+            changes = [(instance.number, old_mask, instance.type_mask)]
+        else:
+            changes.append((number, old_mask, 0))
+    with transaction.atomic():
+        log_pokemon_changes(changes=changes)
+        bump_catalog_version()
+
+
+@receiver(signal=post_delete, sender=Pokemon)
+def pokemon_deleted(sender, instance, **kwargs):
+    if is_muted():
+        return
+    with transaction.atomic():
+        log_pokemon_changes(
+            changes=[(instance.number, instance.type_mask, 0)]
+        )
+        bump_catalog_version()
+
+
+@receiver(signal=post_save, sender=PokemonType)
+@receiver(signal=post_delete, sender=PokemonType)
+@receiver(signal=post_save, sender=TypeGroup)
+@receiver(signal=post_delete, sender=TypeGroup)
+def catalog_changed(sender, **kwargs):
+    if is_muted():
+        return
+    bump_catalog_version()
+
+
+@receiver(signal=post_save, sender=UserType)
+@receiver(signal=post_delete, sender=UserType)
+def user_types_changed(sender, instance, created=False, **kwargs):
+    if is_muted() or kwargs["signal"] is post_save and not created:
+        return
+    pin_to_primary(user_id=instance.user_id)
+    # Types deleted along with their user: nobody to log them for.
+    origin = kwargs.get("origin")
+    if getattr(origin, "model", type(origin)) is get_user_model():
+        return
+    new_mask = type_mask(type_ids=UserType.objects.filter(
+        user_id=instance.user_id
+    ).values_list("type_group_id", flat=True))
+    bit = 1 << instance.type_group_id
+    log_user_types(
+        user_id=instance.user_id,
+        old_mask=new_mask & ~bit if created else new_mask | bit,
+        new_mask=new_mask
+    )
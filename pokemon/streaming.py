@@ -0,0 +1,58 @@
+import json
+
+from django.http import StreamingHttpResponse
+
+
+STREAM_CHUNK_SIZE = 500
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def iter_json_array(queryset, serializer_class, context=None,
+                    chunk_size=STREAM_CHUNK_SIZE):
+    """Yield a JSON array one element at a time.
+
+    `QuerySet.iterator(chunk_size=...)` fetches rows by chunks and runs
+    the prefetch lookups once per chunk, so only `chunk_size` model
+    instances are alive at any time whatever the size of the result."""
+    yield b"["
+    separator = b""
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        data = serializer_class(obj, context=context).data
+        yield separator + _dumps(data)
+        separator = b","
+    yield b"]"
+
+
+def iter_ndjson(queryset, serializer_class, context=None,
+                chunk_size=STREAM_CHUNK_SIZE):
+    """Yield one JSON document per line, as NDJSONRenderer renders
+    them."""
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield _dumps(serializer_class(obj, context=context).data) + b"\n"
+
+
+# Formats (renderer's format) which can be streamed: their iterator and
+# content type.
+STREAM_FORMATS = {
+    "json": (iter_json_array, "application/json"),
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+}
+
+
+def streaming_response(queryset, serializer_class, context=None,
+                       format="json", chunk_size=STREAM_CHUNK_SIZE):
+    """Response streaming `queryset` in one of the STREAM_FORMATS."""
+    iter_rows, content_type = STREAM_FORMATS[format]
+    return StreamingHttpResponse(
+        streaming_content=iter_rows(
+            queryset=queryset,
+            serializer_class=serializer_class,
+            context=context,
+            chunk_size=chunk_size
+        ),
+        content_type=content_type
+    )
+
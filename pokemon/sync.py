@@ -0,0 +1,178 @@
+"""Locking, checkpoints and progress of the synchronization with PokeAPI
+(see the sync_all management command)."""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import monotonic
+
+
+class SyncLocked(Exception):
+    pass
+
+
+@contextmanager
+def sync_lock(path):
+    """Exclusive lock on the file `path`, failing at once with SyncLocked
+    if another process holds it. The kernel releases it when the process
+    dies, so a crashed sync never leaves a stale lock behind."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise SyncLocked(f"Another sync holds {path}.") from None
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class Checkpoint:
+    """Step and offset reached by a sync, stored in a JSON file replaced
+    atomically, from which the next run resumes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.step = None
+        self.offset = 0
+
+    def load(self):
+        try:
+            state = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return
+        self.step, self.offset = state["step"], state["offset"]
+
+    def save(self, step, offset):
+        self.step, self.offset = step, offset
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f"{self.path.name}.tmp")
+        temporary.write_text(json.dumps({"step": step, "offset": offset}))
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+        self.step, self.offset = None, 0
+
+
+class ResumableSyncMixin:
+    """Management command synchronizing entries in a stable order: it
+    starts at `--offset` and calls `checkpoint` once the entries before
+    an offset are synchronized."""
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--offset", type=int, default=0)
+
+    def checkpoint(self, offset, total):
+        pass
+
+
+class Progress:
+    """Throughput and ETA of a step, written at most every `interval`
+    seconds."""
+
+    def __init__(self, write, step, start_offset=0, interval=5.0):
+        self.write = write
+        self.step = step
+        self.start_offset = start_offset
+        self.interval = interval
+        self.started = self.reported = monotonic()
+
+    def update(self, offset, total, force=False):
+        now = monotonic()
+        if not force and now - self.reported < self.interval:
+            return
+        self.reported = now
+        self.write(self.describe(offset=offset, total=total, now=now))
+
+    def describe(self, offset, total, now):
+        elapsed = now - self.started
+        rate = (offset - self.start_offset) / elapsed if elapsed else 0.0
+        line = f"{self.step}: {offset}/{total}, {rate:.1f}/s"
+        if rate and total > offset:
+            eta = timedelta(seconds=round((total - offset) / rate))
+            line += f", ETA {eta}"
+        return line
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+def pipeline(produce, process, concurrency, maxsize=100):
+    """Yield (item, process(item)) for the items of the `produce()`
+    iterable, in completion order. `produce` runs on a thread and
+    `process` on `concurrency` threads, connected by queues of `maxsize`
+    items: when the caller is slower than the fetches, they wait instead
+    of piling results up in memory. An exception raised by `produce` or
+    `process` is raised in the caller, and stops the threads."""
+    items = Queue(maxsize=maxsize)
+    results = Queue(maxsize=maxsize)
+    stop = Event()
+
+    def put(queue, value):
+        while not stop.is_set():
+            try:
+                queue.put(value, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def get(queue):
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return _DONE
+
+    def producer():
+        try:
+            for item in produce():
+                if not put(items, item):
+                    return
+        except BaseException as error:
+            put(results, _Failure(error=error))
+        finally:
+            for _ in range(concurrency):
+                put(items, _DONE)
+
+    def worker():
+        while (item := get(items)) is not _DONE:
+            try:
+                result = process(item)
+            except BaseException as error:
+                put(results, _Failure(error=error))
+                return
+            put(results, (item, result))
+        put(results, _DONE)
+
+    threads = [Thread(target=producer, daemon=True)] + [
+        Thread(target=worker, daemon=True) for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        running = concurrency
+        while running:
+            result = results.get()
+            if result is _DONE:
+                running -= 1
+            elif isinstance(result, _Failure):
+                raise result.error
+            else:
+                yield result
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
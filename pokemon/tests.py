@@ -1,4 +1,27 @@
+import asyncio
+import gc
+import gzip
+import json
+import os
+from importlib import import_module
+from io import StringIO
+from multiprocessing import get_context
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from urllib.parse import parse_qs, urlsplit
+from threading import Event, Thread
+from time import sleep, time
+from unittest import mock, skipIf, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
 from django.urls import reverse
 from rest_framework.authtoken.models import Token
 from rest_framework.status import (
@@ -7,12 +30,38 @@ from rest_framework.status import (
     HTTP_304_NOT_MODIFIED,
     HTTP_400_BAD_REQUEST,
     HTTP_401_UNAUTHORIZED,
-    HTTP_404_NOT_FOUND
+    HTTP_404_NOT_FOUND,
+    HTTP_406_NOT_ACCEPTABLE,
+    HTTP_429_TOO_MANY_REQUESTS,
+    HTTP_501_NOT_IMPLEMENTED
 )
 from rest_framework.test import APITestCase
 
+from main.middleware import COMPRESSORS, CompressionMiddleware
+from main.replicas import pin_key
+from main.wsgi import preload
+from pokemon.analytics import load_numpy
+from pokemon.cache import (
+    bump_catalog_version, catalog_version, get_or_compute,
+    pokemon_list_counter, pokemon_list_stats, type_ids_by_name
+)
+from pokemon.catalog import get_catalog
+from pokemon.changes import current_version
+from pokemon.generations import (
+    publish, stage_published, staging_generation)
 from pokemon.models import (
-    Pokemon, PokemonType, TypeGroup, UserType)
+    CatalogChange, CatalogGeneration, Pokemon, PokemonType, StagedPokemon,
+    TypeGroup, UserType
+)
+from pokemon.management.commands.sync_pokemons import (
+    Command as SyncPokemonsCommand)
+from pokemon.pokeapi import ResponseCache
+from pokemon.renderers import msgpack
+from pokemon.sync import sync_lock
+from pokemon.throttling import InMemoryBucketStore, bucket_store
+from pokemon.writebehind import (
+    Journal, UserTypeWriteBehind, user_type_write_behind)
+from pokemon.typemasks import type_ids, type_mask
 
 
 User = get_user_model()
@@ -172,6 +221,70 @@ class PokemonOfUserTypeListTests(APITestCase):
         resp = self.client.get(self.url)
         self.assertEqual(resp.status_code, HTTP_401_UNAUTHORIZED)
 
+    def test_stream_matches_regular_list(self):
+        expected = self.client.get(self.url).data
+
+        resp = self.client.get(self.url, {"stream": "true"})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertTrue(resp.streaming)
+        data = json.loads(b"".join(resp.streaming_content))
+        self.assertEqual(data, expected)
+
+    def test_stream_ndjson(self):
+        expected = self.client.get(self.url).data
+        resp = self.client.get(
+            self.url, {"stream": "true", "format": "ndjson"}
+        )
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_stream_ordering(self):
+        resp = self.client.get(
+            self.url, {"stream": "true", "ordering": "-number"}
+        )
+        data = json.loads(b"".join(resp.streaming_content))
+        self.assertEqual([p["number"] for p in data], [7, 4])
+
+    def test_stream_unsupported(self):
+        resp = self.client.get(
+            self.url, {"stream": "true", "layout": "columnar"}
+        )
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        if msgpack is not None:
+            resp = self.client.get(
+                self.url, {"stream": "true", "format": "msgpack"}
+            )
+            self.assertEqual(resp.status_code, HTTP_406_NOT_ACCEPTABLE)
+
+    def test_ndjson_one_pokemon_per_line(self):
+        resp = self.client.get(self.url, HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        lines = resp.content.decode().splitlines()
+        names = {json.loads(line)["name"] for line in lines}
+        self.assertSetEqual(names, {"charmander", "squirtle"})
+
+    @skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_format(self):
+        resp = self.client.get(self.url, {"format": "msgpack"})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        names = {p["name"] for p in msgpack.unpackb(resp.content)}
+        self.assertSetEqual(names, {"charmander", "squirtle"})
+
+    def test_columnar_layout(self):
+        resp = self.client.get(self.url, {"layout": "columnar"})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = resp.data
+        self.assertEqual(len(data["numbers"]), 2)
+        rows = {
+            name: [data["type_names"][i] for i in type_ids]
+            for name, type_ids in zip(data["names"], data["types"])
+        }
+        self.assertDictEqual(
+            rows, {"charmander": ["fire"], "squirtle": ["water"]}
+        )
+
 
 class PokemonDetailTests(APITestCase):
     def setUp(self):
@@ -243,7 +356,7 @@ class PokemonListWithFixturesTests(APITestCase):
         self.url = reverse(viewname="pokemon:of-user-type-list")
 
     def test_list_only_allowed_pokemons(self):
-        with self.assertNumQueries(num=3):
+        with self.assertNumQueries(num=4):
             resp = self.client.get(self.url)
         self.assertEqual(resp.status_code, HTTP_200_OK)
 
@@ -272,21 +385,21 @@ class PokemonDetailWithFixturesTests(APITestCase):
             viewname="pokemon:of-user-type-retrieve", args=[ident])
 
     def test_retrieve_by_id_allowed(self):
-        with self.assertNumQueries(num=3):
+        with self.assertNumQueries(num=4):
             resp = self.client.get(self.detail_url("4"))
         self.assertEqual(resp.status_code, HTTP_200_OK)
         self.assertEqual(resp.data["number"], 4)
         self.assertIn("fire", resp.data["types"])
 
     def test_retrieve_by_name_allowed(self):
-        with self.assertNumQueries(num=3):
+        with self.assertNumQueries(num=4):
             resp = self.client.get(self.detail_url("Squirtle"))
         self.assertEqual(resp.status_code, HTTP_200_OK)
         self.assertEqual(resp.data["name"], "squirtle")
         self.assertIn("water", resp.data["types"])
 
     def test_unallowed_returns_404(self):
-        with self.assertNumQueries(num=2):
+        with self.assertNumQueries(num=3):
             resp = self.client.get(self.detail_url("1"))
         self.assertEqual(resp.status_code, HTTP_404_NOT_FOUND)
 
@@ -294,3 +407,1604 @@ class PokemonDetailWithFixturesTests(APITestCase):
         self.client.credentials()
         resp = self.client.get(self.detail_url("4"))
         self.assertEqual(resp.status_code, HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=0)
+class PokemonListCompressionTests(APITestCase):
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.url = reverse(viewname="pokemon:of-user-type-list")
+
+    def test_gzip_when_accepted(self):
+        plain = self.client.get(self.url)
+        resp = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        self.assertEqual(gzip.decompress(resp.content), plain.content)
+
+    def test_compressed_body_is_reused(self):
+        self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        with mock.patch.dict(COMPRESSORS, {"gzip": mock.Mock()}):
+            resp = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+            COMPRESSORS["gzip"].assert_not_called()
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_per_user_bodies_not_cached(self):
+        for url, params in [
+            (reverse("registration:user-me"), {}),
+            (self.url, {"name": "char"}),
+        ]:
+            self.client.get(url, params, HTTP_ACCEPT_ENCODING="gzip")
+            with mock.patch.dict(
+                COMPRESSORS, {"gzip": mock.Mock(wraps=COMPRESSORS["gzip"])}
+            ):
+                self.client.get(url, params, HTTP_ACCEPT_ENCODING="gzip")
+                COMPRESSORS["gzip"].assert_called_once()
+
+    @override_settings(COMPRESSION_MIN_SIZE=10_000)
+    def test_small_body_not_compressed(self):
+        resp = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(resp.has_header("Content-Encoding"))
+
+    def test_stream_gzipped_when_zstd_preferred(self):
+        plain = b"".join(self.client.get(
+            self.url, {"stream": "true"}
+        ).streaming_content)
+        with mock.patch.dict(
+            COMPRESSORS, {"zstd": mock.Mock(), "gzip": COMPRESSORS["gzip"]},
+            clear=True
+        ):
+            resp = self.client.get(
+                self.url, {"stream": "true"}, HTTP_ACCEPT_ENCODING="zstd, gzip"
+            )
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(
+            gzip.decompress(b"".join(resp.streaming_content)), plain
+        )
+
+    def test_other_responses_gzipped_against_breach(self):
+        """Not cached, with random bytes: a secret of the page cannot be
+        guessed from the compressed length."""
+        body = b"<html>" + b"csrfmiddlewaretoken" * 100 + b"</html>"
+        middleware = CompressionMiddleware(
+            get_response=lambda request: HttpResponse(body)
+        )
+        request = RequestFactory().get(
+            "/", HTTP_ACCEPT_ENCODING="zstd, br, gzip"
+        )
+        lengths = set()
+        with mock.patch.dict(COMPRESSORS, {"gzip": mock.Mock()}):
+            for _ in range(5):
+                resp = middleware(request)
+                self.assertEqual(resp["Content-Encoding"], "gzip")
+                self.assertEqual(gzip.decompress(resp.content), body)
+                lengths.add(len(resp.content))
+            COMPRESSORS["gzip"].assert_not_called()
+        self.assertGreater(len(lengths), 1)
+
+
+class PokemonTypeMaskTests(APITestCase):
+    def setUp(self):
+        self.fire = TypeGroup.objects.create(name="fire")
+        self.flying = TypeGroup.objects.create(name="flying")
+        self.charizard = Pokemon.objects.create(number=6, name="charizard")
+
+    def test_mask_follows_pokemon_types(self):
+        PokemonType.objects.create(pokemon=self.charizard, type_group=self.fire)
+        flying = PokemonType.objects.create(
+            pokemon=self.charizard, type_group=self.flying
+        )
+        self.charizard.refresh_from_db()
+        self.assertEqual(
+            type_ids(mask=self.charizard.type_mask),
+            sorted([self.fire.id, self.flying.id])
+        )
+
+        flying.delete()
+        self.charizard.refresh_from_db()
+        self.assertEqual(type_ids(mask=self.charizard.type_mask), [self.fire.id])
+
+    def test_types_restricted_to_user_types(self):
+        PokemonType.objects.create(pokemon=self.charizard, type_group=self.fire)
+        PokemonType.objects.create(pokemon=self.charizard, type_group=self.flying)
+        user = User.objects.create_user(username="ash", password="pikachu")
+        UserType.objects.create(user=user, type_group=self.flying)
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        resp = self.client.get(reverse("pokemon:of-user-type-list"))
+        self.assertEqual(resp.data, [
+            {"number": 6, "name": "charizard", "types": ["flying"]}
+        ])
+
+    def test_check_type_masks_command(self):
+        PokemonType.objects.create(pokemon=self.charizard, type_group=self.fire)
+        Pokemon.objects.filter(pk=self.charizard.pk).update(type_mask=0)
+
+        with self.assertRaises(CommandError):
+            call_command("check_type_masks", stdout=StringIO())
+
+        call_command("check_type_masks", fix=True, stdout=StringIO())
+        self.charizard.refresh_from_db()
+        self.assertEqual(type_ids(mask=self.charizard.type_mask), [self.fire.id])
+
+    def test_ids_of_deleted_types_are_given_again(self):
+        # Enough churn to take a database sequence beyond 62.
+        for index in range(70):
+            TypeGroup.objects.create(name=f"shadow-{index}").delete()
+        dragon = TypeGroup.objects.create(name="dragon")
+        self.assertEqual(dragon.id, self.flying.id + 1)
+
+        PokemonType.objects.create(pokemon=self.charizard, type_group=dragon)
+        self.charizard.refresh_from_db()
+        self.assertEqual(type_ids(mask=self.charizard.type_mask), [dragon.id])
+
+    def test_id_beyond_type_mask_is_refused(self):
+        with self.assertRaises(ValueError):
+            TypeGroup.objects.create(id=63, name="shadow")
+
+    def test_migration_renumbers_ids_beyond_type_mask(self):
+        shadow, = TypeGroup.objects.bulk_create(
+            [TypeGroup(id=100, name="shadow")]
+        )
+        PokemonType.objects.bulk_create([
+            PokemonType(pokemon=self.charizard, type_group=self.fire),
+            PokemonType(pokemon=self.charizard, type_group=shadow),
+        ])
+
+        migration = import_module(
+            "pokemon.migrations.0009_dense_type_group_ids"
+        )
+        migration.renumber_type_groups(apps=apps, schema_editor=None)
+
+        shadow = TypeGroup.objects.get(name="shadow")
+        self.assertEqual(shadow.id, self.flying.id + 1)
+        self.charizard.refresh_from_db()
+        self.assertEqual(
+            type_ids(mask=self.charizard.type_mask),
+            [self.fire.id, shadow.id]
+        )
+
+
+class PokemonCacheTests(APITestCase):
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.list_url = reverse(viewname="pokemon:of-user-type-list")
+        self.detail_url = lambda ident: reverse(
+            viewname="pokemon:of-user-type-retrieve", args=[ident])
+
+    def test_cached_list_skips_pokemon_query(self):
+        self.client.get(self.list_url)
+        with self.assertNumQueries(num=3):
+            resp = self.client.get(self.list_url)
+        names = {p["name"] for p in resp.data}
+        self.assertEqual(names, {"charmander", "squirtle"})
+
+    def test_catalog_write_invalidates_list(self):
+        self.client.get(self.list_url)
+        PokemonType.objects.create(
+            pokemon=Pokemon.objects.get(name="bulbasaur"),
+            type_group=TypeGroup.objects.get(name="fire")
+        )
+        resp = self.client.get(self.list_url)
+        names = {p["name"] for p in resp.data}
+        self.assertEqual(names, {"bulbasaur", "charmander", "squirtle"})
+
+    def test_warm_caches(self):
+        call_command("warm_caches", stdout=StringIO())
+        with self.assertNumQueries(num=3):
+            self.client.get(self.list_url)
+        # Read from the in-memory catalog loaded by warm_caches.
+        with self.assertNumQueries(num=3):
+            resp = self.client.get(self.detail_url("SQUIRTLE"))
+        self.assertEqual(resp.data["number"], 7)
+        with self.assertNumQueries(num=2):
+            resp = self.client.get(self.detail_url("missingno"))
+        self.assertEqual(resp.status_code, HTTP_404_NOT_FOUND)
+
+    def test_version_shared_by_processes(self):
+        """A catalog write of another process, which has its own cache,
+        is seen at once."""
+        version = catalog_version()
+        self.assertNotIn("electric", type_ids_by_name())
+        with override_settings(CACHES={"default": {
+            "BACKEND": "main.cache.LocMemCache",
+            "LOCATION": "other-process",
+        }}):
+            TypeGroup.objects.create(name="electric")
+        self.assertNotEqual(catalog_version(), version)
+        resp = self.client.post(reverse(
+            viewname="pokemon:user-type-create", args=["electric"]
+        ))
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+
+    def test_stats_are_reported(self):
+        caches["default"].reset_stats()
+        self.client.get(self.list_url)
+        self.client.get(self.list_url)
+        stats = caches["default"].stats()
+        self.assertGreaterEqual(stats["hits"], 1)
+        self.assertGreaterEqual(stats["misses"], 1)
+
+    @override_settings(CACHES={"default": {
+        "BACKEND": "main.cache.LocMemCache",
+        "LOCATION": "eviction-test",
+        "OPTIONS": {"MAX_ENTRIES": 2, "CULL_FREQUENCY": 2},
+    }})
+    def test_evictions_are_counted(self):
+        backend = caches["default"]
+        for key in range(5):
+            backend.set(key, key)
+        self.assertGreater(backend.stats()["evictions"], 0)
+
+
+class GetOrComputeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        release = Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(timeout=5)
+            return "value"
+
+        results = []
+        threads = [
+            Thread(target=lambda: results.append(get_or_compute(
+                key="burst", compute=compute, timeout=60, stale_timeout=60
+            )))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 10)
+
+    def test_stale_entry_is_refreshed_by_one_caller(self):
+        cache.set("swr", ("stale", time() - 1, 0.0))
+
+        cache.add("swr:refresh", 1)
+        value = get_or_compute(
+            key="swr", compute=lambda: "fresh", timeout=60, stale_timeout=60
+        )
+        self.assertEqual(value, "stale")
+
+        cache.delete("swr:refresh")
+        value = get_or_compute(
+            key="swr", compute=lambda: "fresh", timeout=60, stale_timeout=60
+        )
+        self.assertEqual(value, "fresh")
+        self.assertEqual(cache.get("swr")[0], "fresh")
+
+
+class PokemonListByTypeSetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        fire = TypeGroup.objects.create(name="fire")
+        water = TypeGroup.objects.create(name="water")
+        charmander = Pokemon.objects.create(number=4, name="charmander")
+        PokemonType.objects.create(pokemon=charmander, type_group=fire)
+
+        self.tokens = []
+        for username, types in [
+            ("ash", [fire, water]), ("misty", [water, fire]), ("brock", [fire])
+        ]:
+            user = User.objects.create_user(username=username, password="x")
+            for type_group in types:
+                UserType.objects.create(user=user, type_group=type_group)
+            self.tokens.append(Token.objects.create(user=user).key)
+        self.url = reverse("pokemon:of-user-type-list")
+
+    def get(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        return self.client.get(self.url)
+
+    def test_same_type_set_shares_entry(self):
+        self.get(self.tokens[0])
+        with self.assertNumQueries(num=3):
+            resp = self.get(self.tokens[1])
+        self.assertEqual(resp.data, [
+            {"number": 4, "name": "charmander", "types": ["fire"]}
+        ])
+
+        # Another set of types, computed from the in-memory catalog.
+        with self.assertNumQueries(num=3):
+            resp = self.get(self.tokens[2])
+        self.assertEqual(resp.data, [
+            {"number": 4, "name": "charmander", "types": ["fire"]}
+        ])
+
+    def test_type_set_metrics(self):
+        pokemon_list_counter.clear()
+        for token in self.tokens:
+            self.get(token)
+        stats = pokemon_list_stats()
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["hits"], 1)
+        self.assertGreaterEqual(stats["live_type_sets"], 2)
+
+    def test_type_sets_of_previous_versions_are_dropped(self):
+        for token in self.tokens:
+            self.get(token)
+        Pokemon.objects.create(number=7, name="squirtle")
+        self.get(self.tokens[2])
+        self.assertEqual(pokemon_list_stats()["live_type_sets"], 1)
+
+    def test_type_sets_are_bounded(self):
+        with mock.patch("pokemon.cache.LIVE_TYPE_SETS_MAX", 1):
+            for token in self.tokens:
+                self.get(token)
+            self.assertEqual(pokemon_list_stats()["live_type_sets"], 1)
+
+    @override_settings(POKEMON_LIST_CACHE_TIMEOUT=0)
+    def test_expired_type_sets_are_dropped(self):
+        for token in self.tokens:
+            self.get(token)
+        self.assertEqual(pokemon_list_stats()["live_type_sets"], 0)
+
+
+class PokemonListFilterTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("pokemon:of-user-type-list")
+        user = User.objects.create_user(username="ash", password="pikachu")
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        fire = TypeGroup.objects.create(name="fire")
+        water = TypeGroup.objects.create(name="water")
+        dragon = TypeGroup.objects.create(name="dragon")
+        UserType.objects.create(user=user, type_group=fire)
+        UserType.objects.create(user=user, type_group=water)
+
+        for number, name, types in [
+            (4, "charmander", [fire]),
+            (5, "charmeleon", [fire]),
+            (6, "charizard", [fire, dragon]),
+            (7, "squirtle", [water]),
+            (149, "dragonite", [dragon]),
+        ]:
+            pokemon = Pokemon.objects.create(number=number, name=name)
+            for type_group in types:
+                PokemonType.objects.create(pokemon=pokemon, type_group=type_group)
+
+    def names(self, **params):
+        resp = self.client.get(self.url, params)
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        return [p["name"] for p in resp.data]
+
+    def test_name_prefix(self):
+        self.assertCountEqual(
+            self.names(name="CHARM"), ["charmander", "charmeleon"]
+        )
+
+    def test_number_range(self):
+        self.assertCountEqual(
+            self.names(number_min=5, number_max=7),
+            ["charmeleon", "charizard", "squirtle"]
+        )
+
+    def test_invalid_number_returns_400(self):
+        for value in ["five", "²"]:
+            resp = self.client.get(self.url, {"number_min": value})
+            self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_types_within_user_types(self):
+        self.assertCountEqual(self.names(types="water"), ["squirtle"])
+        self.assertEqual(self.names(types="dragon"), [])
+
+    def test_ordering(self):
+        self.assertEqual(
+            self.names(ordering="-number"),
+            ["squirtle", "charizard", "charmeleon", "charmander"]
+        )
+        self.assertEqual(
+            self.names(ordering="name", name="char"),
+            ["charizard", "charmander", "charmeleon"]
+        )
+
+
+class PokemonBulkRetrieveWithFixturesTests(APITestCase):
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.url = reverse(viewname="pokemon:of-user-type-bulk-retrieve")
+
+    def test_mixed_identifiers_in_one_query(self):
+        with self.assertNumQueries(num=3):
+            resp = self.client.post(
+                self.url,
+                {"identifiers": ["Charmander", 7, "1", "missingno"]},
+                format="json"
+            )
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertCountEqual(
+            [p["name"] for p in resp.data["found"]], ["charmander", "squirtle"]
+        )
+        self.assertEqual(resp.data["not_found"], ["1", "missingno"])
+
+    def test_non_ascii_digits_are_names(self):
+        resp = self.client.post(
+            self.url, {"identifiers": ["²", "4"]}, format="json"
+        )
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.data["not_found"], ["²"])
+
+    def test_numbers_too_large_are_not_found(self):
+        too_large = "99999999999999999999999"
+        resp = self.client.post(
+            self.url, {"identifiers": [too_large, "2147483648", "4"]},
+            format="json"
+        )
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(
+            [pokemon["number"] for pokemon in resp.data["found"]], [4]
+        )
+        self.assertEqual(resp.data["not_found"], [too_large, "2147483648"])
+
+    def test_empty_identifiers_returns_400(self):
+        resp = self.client.post(self.url, {"identifiers": []}, format="json")
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_unauthenticated_returns_401(self):
+        self.client.credentials()
+        resp = self.client.post(self.url, {"identifiers": ["4"]}, format="json")
+        self.assertEqual(resp.status_code, HTTP_401_UNAUTHORIZED)
+
+
+class ExplainQueriesTests(APITestCase):
+    fixtures = ["users", "typegroups"]
+
+    def test_prints_a_plan_per_query(self):
+        out = StringIO()
+        call_command("explain_queries", stdout=out)
+        for name in ["for_user", "by_identifier (name)", "UserMe type groups"]:
+            self.assertIn(name, out.getvalue())
+
+
+class PokemonCatalogTests(APITestCase):
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.detail_url = lambda ident: reverse(
+            viewname="pokemon:of-user-type-retrieve", args=[ident])
+
+    def test_catalog_indexes(self):
+        catalog = get_catalog(version=catalog_version())
+        self.assertEqual(
+            [record.number for record in catalog.records], [1, 4, 7]
+        )
+        self.assertEqual(catalog.get("Charmander").number, 4)
+        self.assertEqual(catalog.get("7").name, "squirtle")
+        self.assertIsNone(catalog.get("missingno"))
+        self.assertFalse(hasattr(catalog.get("4"), "__dict__"))
+
+    def test_catalog_reloaded_on_new_version(self):
+        catalog = get_catalog(version=catalog_version())
+        Pokemon.objects.create(number=25, name="pikachu")
+        self.assertIsNot(get_catalog(version=catalog_version()), catalog)
+        self.assertEqual(
+            get_catalog(version=catalog_version()).get("pikachu").number, 25
+        )
+
+    def test_catalog_reloaded_after_write_of_another_process(self):
+        self.assertEqual(self.client.get(self.detail_url("4")).status_code,
+                         HTTP_200_OK)
+        # A sync command, with its own cache.
+        with override_settings(CACHES={"default": {
+            "BACKEND": "main.cache.LocMemCache",
+            "LOCATION": "sync-process",
+        }}):
+            PokemonType.objects.create(
+                pokemon=Pokemon.objects.create(number=25, name="pikachu"),
+                type_group=TypeGroup.objects.get(name="fire")
+            )
+        resp = self.client.get(self.detail_url("pikachu"))
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        resp = self.client.get(reverse(viewname="pokemon:of-user-type-list"))
+        self.assertIn(25, [pokemon["number"] for pokemon in resp.data])
+
+    def test_retrieve_non_ascii_digits(self):
+        # From the database, then from the catalog.
+        for _ in range(2):
+            resp = self.client.get(self.detail_url("²"))
+            self.assertEqual(resp.status_code, HTTP_404_NOT_FOUND)
+            get_catalog(version=catalog_version())
+
+    def test_retrieve_from_catalog(self):
+        get_catalog(version=catalog_version())
+        with self.assertNumQueries(num=3):
+            resp = self.client.get(self.detail_url("4"))
+        self.assertEqual(
+            resp.data, {"number": 4, "name": "charmander", "types": ["fire"]}
+        )
+        with self.assertNumQueries(num=3):
+            resp = self.client.get(self.detail_url("bulbasaur"))
+        self.assertEqual(resp.status_code, HTTP_404_NOT_FOUND)
+
+    def test_preload(self):
+        # Closing the connection would end the test transaction.
+        with mock.patch("django.db.connections.close_all") as close_all:
+            try:
+                preload()
+                self.assertGreater(gc.get_freeze_count(), 0)
+            finally:
+                gc.unfreeze()
+        close_all.assert_called_once_with()
+        self.assertIsNotNone(
+            get_catalog(version=catalog_version(), load=False)
+        )
+        with self.assertNumQueries(num=3):
+            resp = self.client.get(self.detail_url("charmander"))
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+
+
+class FakePokeAPI:
+    """requests.get answering like PokeAPI, and failing on the details
+    of `fail_on` while it is set."""
+
+    def __init__(self, types, pokemons):
+        self.types = types
+        self.pokemons = pokemons
+        self.fail_on = None
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        if url.endswith("/type"):
+            data = {"results": [{"name": name} for name in self.types]}
+        elif "offset=" in url:
+            query = parse_qs(urlsplit(url).query)
+            limit, offset = int(query["limit"][0]), int(query["offset"][0])
+            page = list(self.pokemons)[offset:offset + limit]
+            data = {
+                "count": len(self.pokemons),
+                "next": "..." if offset + limit < len(self.pokemons) else None,
+                "results": [{"name": name} for name in page]
+            }
+        else:
+            name = url.rstrip("/").rpartition("/")[2]
+            if name == self.fail_on:
+                raise ConnectionError(name)
+            number, types = self.pokemons[name]
+            data = {
+                "id": number,
+                "types": [{"type": {"name": type}} for type in types]
+            }
+        return mock.Mock(status_code=200, content=json.dumps(data).encode())
+
+
+class InlineExecutor:
+    """ProcessPoolExecutor running its tasks in the test's process, which
+    sees the test database."""
+
+    def __init__(self, max_workers, **kwargs):
+        self.max_workers = max_workers
+        self.tasks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, *iterables):
+        self.tasks.extend(zip(*iterables))
+        return [fn(*args) for args in zip(*iterables)]
+
+
+class SyncAllTests(APITestCase):
+    def setUp(self):
+        self.state_dir = TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.enterContext(override_settings(
+            SYNC_STATE_DIR=Path(self.state_dir.name),
+            POKEAPI_CACHE_PATH=None
+        ))
+        self.api = FakePokeAPI(
+            types=["grass", "fire", "water"],
+            pokemons={
+                "bulbasaur": (1, ["grass"]),
+                "charmander": (4, ["fire"]),
+                "squirtle": (7, ["water"])
+            }
+        )
+        self.enterContext(mock.patch("requests.get", self.api.get))
+
+    def test_pipeline(self):
+        out = StringIO()
+        call_command("sync_all", stdout=out)
+        self.assertIn("Sync pipeline complete.", out.getvalue())
+        self.assertEqual(
+            dict(Pokemon.objects.values_list(
+                "name", "pokemontype__type_group__name"
+            )),
+            {"bulbasaur": "grass", "charmander": "fire", "squirtle": "water"}
+        )
+        self.assertFalse(
+            (Path(self.state_dir.name) / "checkpoint.json").exists()
+        )
+
+    @mock.patch.multiple(SyncPokemonsCommand, PAGE_SIZE=2, BATCH_SIZE=2)
+    def test_several_pages(self):
+        call_command("sync_types", stdout=StringIO())
+        call_command("sync_pokemons", concurrency=3, stdout=StringIO())
+        self.assertEqual(
+            list(Pokemon.objects.order_by("number").values_list(
+                "number", "type_mask"
+            )),
+            [
+                (number, type_mask(type_ids=[
+                    TypeGroup.objects.get(name=name).id
+                ]))
+                for number, name in [(1, "grass"), (4, "fire"), (7, "water")]
+            ]
+        )
+
+    @mock.patch.multiple(
+        SyncPokemonsCommand, PAGE_SIZE=1, BATCH_SIZE=1, CONCURRENCY=1
+    )
+    def test_resume_after_crash(self):
+        self.api.fail_on = "squirtle"
+        with self.assertRaises(ConnectionError):
+            call_command("sync_all", stdout=StringIO())
+        checkpoint = json.loads(
+            (Path(self.state_dir.name) / "checkpoint.json").read_text()
+        )
+        self.assertEqual(checkpoint, {"step": "sync_pokemons", "offset": 2})
+        self.assertFalse(Pokemon.objects.exists())
+
+        self.api.fail_on = None
+        self.api.urls.clear()
+        out = StringIO()
+        call_command("sync_all", stdout=out)
+        self.assertIn("Resuming at sync_pokemons, offset 2", out.getvalue())
+        self.assertEqual(self.api.urls, [
+            "https://pokeapi.co/api/v2/pokemon?limit=1&offset=2",
+            "https://pokeapi.co/api/v2/pokemon/squirtle/"
+        ])
+        self.assertEqual(Pokemon.objects.count(), 3)
+        self.assertEqual(
+            PokemonType.objects.filter(pokemon__name="squirtle").get()
+            .type_group.name,
+            "water"
+        )
+
+    @mock.patch.multiple(SyncPokemonsCommand, PAGE_SIZE=1, BATCH_SIZE=1)
+    def test_workers(self):
+        executors = []
+
+        def executor(**kwargs):
+            executors.append(InlineExecutor(**kwargs))
+            return executors[-1]
+
+        call_command("sync_types", stdout=StringIO())
+        out = StringIO()
+        with mock.patch(
+            "pokemon.management.commands.sync_pokemons.ProcessPoolExecutor",
+            executor
+        ), mock.patch("django.db.connections.close_all"):
+            call_command("sync_pokemons", workers=2, stdout=out)
+
+        generation = CatalogGeneration.objects.get()
+        self.assertEqual(
+            [task[1:3] for task in executors[0].tasks], [(0, 2), (2, 3)]
+        )
+        self.assertIn("PokeAPI: 7 fetched, 0 from cache.", out.getvalue())
+        self.assertIn("Pokemon sync: 3 created, 0 updated", out.getvalue())
+        self.assertEqual(
+            dict(Pokemon.objects.values_list(
+                "name", "pokemontype__type_group__name"
+            )),
+            {"bulbasaur": "grass", "charmander": "fire", "squirtle": "water"}
+        )
+        self.assertIsNotNone(generation.published_at)
+
+    def test_locked(self):
+        with sync_lock(path=Path(self.state_dir.name) / "sync.lock"):
+            with self.assertRaisesMessage(CommandError, "Another sync"):
+                call_command("sync_all", stdout=StringIO())
+        self.assertEqual(self.api.urls, [])
+
+
+class CatalogGenerationTests(APITestCase):
+    fixtures = [
+        "typegroups",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_published_at_once(self):
+        version = catalog_version()
+        generation = staging_generation()
+        stage_published(generation=generation)
+        generation.stagedpokemon_set.filter(number=4).update(
+            type_mask=type_mask(type_ids=[2])
+        )
+        StagedPokemon.objects.create(
+            generation=generation, number=25, name="pikachu", type_mask=0
+        )
+        self.assertFalse(Pokemon.objects.filter(number=25).exists())
+        self.assertEqual(catalog_version(), version)
+
+        with mock.patch(
+            "pokemon.signals.bump_catalog_version"
+        ) as signal_bump, mock.patch(
+            "pokemon.generations.bump_catalog_version",
+            wraps=bump_catalog_version
+        ) as bump:
+            published = publish(generation=generation)
+        bump.assert_called_once_with()
+        signal_bump.assert_not_called()
+        self.assertNotEqual(catalog_version(), version)
+
+        self.assertEqual(published, {
+            "created": 1, "updated": 1, "types_created": 1, "types_deleted": 1
+        })
+        charmander = Pokemon.objects.get(number=4)
+        self.assertEqual(
+            list(charmander.pokemontype_set.values_list(
+                "type_group__name", flat=True
+            )),
+            ["water"]
+        )
+        self.assertEqual(charmander.type_mask, type_mask(type_ids=[2]))
+        self.assertEqual(Pokemon.objects.get(number=25).name, "pikachu")
+        self.assertNotEqual(staging_generation(), generation)
+
+    def test_old_generations_collected(self):
+        generations = []
+        for _ in range(4):
+            generation = staging_generation()
+            stage_published(generation=generation)
+            publish(generation=generation)
+            generations.append(generation.pk)
+        self.assertEqual(
+            list(CatalogGeneration.objects.filter(
+                published_at__isnull=False
+            ).order_by("pk").values_list("pk", flat=True)),
+            generations[-2:]
+        )
+        self.assertEqual(
+            StagedPokemon.objects.exclude(
+                generation_id__in=generations[-2:]
+            ).count(),
+            0
+        )
+
+
+class PokemonEventsTests(APITestCase):
+    fixtures = [
+        "typegroups",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="ash", password="pika")
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+        UserType.objects.create(user=self.user, type_group_id=1)
+        self.url = reverse("pokemon:events")
+
+    async def next_event(self, events):
+        chunk = await asyncio.wait_for(anext(events), timeout=5)
+        lines = chunk.decode().splitlines()
+        return lines[0].removeprefix("event: "), json.loads(
+            lines[1].removeprefix("data: ")
+        )
+
+    async def test_unauthenticated_returns_401(self):
+        resp = await self.async_client.get(self.url)
+        self.assertEqual(resp.status_code, HTTP_401_UNAUTHORIZED)
+
+    def test_wsgi_returns_501(self):
+        resp = self.client.get(self.url, **self.auth)
+        self.assertEqual(resp.status_code, HTTP_501_NOT_IMPLEMENTED)
+
+    async def test_user_types_and_catalog_deltas(self):
+        resp = await self.async_client.get(
+            self.url, headers={"authorization": f"Token {self.token.key}"}
+        )
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        events = aiter(resp.streaming_content)
+        event, data = await self.next_event(events)
+        self.assertEqual(event, "ready")
+
+        await sync_to_async(self.client.post)(
+            reverse("pokemon:user-type-create", args=["water"]), **self.auth
+        )
+        event, data = await self.next_event(events)
+        self.assertEqual(event, "types")
+        self.assertEqual(data["types"], ["fire", "water"])
+        self.assertEqual((data["added"], data["removed"]), ([7], []))
+
+        await sync_to_async(self.client.delete)(
+            reverse("pokemon:user-type-destroy", args=["fire"]), **self.auth
+        )
+        event, data = await self.next_event(events)
+        self.assertEqual((data["added"], data["removed"]), ([], [4]))
+
+        def publish_catalog():
+            generation = staging_generation()
+            StagedPokemon.objects.create(
+                generation=generation, number=8, name="wartortle",
+                type_mask=type_mask(type_ids=[2])
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                publish(generation=generation)
+
+        await sync_to_async(publish_catalog)()
+        event, data = await self.next_event(events)
+        self.assertEqual(event, "catalog")
+        self.assertEqual((data["added"], data["removed"]), ([8], []))
+        await events.aclose()
+
+
+class PokemonListSinceTests(APITestCase):
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.url = reverse(viewname="pokemon:of-user-type-list")
+
+    def get_version(self):
+        resp = self.client.get(self.url, {"since": 0})
+        self.assertIsInstance(resp.data, list)
+        return resp["X-Pokemon-Version"]
+
+    def test_no_change(self):
+        version = self.get_version()
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(resp.data, {
+            "version": int(version), "added": [], "removed": [], "changed": []
+        })
+
+    def test_user_types_and_catalog_changes(self):
+        version = self.get_version()
+        self.client.delete(
+            reverse("pokemon:user-type-destroy", args=["fire"])
+        )
+        self.client.post(reverse("pokemon:user-type-create", args=["grass"]))
+        squirtle = Pokemon.objects.get(number=7)
+        PokemonType.objects.create(pokemon=squirtle, type_group_id=3)
+
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(resp.data["added"], [
+            {"number": 1, "name": "bulbasaur", "types": ["grass"]}
+        ])
+        self.assertEqual(resp.data["removed"], [4])
+        self.assertEqual(resp.data["changed"], [
+            {"number": 7, "name": "squirtle", "types": ["water", "grass"]}
+        ])
+        self.assertEqual(
+            resp["X-Pokemon-Version"], str(resp.data["version"])
+        )
+
+        resp = self.client.get(self.url, {"since": resp.data["version"]})
+        self.assertEqual(
+            (resp.data["added"], resp.data["removed"], resp.data["changed"]),
+            ([], [], [])
+        )
+
+    @override_settings(POKEMON_CHANGE_LOG_SIZE=2)
+    def test_version_older_than_log_returns_full_list(self):
+        version = self.get_version()
+        for type_name in ["grass", "fire", "grass"]:
+            self.client.post(
+                reverse("pokemon:user-type-create", args=[type_name])
+            )
+            self.client.delete(
+                reverse("pokemon:user-type-destroy", args=[type_name])
+            )
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual({p["number"] for p in resp.data}, {7})
+
+    def test_invalid_version_returns_full_list(self):
+        for since in ["abc", "²"]:
+            resp = self.client.get(self.url, {"since": since})
+            self.assertEqual({p["number"] for p in resp.data}, {4, 7})
+
+    def test_catalog_change_of_another_process(self):
+        version = self.get_version()
+        # A sync command, with its own cache.
+        with override_settings(CACHES={"default": {
+            "BACKEND": "main.cache.LocMemCache",
+            "LOCATION": "sync-process",
+        }}):
+            PokemonType.objects.create(
+                pokemon=Pokemon.objects.get(number=1), type_group_id=1
+            )
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(
+            [pokemon["number"] for pokemon in resp.data["added"]], [1]
+        )
+
+    def test_change_while_reading_is_sent_again(self):
+        version = self.get_version()
+
+        def current_version_then_change():
+            last = current_version()
+            PokemonType.objects.create(
+                pokemon=Pokemon.objects.get(number=1), type_group_id=1
+            )
+            return last
+
+        with mock.patch(
+            "pokemon.api_views.current_version",
+            side_effect=current_version_then_change
+        ):
+            resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(resp.data["version"], int(version))
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(
+            [pokemon["number"] for pokemon in resp.data["added"]], [1]
+        )
+
+    def test_deleted_pokemon_is_removed(self):
+        version = self.get_version()
+        Pokemon.objects.get(number=4).delete()
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(
+            (resp.data["added"], resp.data["removed"], resp.data["changed"]),
+            ([], [4], [])
+        )
+
+    def test_deleted_pokemon_is_removed_with_user_types_change(self):
+        version = self.get_version()
+        Pokemon.objects.get(number=4).delete()
+        self.client.post(reverse("pokemon:user-type-create", args=["grass"]))
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(resp.data["removed"], [4])
+        self.assertEqual(
+            [pokemon["number"] for pokemon in resp.data["added"]], [1]
+        )
+
+    def test_renamed_pokemon_is_changed(self):
+        version = self.get_version()
+        charmander = Pokemon.objects.get(number=4)
+        charmander.name = "hitokage"
+        charmander.save()
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(resp.data["changed"], [
+            {"number": 4, "name": "hitokage", "types": ["fire"]}
+        ])
+
+        resp = self.client.get(self.url, {"since": resp.data["version"]})
+        self.assertEqual(resp.data["changed"], [])
+
+    def test_saving_unchanged_pokemon_is_not_logged(self):
+        version = self.get_version()
+        Pokemon.objects.get(number=4).save()
+        resp = self.client.get(self.url, {"since": version})
+        self.assertEqual(resp.data["version"], int(version))
+
+    def test_deleting_user_with_types(self):
+        Token.objects.get(key="testtoken").user.delete()
+        self.assertFalse(UserType.objects.exists())
+        self.assertFalse(CatalogChange.objects.filter(
+            user__isnull=False
+        ).exists())
+
+
+class PokeAPICacheTests(APITestCase):
+    def setUp(self):
+        self.cache_dir = TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.cache_path = Path(self.cache_dir.name) / "pokeapi.sqlite3"
+        self.enterContext(override_settings(
+            SYNC_STATE_DIR=Path(self.cache_dir.name),
+            POKEAPI_CACHE_PATH=self.cache_path
+        ))
+        self.api = FakePokeAPI(
+            types=["grass", "fire", "water"],
+            pokemons={
+                "bulbasaur": (1, ["grass"]),
+                "charmander": (4, ["fire"]),
+                "squirtle": (7, ["water"])
+            }
+        )
+        self.enterContext(mock.patch("requests.get", self.api.get))
+
+    def test_details_fetched_once(self):
+        call_command("sync_all", stdout=StringIO())
+        self.assertEqual(len(self.api.urls), len(set(self.api.urls)))
+        self.assertEqual(len(self.api.urls), 5)
+
+    def test_offline(self):
+        call_command("sync_all", stdout=StringIO())
+        Pokemon.objects.all().delete()
+        self.api.urls.clear()
+        call_command("sync_all", offline=True, stdout=StringIO())
+        self.assertEqual(self.api.urls, [])
+        self.assertEqual(Pokemon.objects.count(), 3)
+
+    def test_offline_miss(self):
+        with self.assertRaisesMessage(CommandError, "not in the PokeAPI cache"):
+            call_command("sync_types", offline=True, stdout=StringIO())
+
+    def test_ttl(self):
+        cache = ResponseCache(path=self.cache_path, ttl=60, max_size=1000)
+        self.addCleanup(cache.close)
+        cache.set("https://pokeapi.co/a", b"a")
+        self.assertEqual(cache.get("https://pokeapi.co/a"), b"a")
+        with mock.patch("pokemon.pokeapi.time", return_value=time() + 61):
+            self.assertIsNone(cache.get("https://pokeapi.co/a"))
+            self.assertEqual(cache.get("https://pokeapi.co/a", max_age=0), b"a")
+
+    def test_eviction(self):
+        cache = ResponseCache(path=self.cache_path, ttl=60, max_size=10)
+        self.addCleanup(cache.close)
+        cache.set("https://pokeapi.co/a", b"aaaa")
+        cache.set("https://pokeapi.co/b", b"bbbb")
+        cache.get("https://pokeapi.co/a")
+        cache.set("https://pokeapi.co/c", b"cccc")
+        self.assertEqual(cache.get("https://pokeapi.co/a"), b"aaaa")
+        self.assertIsNone(cache.get("https://pokeapi.co/b"))
+        self.assertEqual(cache.get("https://pokeapi.co/c"), b"cccc")
+
+    def test_size_kept_without_eviction(self):
+        cache = ResponseCache(path=self.cache_path, ttl=60, max_size=10)
+        self.addCleanup(cache.close)
+        with mock.patch.object(cache, "evict") as evict:
+            cache.set("https://pokeapi.co/a", b"aaaa")
+            cache.set("https://pokeapi.co/b", b"bbbb")
+            cache.set("https://pokeapi.co/a", b"aa")
+        evict.assert_not_called()
+        self.assertEqual(cache.size(), 6)
+        cache.set("https://pokeapi.co/c", b"cccccc")
+        self.assertEqual(cache.size(), 8)
+        self.assertIsNone(cache.get("https://pokeapi.co/b"))
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates
+    })
+
+
+class ThrottleTests(APITestCase):
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        bucket_store().clear()
+        self.addCleanup(bucket_store().clear)
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.url = reverse(viewname="pokemon:of-user-type-list")
+
+    def log_in_other_user(self):
+        user = User.objects.create_user(username="misty", password="staryu")
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    @throttle_rates(read="2/min")
+    def test_per_user_burst(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.url).status_code, HTTP_200_OK)
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(resp["Retry-After"], "30")
+
+        self.log_in_other_user()
+        self.assertEqual(self.client.get(self.url).status_code, HTTP_200_OK)
+
+    @throttle_rates(read="10/min", read_global="3/min")
+    def test_global(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.url).status_code, HTTP_200_OK)
+        self.log_in_other_user()
+        self.assertEqual(self.client.get(self.url).status_code, HTTP_200_OK)
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, HTTP_429_TOO_MANY_REQUESTS)
+
+    @throttle_rates(read="5/min", read_global="20/min")
+    def test_throttled_requests_do_not_charge_global(self):
+        for _ in range(100):
+            self.client.get(self.url)
+        self.log_in_other_user()
+        self.assertEqual(self.client.get(self.url).status_code, HTTP_200_OK)
+
+    @throttle_rates(login="2/min", login_global="5/min")
+    def test_throttled_logins_do_not_charge_global(self):
+        self.client.credentials()
+        url = reverse("registration:login")
+        for _ in range(20):
+            self.client.post(url, {"username": "ash", "password": "x"})
+        resp = self.client.post(
+            url, {"username": "ash", "password": "x"},
+            REMOTE_ADDR="10.0.0.2"
+        )
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    @throttle_rates(read="1/min", write="1/min")
+    def test_scopes(self):
+        self.assertEqual(self.client.get(self.url).status_code, HTTP_200_OK)
+        resp = self.client.post(
+            reverse("pokemon:user-type-create", args=["grass"])
+        )
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        resp = self.client.delete(
+            reverse("pokemon:user-type-destroy", args=["grass"])
+        )
+        self.assertEqual(resp.status_code, HTTP_429_TOO_MANY_REQUESTS)
+
+    @throttle_rates(login="2/min")
+    def test_login(self):
+        self.client.credentials()
+        url = reverse("registration:login")
+        for _ in range(2):
+            resp = self.client.post(url, {"username": "ash", "password": "x"})
+            self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        resp = self.client.post(url, {"username": "ash", "password": "x"})
+        self.assertEqual(resp.status_code, HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(
+            self.client.get(self.url).status_code, HTTP_401_UNAUTHORIZED
+        )
+
+    def test_refill(self):
+        store = InMemoryBucketStore(max_keys=2)
+        now = time()
+
+        def take(key, at):
+            with mock.patch("pokemon.throttling.time", return_value=at):
+                return store.take(key=key, capacity=2, refill_rate=1)
+
+        self.assertEqual(take("a", at=now), (True, 0.0))
+        self.assertEqual(take("a", at=now), (True, 0.0))
+        self.assertEqual(take("a", at=now), (False, 1.0))
+        self.assertEqual(take("a", at=now + 0.5), (False, 0.5))
+        self.assertEqual(take("a", at=now + 1), (True, 0.0))
+        take("b", at=now + 1)
+        take("c", at=now + 1)
+        self.assertEqual(list(store._buckets), ["b", "c"])
+
+
+class UserTypeWriteBehindTests(APITestCase):
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.journal_dir = TemporaryDirectory()
+        self.addCleanup(self.journal_dir.cleanup)
+        self.journal_path = Path(self.journal_dir.name) / "journal.sqlite3"
+        self.enterContext(override_settings(
+            USER_TYPE_WRITE_BEHIND=True,
+            USER_TYPE_WRITE_BEHIND_DURABILITY="journal",
+            USER_TYPE_WRITE_BEHIND_JOURNAL=self.journal_path
+        ))
+        # Flushes are run by the tests, not by a timer thread.
+        self.enterContext(mock.patch("pokemon.writebehind.Timer"))
+        user_type_write_behind.cache_clear()
+        self.addCleanup(user_type_write_behind.cache_clear)
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.user = Token.objects.get(key="testtoken").user
+
+    def user_types(self):
+        return set(self.user.usertype_set.values_list(
+            "type_group__name", flat=True
+        ))
+
+    def test_reads_see_pending_changes(self):
+        resp = self.client.post(
+            reverse("pokemon:user-type-create", args=["grass"])
+        )
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        resp = self.client.post(
+            reverse("pokemon:user-type-create", args=["grass"])
+        )
+        self.assertEqual(resp.status_code, HTTP_304_NOT_MODIFIED)
+        resp = self.client.delete(
+            reverse("pokemon:user-type-destroy", args=["fire"])
+        )
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        resp = self.client.delete(
+            reverse("pokemon:user-type-destroy", args=["fire"])
+        )
+        self.assertEqual(resp.status_code, HTTP_404_NOT_FOUND)
+        self.assertEqual(self.user_types(), {"fire", "water"})
+
+        resp = self.client.get(reverse("registration:user-me"))
+        self.assertEqual(
+            {type_group["name"] for type_group in resp.data["type_groups"]},
+            {"water", "grass"}
+        )
+        resp = self.client.get(reverse("pokemon:of-user-type-list"))
+        self.assertEqual(
+            {name for pokemon in resp.data for name in pokemon["types"]},
+            {"water", "grass"}
+        )
+
+        changes = CatalogChange.objects.count()
+        # One transaction for the batch, whatever its number of changes.
+        with self.assertNumQueries(10):
+            user_type_write_behind().flush()
+        self.assertEqual(self.user_types(), {"water", "grass"})
+        self.assertEqual(CatalogChange.objects.count(), changes + 1)
+        change = CatalogChange.objects.latest("id")
+        self.assertEqual(
+            (change.old_mask, change.new_mask),
+            (type_mask(type_ids=[1, 2]), type_mask(type_ids=[2, 3]))
+        )
+        self.assertEqual(user_type_write_behind().pending(self.user.id), {})
+
+    def test_toggles_coalesce(self):
+        changes = CatalogChange.objects.count()
+        for _ in range(3):
+            self.client.post(
+                reverse("pokemon:user-type-create", args=["grass"])
+            )
+            self.client.delete(
+                reverse("pokemon:user-type-destroy", args=["grass"])
+            )
+        user_type_write_behind().flush()
+        self.assertEqual(self.user_types(), {"fire", "water"})
+        self.assertEqual(CatalogChange.objects.count(), changes)
+
+    def test_changes_survive_a_crash(self):
+        def crash():
+            write_behind = UserTypeWriteBehind(
+                delay=60, batch_size=100,
+                journal=Journal(path=self.journal_path)
+            )
+            write_behind.set(
+                user_id=self.user.id, type_group_id=3, name="grass"
+            )
+            write_behind.set(user_id=self.user.id, type_group_id=1, name=None)
+            os._exit(1)
+
+        process = get_context("fork").Process(target=crash)
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 1)
+        self.assertEqual(self.user_types(), {"fire", "water"})
+
+        # The next process using the write-behind writes the changes of
+        # the dead one.
+        user_type_write_behind()
+        self.assertEqual(self.user_types(), {"water", "grass"})
+        # Lock files of the dead processes are removed.
+        owners = Path(f"{self.journal_path}.owners")
+        self.assertEqual(
+            list(owners.iterdir()),
+            [owners / user_type_write_behind().journal.owner]
+        )
+        self.assertEqual(self.journaled(), 0)
+
+    def test_changes_of_a_dead_process_with_the_same_pid(self):
+        """Process ids are reused (containers): a process with the id of
+        a dead one still writes its changes, instead of discarding them
+        at its first flush."""
+        dead = Journal(path=self.journal_path)
+        dead.append(user_id=self.user.id, type_group_id=3, name="grass")
+        dead.close()
+
+        self.client.delete(reverse("pokemon:user-type-destroy", args=["fire"]))
+        user_type_write_behind().flush()
+        self.assertEqual(self.user_types(), {"water", "grass"})
+        self.assertEqual(self.journaled(), 0)
+
+    def test_changes_of_a_running_process_are_left(self):
+        running = Journal(path=self.journal_path)
+        self.addCleanup(running.close)
+        running.append(user_id=self.user.id, type_group_id=3, name="grass")
+        user_type_write_behind()
+        self.assertEqual(self.user_types(), {"fire", "water"})
+        self.assertEqual(self.journaled(), 1)
+
+    def journaled(self):
+        journal = Journal(path=self.journal_path)
+        try:
+            (count,), = journal.connection.execute(
+                "SELECT COUNT(*) FROM user_type_change"
+            )
+        finally:
+            journal.close()
+        return count
+
+
+@skipUnless(
+    "replica" in settings.DATABASES,
+    "No replica database (main.settings_test declares one)."
+)
+@override_settings(READ_REPLICA="replica")
+class ReplicaRoutingTests(APITestCase):
+    """The test database is the primary. Both have the fixtures, then
+    the replica lags behind: writes only go to the primary."""
+    # Declared by main.settings_test, the settings of ./manage.py test:
+    # other settings skip the tests, and do not set a replica up for them.
+    databases = {"default", "replica"} & set(settings.DATABASES)
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.user = Token.objects.get(key="testtoken").user
+        self.list_url = reverse("pokemon:of-user-type-list")
+        self.me_url = reverse("registration:user-me")
+
+    def listed_types(self):
+        resp = self.client.get(self.list_url)
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        return {name for pokemon in resp.data for name in pokemon["types"]}
+
+    def test_reads_from_replica(self):
+        UserType.objects.using("replica").filter(
+            type_group__name="water"
+        ).delete()
+        # Not a write of the user: the replica differs from the primary.
+        cache.delete(pin_key(user_id=self.user.id))
+        self.assertEqual(self.listed_types(), {"fire"})
+        resp = self.client.get(self.me_url)
+        self.assertEqual(
+            [type_group["name"] for type_group in resp.data["type_groups"]],
+            ["fire"]
+        )
+
+    def test_read_your_writes(self):
+        resp = self.client.post(
+            reverse("pokemon:user-type-create", args=["grass"])
+        )
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        self.assertFalse(UserType.objects.using("replica").filter(
+            type_group__name="grass"
+        ).exists())
+        self.assertEqual(self.listed_types(), {"fire", "water", "grass"})
+        resp = self.client.get(
+            reverse("pokemon:of-user-type-retrieve", args=["bulbasaur"])
+        )
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+
+        # Once the window is over, reads go back to the replica.
+        cache.delete(pin_key(user_id=self.user.id))
+        self.assertEqual(self.listed_types(), {"fire", "water"})
+
+    def test_other_users_read_from_replica(self):
+        other = User.objects.create_user(username="misty", password="staryu")
+        token = Token.objects.create(user=other)
+        UserType.objects.create(user=other, type_group_id=3)
+        self.assertIsNone(cache.get(pin_key(user_id=self.user.id)))
+
+        # Authentication reads the primary: the new token is known.
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        resp = self.client.get(self.me_url)
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.data["type_groups"], [{"name": "grass"}])
+
+        cache.delete(pin_key(user_id=other.id))
+        resp = self.client.get(self.me_url)
+        self.assertEqual(resp.data["type_groups"], [])
+
+
+@skipIf(load_numpy() is None, "numpy is not installed")
+class PokemonTypeAnalyticsTests(APITestCase):
+    fixtures = [
+        "users",
+        "tokens",
+        "typegroups",
+        "usertypes",
+        "pokemons",
+        "pokemontypes"
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION="Token testtoken")
+        self.url = reverse(viewname="pokemon:type-analytics")
+        # charmander is fire and water.
+        PokemonType.objects.create(pokemon_id=2, type_group_id=2)
+
+    def test_statistics(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.data, {
+            "types": ["fire", "water"],
+            "counts": {"fire": 1, "water": 2},
+            "overlap": [[1, 1], [1, 2]],
+            "coverage": {
+                "visible": 2,
+                "total": 3,
+                "ratio": 2 / 3,
+                "exclusive": {"fire": 0, "water": 1},
+                "by_type_count": [1, 1],
+            },
+        })
+
+    def test_total_counts_pokemon_without_types(self):
+        Pokemon.objects.create(number=25, name="pikachu")
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.data["coverage"]["visible"], 2)
+        self.assertEqual(resp.data["coverage"]["total"], 4)
+        self.assertEqual(resp.data["coverage"]["ratio"], 2 / 4)
+
+    def test_matrix_built_once_per_catalog_version(self):
+        self.client.get(self.url)
+        # Token, catalog version and user's types: the matrix is not read
+        # again.
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+        PokemonType.objects.filter(pokemon_id=2, type_group_id=2).delete()
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.data["counts"], {"fire": 1, "water": 1})
+        self.assertEqual(resp.data["coverage"]["by_type_count"], [2, 0])
+
+    def test_no_types(self):
+        UserType.objects.all().delete()
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.data["overlap"], [])
+        self.assertEqual(resp.data["coverage"]["visible"], 0)
+
+
+@skipIf(
+    "django.contrib.admin" not in settings.INSTALLED_APPS,
+    "The admin is not installed (main.settings_api)."
+)
+class AdminChangelistTests(APITestCase):
+    """Changelists of 10 000 rows: the number of queries of a page does
+    not depend on its rows."""
+    fixtures = ["typegroups"]
+
+    @classmethod
+    def setUpTestData(cls):
+        pokemons = Pokemon.objects.bulk_create([
+            Pokemon(number=number, name=f"pokemon-{number}", type_mask=6)
+            for number in range(1, 10_001)
+        ])
+        users = User.objects.bulk_create([
+            User(username=f"trainer-{index:05}") for index in range(5_000)
+        ])
+        PokemonType.objects.bulk_create([
+            PokemonType(pokemon=pokemon, type_group_id=type_group_id)
+            for pokemon in pokemons
+            for type_group_id in [1, 2][:1 + pokemon.number % 2]
+        ])
+        UserType.objects.bulk_create([
+            UserType(user=user, type_group_id=type_group_id)
+            for user in users for type_group_id in [1, 2]
+        ])
+        cls.admin = User.objects.create_superuser(
+            username="oak", password="pallet"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertPageQueries(self, model_name, num, **params):
+        cache.clear()
+        url = reverse(f"admin:pokemon_{model_name}_changelist")
+        # Session, user, count, rows, and the catalog version and type
+        # names (Pokémon) or the type filter (PokemonType, UserType).
+        with self.assertNumQueries(num):
+            resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        return resp.context["cl"]
+
+    def test_changelists(self):
+        pages = [{}, {"p": 50}]
+        filtered = [{"type_group__id__exact": 2}]
+        for model_name, num, params_list in [
+            ("pokemon", 6, pages),
+            ("pokemontype", 5, pages + filtered),
+            ("usertype", 5, pages + filtered),
+        ]:
+            for params in params_list:
+                with self.subTest(model_name=model_name, **params):
+                    changelist = self.assertPageQueries(
+                        model_name=model_name, num=num, **params
+                    )
+                    self.assertEqual(len(changelist.result_list), 100)
+                    self.assertIsNone(changelist.full_result_count)
+
+    def test_searches(self):
+        changelist = self.assertPageQueries("pokemon", num=6, q="pokemon-999")
+        self.assertEqual(
+            sorted(pokemon.number for pokemon in changelist.result_list),
+            [999, *range(9990, 10_000)]
+        )
+        # No rows: no type names to read.
+        changelist = self.assertPageQueries("pokemon", num=4, q="²")
+        self.assertEqual(list(changelist.result_list), [])
+        changelist = self.assertPageQueries("pokemontype", num=5, q="1234")
+        self.assertEqual(
+            [row.pokemon.number for row in changelist.result_list], [1234]
+        )
+        changelist = self.assertPageQueries(
+            "usertype", num=5, q="trainer-0420"
+        )
+        self.assertEqual(
+            {row.user.username for row in changelist.result_list},
+            {f"trainer-{index:05}" for index in range(4200, 4210)}
+        )
+
+    def test_autocomplete(self):
+        with self.assertNumQueries(4):
+            resp = self.client.get(reverse("admin:autocomplete"), {
+                "app_label": "pokemon",
+                "model_name": "pokemontype",
+                "field_name": "pokemon",
+                "term": "pokemon-100"
+            })
+        self.assertEqual(
+            [result["text"] for result in resp.json()["results"]][:2],
+            ["pokemon-100", "pokemon-1000"]
+        )
@@ -0,0 +1,176 @@
+"""Token bucket throttles of the API.
+
+Views name their `throttle_scope` ("read", "write", "login"). The rate
+of a scope, in DEFAULT_THROTTLE_RATES ("600/min"), is the size of its
+buckets and how fast they fill up again: a client can send a burst of
+600 requests, then 10 per second. UserThrottle keeps a bucket per user
+(per IP address for anonymous requests), and a bucket per scope shared
+by every client, whose rate is the "<scope>_global" one. The shared
+bucket is only charged for the requests the user's bucket lets through:
+a client sending too many requests empties its own bucket, not the one
+of everyone.
+
+A bucket is two floats (tokens left, time of the last request) in the
+store of the THROTTLE_STORE setting: a request costs no cache or
+database round trip with the in-memory store, and a single one with the
+Redis store, which processes share."""
+from collections import OrderedDict
+from functools import cache
+from threading import Lock
+from time import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class BucketStore:
+    """Token buckets of the THROTTLE_STORE setting."""
+
+    def take(self, key, capacity, refill_rate):
+        """Take a token from the bucket `key`, holding up to `capacity`
+        tokens and gaining `refill_rate` tokens per second. Returns
+        (allowed, seconds before a token is available)."""
+        raise NotImplementedError
+
+    @staticmethod
+    def refill(tokens, updated_at, capacity, refill_rate, now):
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens >= 1:
+            return True, tokens - 1, 0.0
+        return False, tokens, (1 - tokens) / refill_rate
+
+
+class InMemoryBucketStore(BucketStore):
+    """Buckets of the process, at most `max_keys` of them: the least
+    recently used ones are dropped first, and start full again. Each
+    process throttles on its own, divide the rates by their number."""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._lock = Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, capacity, refill_rate):
+        now = time()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            allowed, tokens, wait = self.refill(
+                tokens=tokens, updated_at=updated_at,
+                capacity=capacity, refill_rate=refill_rate, now=now
+            )
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore(BucketStore):
+    """Buckets shared by the processes, as hashes updated by a script on
+    a server speaking the Redis protocol (Redis, Valkey, KeyDB...). They
+    expire once full again."""
+
+    SCRIPT = """
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+        local capacity = tonumber(ARGV[1])
+        local refill_rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + (now - updated_at) * refill_rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_rate) + 1)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", prefix="throttle:"):
+        if redis is None:
+            raise ImproperlyConfigured(
+                "RedisBucketStore needs the redis package."
+            )
+        self.prefix = prefix
+        self._script = redis.Redis.from_url(url).register_script(self.SCRIPT)
+
+    def take(self, key, capacity, refill_rate):
+        allowed, tokens = self._script(
+            keys=[f"{self.prefix}{key}"],
+            args=[capacity, refill_rate, time()]
+        )
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / refill_rate
+
+
+@cache
+def bucket_store():
+    return import_string(settings.THROTTLE_STORE)(
+        **settings.THROTTLE_STORE_OPTIONS
+    )
+
+
+@cache
+def parse_rate(rate):
+    """(capacity, refill rate per second) of a "<requests>/<period>"
+    rate, the period being s, m, h or d (or sec, min...)."""
+    requests, period = rate.split("/")
+    requests = int(requests)
+    return requests, requests / PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle of the view's throttle_scope: the client's bucket
+    (get_ident_key), then the bucket of every client. Views without a
+    scope, and scopes without a rate, are not throttled."""
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        if scope is None:
+            return True
+
+        for rate_scope, ident in [
+            (scope, self.get_ident_key(request=request)),
+            (f"{scope}_global", "*"),
+        ]:
+            rate = api_settings.DEFAULT_THROTTLE_RATES.get(rate_scope)
+            if rate is None:
+                continue
+            capacity, refill_rate = parse_rate(rate=rate)
+            allowed, self._wait = bucket_store().take(
+                key=f"{rate_scope}:{ident}",
+                capacity=capacity, refill_rate=refill_rate
+            )
+            if not allowed:
+                return False
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class UserThrottle(TokenBucketThrottle):
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
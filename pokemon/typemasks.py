@@ -0,0 +1,86 @@
+# A Pokemon's types are denormalized into Pokemon.type_mask, one bit per
+# TypeGroup id. The column is a signed 64 bits integer on every backend,
+# which leaves room for TypeGroup ids up to 62 (PokeAPI has about 20):
+# ids are kept dense for that, a new TypeGroup taking the lowest free one
+# (see free_type_id) rather than the next of the database sequence.
+MAX_TYPE_ID = 62
+
+
+def type_mask(type_ids):
+    mask = 0
+    for type_id in type_ids:
+        if not 0 <= type_id <= MAX_TYPE_ID:
+            raise ValueError(
+                f"TypeGroup id {type_id} does not fit in a type mask"
+            )
+        mask |= 1 << type_id
+    return mask
+
+
+def type_ids(mask):
+    ids = []
+    while mask:
+        low_bit = mask & -mask
+        ids.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+    return ids
+
+
+def free_type_id(using="default"):
+    """Lowest TypeGroup id not taken, the ids of deleted TypeGroups
+    being given again."""
+    from pokemon.models import TypeGroup
+
+    taken = set(TypeGroup.objects.using(using).values_list("id", flat=True))
+    for type_id in range(1, MAX_TYPE_ID + 1):
+        if type_id not in taken:
+            return type_id
+    raise ValueError(
+        f"The {MAX_TYPE_ID} TypeGroup ids fitting in a type mask are taken"
+    )
+
+
+def refresh_type_masks(pokemon_ids=None):
+    """Recompute type_mask from PokemonType, for all Pokémon or only
+    for `pokemon_ids`. Returns the number of Pokémon whose mask changed."""
+    from django.db import transaction
+
+    from pokemon.cache import bump_catalog_version
+    from pokemon.changes import log_pokemon_changes
+    from pokemon.models import Pokemon, PokemonType
+
+    pokemons = Pokemon.objects.all()
+    links = PokemonType.objects.all()
+    if pokemon_ids is not None:
+        pokemons = pokemons.filter(pk__in=pokemon_ids)
+        links = links.filter(pokemon_id__in=pokemon_ids)
+
+    # The changes are logged in the transaction of the new catalog
+    # version (see PokemonOfUserTypeListAPIView.list_since).
+    with transaction.atomic():
+        masks = {}
+        for pokemon_id, type_group_id in links.values_list(
+            "pokemon_id", "type_group_id"
+        ):
+            masks[pokemon_id] = masks.get(pokemon_id, 0) | type_mask(
+                type_ids=[type_group_id]
+            )
+
+        stale = [
+            pokemon
+            for pokemon in pokemons.only("id", "number", "type_mask")
+            if pokemon.type_mask != masks.get(pokemon.id, 0)
+        ]
+        changes = []
+        for pokemon in stale:
+            changes.append(
+                (pokemon.number, pokemon.type_mask, masks.get(pokemon.id, 0))
+            )
+            pokemon.type_mask = masks.get(pokemon.id, 0)
+        Pokemon.objects.bulk_update(
+            stale, fields=["type_mask"], batch_size=500
+        )
+        log_pokemon_changes(changes=changes)
+        if stale:
+            bump_catalog_version()
+    return len(stale)
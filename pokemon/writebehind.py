@@ -0,0 +1,347 @@
+"""Write-behind of the users' types (USER_TYPE_WRITE_BEHIND setting).
+
+POST /api/group/<type>/add/ and DELETE /api/group/<type>/remove/ record
+the change in a per-user overlay and answer at once: the reads of the
+user (user_type_context) see it right away. Changes are written to
+UserType every USER_TYPE_WRITE_BEHIND_DELAY seconds, in transactions of
+USER_TYPE_WRITE_BEHIND_BATCH_SIZE changes: a burst of toggles costs a
+few transactions, and a type toggled back and forth writes nothing.
+
+The overlay belongs to the process: with several workers, a user's
+requests should reach the same one for their reads to see their writes
+before the flush.
+
+With the "memory" durability, changes not yet written are lost if the
+process dies. With "journal", each change is first appended to a SQLite
+journal (USER_TYPE_WRITE_BEHIND_JOURNAL) which survives the process:
+the changes of dead processes are written by the next process using the
+write-behind."""
+import atexit
+import fcntl
+import os
+import sqlite3
+from collections import defaultdict
+from functools import cache, reduce
+from operator import or_
+from threading import Lock, Timer
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Q
+
+from main.replicas import pin_to_primary
+from pokemon.changes import log_user_types
+from pokemon.models import UserType
+from pokemon.signals import muted
+from pokemon.typemasks import type_mask
+
+
+TIMEOUT = 30
+
+
+class Journal:
+    """Changes not yet written to UserType, by owner: a token of the
+    process which appended them. Each owner holds a lock (flock) on a
+    file named after its token, in the `<journal>.owners` directory, for
+    as long as it runs. Unlike a process id, a token is never given to
+    another process: the changes of a dead process cannot be taken for
+    the ones of a new process reusing its id."""
+
+    def __init__(self, path):
+        self.path = path
+        self.owners = path.with_name(f"{path.name}.owners")
+        self.owner = None
+        self._pid = None
+        self._lock = None
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._pid != os.getpid():
+            # New, or forked: the token, lock and connection of the
+            # parent process are not this one's.
+            if self._lock is not None:
+                self._lock.close()
+            self._connection = None
+            self.owners.mkdir(parents=True, exist_ok=True)
+            self.owner = uuid4().hex
+            self._lock = try_lock(path=self.owners / self.owner)
+            self._pid = os.getpid()
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self.path, timeout=TIMEOUT, check_same_thread=False,
+                isolation_level=None
+            )
+            # WAL with synchronous=NORMAL: an appended change survives
+            # the process, not a power loss.
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS user_type_change ("
+                " id INTEGER PRIMARY KEY, owner TEXT NOT NULL,"
+                " user_id INTEGER NOT NULL, type_group_id INTEGER NOT NULL,"
+                " name TEXT)"
+            )
+        return self._connection
+
+    def append(self, user_id, type_group_id, name):
+        connection = self.connection
+        return connection.execute(
+            "INSERT INTO user_type_change"
+            " (owner, user_id, type_group_id, name) VALUES (?, ?, ?, ?)",
+            (self.owner, user_id, type_group_id, name)
+        ).lastrowid
+
+    def discard(self, up_to, owner=None):
+        """Forget the changes of `owner` (this process by default) up to
+        the id `up_to`, once written."""
+        connection = self.connection
+        connection.execute(
+            "DELETE FROM user_type_change WHERE owner = ? AND id <= ?",
+            (self.owner if owner is None else owner, up_to)
+        )
+
+    def recover(self, write):
+        """Call `write` with the {(user_id, type_group_id): name} changes
+        of each owner which is not running anymore, then forget them.
+        The lock of a dead owner is taken while its changes are written,
+        so that processes recovering at the same time skip it."""
+        connection = self.connection
+        owners = {
+            owner for owner, in connection.execute(
+                "SELECT DISTINCT owner FROM user_type_change"
+            )
+        } | {path.name for path in self.owners.iterdir()}
+        owners.discard(self.owner)
+        for owner in sorted(owners):
+            lock = try_lock(path=self.owners / owner)
+            if lock is None:
+                continue
+            try:
+                changes, last_id = {}, 0
+                for id, user_id, type_group_id, name in connection.execute(
+                    "SELECT id, user_id, type_group_id, name"
+                    " FROM user_type_change WHERE owner = ? ORDER BY id",
+                    (owner,)
+                ):
+                    changes[(user_id, type_group_id)] = name
+                    last_id = id
+                if changes:
+                    write(changes)
+                    self.discard(up_to=last_id, owner=owner)
+                (self.owners / owner).unlink(missing_ok=True)
+            finally:
+                lock.close()
+
+    def close(self):
+        """Close the connection and release the lock: the changes left
+        are recovered by the next process, as if this one had died."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+        self._pid = None
+
+
+def try_lock(path):
+    """The file `path` (created if needed) with an exclusive flock, held
+    until it is closed. None if another process holds it."""
+    file = open(path, "a")
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        file.close()
+        return None
+    return file
+
+
+def write_user_types(changes, batch_size):
+    """Write {(user_id, type_group_id): type name if added, else None}
+    to UserType, in transactions of at most `batch_size` changes, and log
+    each user's new types in the change log."""
+    changes = list(changes.items())
+    for start in range(0, len(changes), batch_size):
+        _write_batch(changes=dict(changes[start:start + batch_size]))
+
+
+def _write_batch(changes):
+    user_ids = {user_id for user_id, _ in changes}
+    with transaction.atomic(), muted():
+        # Changes of users deleted meanwhile are dropped.
+        user_ids = set(get_user_model().objects.filter(
+            id__in=user_ids
+        ).values_list("id", flat=True))
+        old_types = defaultdict(set)
+        for user_id, type_group_id in UserType.objects.filter(
+            user_id__in=user_ids
+        ).values_list("user_id", "type_group_id"):
+            old_types[user_id].add(type_group_id)
+        new_types = {
+            user_id: set(old_types[user_id]) for user_id in user_ids
+        }
+
+        added, removed = [], []
+        for (user_id, type_group_id), name in changes.items():
+            if user_id not in user_ids:
+                continue
+            present = type_group_id in old_types[user_id]
+            if name is not None and not present:
+                added.append(UserType(
+                    user_id=user_id, type_group_id=type_group_id
+                ))
+                new_types[user_id].add(type_group_id)
+            elif name is None and present:
+                removed.append(Q(user_id=user_id, type_group_id=type_group_id))
+                new_types[user_id].discard(type_group_id)
+
+        UserType.objects.bulk_create(added)
+        if removed:
+            UserType.objects.filter(reduce(or_, removed)).delete()
+        for user_id in sorted(user_ids):
+            if new_types[user_id] != old_types[user_id]:
+                pin_to_primary(user_id=user_id)
+                log_user_types(
+                    user_id=user_id,
+                    old_mask=type_mask(type_ids=old_types[user_id]),
+                    new_mask=type_mask(type_ids=new_types[user_id])
+                )
+
+
+class UserTypeWriteBehind:
+    def __init__(self, delay, batch_size, journal=None):
+        self.delay = delay
+        self.batch_size = batch_size
+        self.journal = journal
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        # {user_id: {type_group_id: type name if added, else None}}
+        self._pending = {}
+        self._size = 0
+        self._journal_id = 0
+        self._timer = None
+
+    def set(self, user_id, type_group_id, name):
+        """Add (`name` being the type's name) or remove (None) a type of
+        a user."""
+        with self._lock:
+            if self.journal is not None:
+                self._journal_id = self.journal.append(
+                    user_id=user_id, type_group_id=type_group_id, name=name
+                )
+            user_pending = self._pending.setdefault(user_id, {})
+            self._size += type_group_id not in user_pending
+            user_pending[type_group_id] = name
+            if self._size >= self.batch_size:
+                self._schedule(delay=0)
+            elif self._timer is None:
+                self._schedule(delay=self.delay)
+
+    def pending(self, user_id):
+        """{type_group_id: type name if added, else None} of the changes
+        of `user_id` not written yet."""
+        with self._lock:
+            return dict(self._pending.get(user_id, {}))
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = Timer(interval=delay, function=self._flush_later)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        """Write the pending changes. Until they are committed, reads
+        still see them in the overlay, and a failed write keeps them for
+        the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                changes = {
+                    (user_id, type_group_id): name
+                    for user_id, user_pending in self._pending.items()
+                    for type_group_id, name in user_pending.items()
+                }
+                journal_id = self._journal_id
+            if not changes:
+                return
+            try:
+                write_user_types(changes=changes, batch_size=self.batch_size)
+            except Exception:
+                with self._lock:
+                    if self._timer is None:
+                        self._schedule(delay=self.delay)
+                raise
+
+            with self._lock:
+                # Changes set again during the write stay pending.
+                for (user_id, type_group_id), name in changes.items():
+                    user_pending = self._pending[user_id]
+                    if user_pending.get(type_group_id, name) == name:
+                        del user_pending[type_group_id]
+                        self._size -= 1
+                for user_id in {user_id for user_id, _ in changes}:
+                    if not self._pending[user_id]:
+                        del self._pending[user_id]
+                if self.journal is not None:
+                    # Changes set during the write were appended after
+                    # journal_id: they stay in the journal.
+                    self.journal.discard(up_to=journal_id)
+
+    def recover(self):
+        """Write the changes journaled by processes which died before
+        writing them."""
+        if self.journal is None:
+            return
+        self.journal.recover(write=lambda changes: write_user_types(
+            changes=changes, batch_size=self.batch_size
+        ))
+
+
+@cache
+def user_type_write_behind():
+    journal = None
+    if settings.USER_TYPE_WRITE_BEHIND_DURABILITY == "journal":
+        journal = Journal(path=settings.USER_TYPE_WRITE_BEHIND_JOURNAL)
+    write_behind = UserTypeWriteBehind(
+        delay=settings.USER_TYPE_WRITE_BEHIND_DELAY,
+        batch_size=settings.USER_TYPE_WRITE_BEHIND_BATCH_SIZE,
+        journal=journal
+    )
+    write_behind.recover()
+    atexit.register(write_behind.flush)
+    return write_behind
+
+
+def has_pending_user_types(user_id):
+    return settings.USER_TYPE_WRITE_BEHIND and bool(
+        user_type_write_behind().pending(user_id=user_id)
+    )
+
+
+def with_pending_user_types(user_id, user_type_names):
+    """{type_group_id: name} of the user's types, with their changes not
+    written yet."""
+    if not settings.USER_TYPE_WRITE_BEHIND:
+        return user_type_names
+    pending = user_type_write_behind().pending(user_id=user_id)
+    if not pending:
+        return user_type_names
+    user_type_names = dict(user_type_names)
+    for type_group_id, name in pending.items():
+        if name is None:
+            user_type_names.pop(type_group_id, None)
+        else:
+            user_type_names[type_group_id] = name
+    return user_type_names
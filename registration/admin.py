@@ -0,0 +1,7 @@
+from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth import get_user_model
+
+
+# Searched by the autocompletion of UserType.user (see pokemon.admin).
+admin.site.register(get_user_model(), UserAdmin)
@@ -1,12 +1,41 @@
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import permission_classes
 from rest_framework.response import Response
 from rest_framework.status import HTTP_200_OK
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
+from pokemon.throttling import UserThrottle
 from registration.serializers import UserMeSerializer
 
 
+class LoginAPIView(ObtainAuthToken):
+    """
+    Endpoint: POST /api/login/
+
+    Request Body: {
+        "username": "ash",
+        "password": "pikachu"
+    }
+
+    Responses:
+        200 OK: {
+            "token": "9944b09199c62bcf9418ad846dd0e4bbdfc6ee4b"
+        } The user's authentication token.
+
+        400 Bad Request: {
+            "non_field_errors": ["Unable to log in with provided credentials."]
+        } Wrong username or password.
+
+        429 Too Many Requests: {
+            "detail": "Request was throttled. Expected available in 6 seconds."
+        } Too many login attempts from the client's address, or from all
+        clients, recently.
+    """
+    throttle_classes = [UserThrottle]
+    throttle_scope = "login"
+
+
 @permission_classes(permission_classes=[IsAuthenticated])
 class UserMeAPIView(APIView):
     """
@@ -31,7 +60,14 @@ class UserMeAPIView(APIView):
 
         401 Unauthorized:
             Missing or invalid authentication token.
+
+        429 Too Many Requests: {
+            "detail": "Request was throttled. Expected available in 2 seconds."
+        } Too many requests of the user, or of all users, recently.
     """
+    replica_reads = True
+    throttle_scope = "read"
+
     def get(self, request) -> Response:
         serializer = UserMeSerializer(request.user)
         return Response(serializer.data, status=HTTP_200_OK)
@@ -6,6 +6,7 @@ from rest_framework.serializers import (
 )
 
 from pokemon.models import TypeGroup
+from pokemon.writebehind import with_pending_user_types
 
 
 User = get_user_model()
@@ -24,6 +25,15 @@ class UserMeSerializer(Serializer):
     def get_type_groups(self, user):
         user_types_qs = user.usertype_set.select_related("type_group")
         user_type_groups = [ut.type_group for ut in user_types_qs]
+        pending = with_pending_user_types(
+            user_id=user.id,
+            user_type_names={tg.id: tg.name for tg in user_type_groups}
+        )
+        if pending.keys() != {tg.id for tg in user_type_groups}:
+            user_type_groups = [
+                TypeGroup(id=type_group_id, name=name)
+                for type_group_id, name in pending.items()
+            ]
         serializer = self.TypeGroupSerializer(user_type_groups, many=True)
         return serializer.data
 